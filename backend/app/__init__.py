@@ -2,7 +2,7 @@
 """Flask application factory (updated with batch support and acknowledgments)"""
 from flask import Flask  # type: ignore
 from app.config import get_config
-from app.extensions import cors, redis_client, celery
+from app.extensions import cors, redis_client, redis_binary_client, celery
 from app.middleware.error_handler import register_error_handlers
 from app.middleware.request_logger import register_request_logger
 from app.utils.logging_config import setup_logging
@@ -40,6 +40,7 @@ def create_app(config_name=None):
 def init_extensions(app):
     """Initialize Flask extensions"""
     cors.init_app(app, origins=app.config['CORS_ORIGINS'])
+    redis_binary_client.init_app(app, decode_responses=False)
     redis_client.init_app(app, decode_responses=True)
     
     # Initialize Celery
@@ -1,9 +1,10 @@
 # app/api/batch_calculations.py
 """Batch calculation endpoints"""
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from app.tasks.batch_calculations import batch_calculation_task
-from app.utils.validators import validate_batch_params
+from app.utils.validators import validate_batch_params, validate_layout_params
 from app.services.redis_service import RedisService
+from app.services.series import plot_params, render_plots
 
 bp = Blueprint('batch_calculations', __name__)
 redis_service = RedisService()
@@ -49,6 +50,15 @@ def get_batch_status(task_id):
     """Get current status of a batch task"""
     from app.extensions import celery
     
+    # The batch state hash holds everything a status check needs
+    state = redis_service.get_batch_state(task_id)
+    if state.get('status') == 'completed':
+        return jsonify({
+            'state': 'SUCCESS',
+            'batch_progress': 100,
+            'batch_summary': state.get('batch_summary', {})
+        })
+    
     task = celery.AsyncResult(task_id)
     
     if task.state == 'PENDING':
@@ -66,47 +76,77 @@ def get_batch_status(task_id):
         }
     else:
         # Get progress from Redis
-        metadata = redis_service.get_task_metadata(task_id)
         progress = redis_service.get_task_progress(task_id)
         
         response = {'state': 'PROCESSING'}
         
-        if metadata:
-            completed_tests = metadata.get('completed_tests', 0)
-            total_tests = metadata.get('total_tests', 1)
+        if state:
+            completed_tests = state.get('completed_tests', 0)
+            total_tests = state.get('total_tests') or 1
             response.update({
                 'batch_progress': int(completed_tests / total_tests * 100),
                 'completed_tests': completed_tests,
-                'total_tests': total_tests,
-                'current_test_index': metadata.get("current_test_index", 0)
+                'total_tests': total_tests
             })
+            if 'current_test_index' in state:
+                response['current_test_index'] = state['current_test_index']
         
-        if progress:
+        if state.get('parallel'):
+            # Tests run at once, each with its own progress; the completed
+            # count above comes from the batch hash
+            tests_progress = redis_service.get_batch_tests_progress(task_id,
+                                                                    state.get('total_tests', 0))
+            response['running_tests'] = [{
+                'test_index': test_index,
+                'test_progress': test_progress.get('test_progress', 0),
+                'current_iteration': test_progress.get('current_iteration', 0),
+                'total_iterations': test_progress.get('total_iterations', 0)
+            } for test_index, test_progress in tests_progress.items()
+                if test_progress.get('test_progress', 0) < 100]
+        elif progress:
             response.update({
                 'current_test_progress': progress.get('test_progress', 0),
                 'current_iteration': progress.get('current_iteration', 0),
                 'total_iterations': progress.get('total_iterations', 0)
             })
-        print(jsonify(response))
     
     return jsonify(response)
 
 @bp.route('/batch-results/<task_id>', methods=['GET'])
 def get_batch_results(task_id):
     """Get results for completed tests in a batch"""
+    errors = validate_layout_params(request.args)
+    if errors:
+        return jsonify({'errors': errors}), 400
+    
+    params = plot_params(request.args, current_app.config['MAX_PLOT_POINTS'])
+    
+    def render(test_results):
+        """Render each test's plots in the requested layout and resolution"""
+        return [{
+            **test_result,
+            'complete_plots': render_plots(test_result.get('complete_plots', {}), **params)
+        } for test_result in test_results]
+    
     results = redis_service.get_task_results(task_id)
     if not results:
-        metadata = redis_service.get_task_metadata(task_id)
-        if metadata and 'test_results' in metadata:
-            return jsonify({
-                'test_results': metadata['test_results'],
-                'completed_tests': metadata.get('completed_tests', 0),
-                'total_tests': metadata.get('total_tests', 0)
-            })
-        return jsonify({'error': 'Results not found'}), 404
+        # Still running: read the tests completed so far from their own keys
+        state = redis_service.get_batch_state(task_id)
+        if not state:
+            return jsonify({'error': 'Results not found'}), 404
+        
+        partial = redis_service.attach_series_plots(task_id, {
+            'test_results': redis_service.get_batch_test_results(task_id,
+                                                                 state.get('total_tests', 0))
+        })
+        return jsonify({
+            'test_results': render(partial['test_results']),
+            'completed_tests': state.get('completed_tests', 0),
+            'total_tests': state.get('total_tests', 0)
+        })
     
     return jsonify({
-        'test_results': results.get('test_results', []),
+        'test_results': render(results.get('test_results', [])),
         'batch_summary': results.get('batch_summary', {}),
         'completed_tests': results.get('completed_tests', 0),
         'total_tests': results.get('total_tests', 0)
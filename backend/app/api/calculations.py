@@ -2,7 +2,7 @@
 """Calculation endpoints"""
 from flask import Blueprint, jsonify, request
 from app.tasks.calculations import long_calculation_task
-from app.utils.validators import validate_calculation_params
+from app.utils.validators import validate_calculation_params, validate_task_id
 from app.services.redis_service import RedisService
 
 bp = Blueprint('calculations', __name__)
@@ -74,7 +74,33 @@ def cancel_task(task_id):
     """Cancel a running task"""
     from app.extensions import celery
     
-    celery.control.revoke(task_id, terminate=True)
+    # Revoke stops queued tasks; running ones are notified over pub/sub
+    celery.control.revoke(task_id)
     redis_service.cleanup_task(task_id)
+    redis_service.mark_task_cancelled(task_id)
     
-    return jsonify({'message': f'Task {task_id} cancelled'})
\ No newline at end of file
+    return jsonify({'message': f'Task {task_id} cancelled'})
+
+@bp.route('/cancel', methods=['POST'])
+def cancel_tasks():
+    """Cancel several tasks (e.g. a whole batch) at once"""
+    from app.extensions import celery
+    
+    data = request.json
+    task_ids = data.get('task_ids') if data else None
+    if not isinstance(task_ids, list) or not task_ids:
+        return jsonify({'errors': ['task_ids must be a non-empty list']}), 400
+    
+    invalid = [task_id for task_id in task_ids if not validate_task_id(task_id)]
+    if invalid:
+        return jsonify({'errors': [f'Invalid task ID: {task_id}' for task_id in invalid]}), 400
+    
+    celery.control.revoke(task_ids)
+    for task_id in task_ids:
+        redis_service.cleanup_task(task_id)
+    redis_service.mark_tasks_cancelled(task_ids)
+    
+    return jsonify({
+        'message': f'Cancelled {len(task_ids)} tasks',
+        'task_ids': task_ids
+    })
\ No newline at end of file
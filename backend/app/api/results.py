@@ -1,11 +1,20 @@
 # app/api/results.py 
 """Results download endpoints"""
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from app.services.redis_service import RedisService
-from app.utils.compression import compress_response
-from app.utils.validators import validate_task_id
-import csv
-import io
+from app.utils.compression import (
+    compress, compress_response, compress_stream, encoded_response, negotiate_encoding
+)
+from app.utils.validators import validate_task_id, validate_layout_params, validate_range_params
+from app.services.export import (
+    TABLE_FORMATS, encode_table, plot_csv_rows, plot_table, stream_csv, table_format_available
+)
+from app.services.series import (
+    SERIES_FIELDS, apply_layout, downsample_plots, downsample_series, plot_params, plots_etag,
+    plots_variant, render_plots, select_level, slice_range, slice_series, series_length
+)
+import json
+import math
 
 bp = Blueprint('results', __name__)
 redis_service = RedisService()
@@ -20,60 +29,242 @@ def download_plot_data(task_id):
     
     format_type = request.args.get('format', 'json')
     
-    # Get results from Redis
-    results = redis_service.get_task_results(task_id)
-    if not results:
-        return jsonify({'error': 'Results not found'}), 404
+    errors = validate_layout_params(request.args)
+    if request.args.get('compression') not in (None, 'gzip'):
+        errors.append('compression must be gzip')
+    if errors:
+        return jsonify({'errors': errors}), 400
+    
+    # Downloads are full resolution unless the client asks for max_points
+    params = plot_params(request.args)
     
     if format_type == 'csv':
-        # Convert to CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
+        # Stream rows as the series are read, compressed on the fly: as a
+        # .gz file if asked, otherwise in the negotiated Content-Encoding
+        scopes = _export_scopes(task_id)
+        if scopes is None:
+            return jsonify({'error': 'Results not found'}), 404
         
-        # Write convergence data
-        writer.writerow(['=== Convergence Data ==='])
-        writer.writerow(['Iteration', 'Loss', 'Validation Loss'])
-        for row in results.get('complete_plots', {}).get('convergence', []):
-            writer.writerow([row['x'], row['loss'], row['val_loss']])
+        rows = (row for title, test_index, inline_plots in scopes
+                for row in plot_csv_rows(_series_reader(task_id, test_index, inline_plots, params),
+                                         title))
+        body = stream_csv(rows)
+        filename = f'plot_data_{task_id}.csv'
         
-        writer.writerow([])  # Empty row separator
+        if request.args.get('compression') == 'gzip':
+            response = Response(stream_with_context(compress_stream(body, 'gzip')),
+                                mimetype='application/gzip')
+            filename += '.gz'
+        else:
+            encoding = negotiate_encoding(request.accept_encodings)
+            if encoding:
+                body = compress_stream(body, encoding)
+            response = encoded_response(stream_with_context(body), encoding, 'text/csv')
+        
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        return response
+    
+    elif format_type == 'json':
+        encoding = negotiate_encoding(request.accept_encodings)
         
-        # Write accuracy data
-        writer.writerow(['=== Accuracy Metrics ==='])
-        writer.writerow(['Iteration', 'Accuracy', 'Precision', 'Recall'])
-        for row in results.get('complete_plots', {}).get('accuracy', []):
-            writer.writerow([
-                row['x'], 
-                row['accuracy'], 
-                row['precision'], 
-                row['recall']
-            ])
+        completed = _completed_plots_body(task_id, params, encoding)
+        if completed:
+            return encoded_response(completed[1], completed[0], 'application/json')
         
-        writer.writerow([])
+        # Still running: render the series written so far, uncached
+        results = redis_service.get_partial_results(task_id)
+        if not results:
+            return jsonify({'error': 'Results not found'}), 404
+        return compress_response(render_plots(results['complete_plots'], **params),
+                                 encoding=encoding)
+    
+    elif format_type in TABLE_FORMATS:
+        if not table_format_available(format_type):
+            return jsonify({'error': f'{format_type} export requires pyarrow'}), 400
         
-        # Write performance data
-        writer.writerow(['=== Performance Metrics ==='])
-        writer.writerow(['Time', 'Throughput', 'Memory', 'CPU'])
-        for row in results.get('complete_plots', {}).get('performance', []):
-            writer.writerow([
-                row['time'], 
-                row['throughput'], 
-                row['memory'], 
-                row['cpu']
-            ])
+        scopes = _export_scopes(task_id)
+        if scopes is None:
+            return jsonify({'error': 'Results not found'}), 404
         
-        # Create response
-        response = Response(output.getvalue(), mimetype='text/csv')
-        response.headers['Content-Disposition'] = \
-            f'attachment; filename=plot_data_{task_id}.csv'
-        return response
+        return _table_response(plot_table(_table_runs(task_id, scopes, params)),
+                               format_type, f'plot_data_{task_id}')
     
-    elif format_type == 'json':
-        # Return JSON (compressed if large)
-        return compress_response(results.get('complete_plots', {}))
+    else:
+        return jsonify({'error': f'Unsupported format: {format_type}'}), 400
+
+@bp.route('/results/<task_id>/plots', methods=['GET'])
+def get_result_plots(task_id):
+    """Complete plots of a finished run, as referenced by its completion event
+
+    ``test_index`` selects one test of a batch. Conditional requests are
+    answered from the content hash stored with the results, without reading
+    the plots; the body comes from the compressed response cache and can be
+    fetched in byte ranges.
+    """
     
+    # Validate task ID
+    if not validate_task_id(task_id):
+        return jsonify({'error': 'Invalid task ID'}), 400
+    
+    errors = validate_layout_params(request.args) + validate_range_params(request.args)
+    if errors:
+        return jsonify({'errors': errors}), 400
+    
+    # Downsampled like the other plot endpoints unless the client asks
+    params = plot_params(request.args, current_app.config['MAX_PLOT_POINTS'])
+    test_index = request.args.get('test_index', type=int)
+    
+    if test_index is None:
+        results = redis_service.get_task_results(task_id, with_series=False)
+    else:
+        results = redis_service.get_batch_test_result(task_id, test_index)
+    if results is None:
+        return jsonify({'error': 'Results not found'}), 404
+    
+    etag = plots_etag(results['content_hash'], params) if results.get('content_hash') else None
+    length = None
+    if etag and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
     else:
+        encoding = negotiate_encoding(request.accept_encodings)
+        completed = _completed_plots_body(task_id, params, encoding, test_index)
+        if completed is None:
+            return jsonify({'error': 'Results not found'}), 404
+        response = encoded_response(completed[1], completed[0], 'application/json')
+        response.accept_ranges = 'bytes'
+        length = len(completed[1])
+    
+    if etag:
+        response.set_etag(etag, weak=True)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['RESULT_EXPIRY_SECONDS']
+    if response.status_code == 304:
+        return response
+    return response.make_conditional(request, accept_ranges=True, complete_length=length)
+
+@bp.route('/plots/download', methods=['GET'])
+def download_multi_task_plot_data():
+    """Download the plots of several tasks as one table
+
+    ``tasks`` is a comma-separated list of task ids; each task (or batch
+    test) contributes rows tagged with its task id and test index.
+    """
+    format_type = request.args.get('format', 'arrow')
+    if format_type not in TABLE_FORMATS:
         return jsonify({'error': f'Unsupported format: {format_type}'}), 400
+    if not table_format_available(format_type):
+        return jsonify({'error': f'{format_type} export requires pyarrow'}), 400
+    
+    task_ids = [task_id for task_id in request.args.get('tasks', '').split(',') if task_id]
+    errors = validate_layout_params(request.args)
+    if not task_ids:
+        errors.append('tasks is required')
+    elif len(task_ids) > current_app.config['MAX_EXPORT_TASKS']:
+        errors.append(f"At most {current_app.config['MAX_EXPORT_TASKS']} tasks "
+                      "can be exported at once")
+    elif not all(validate_task_id(task_id) for task_id in task_ids):
+        errors.append('Invalid task ID')
+    if errors:
+        return jsonify({'errors': errors}), 400
+    
+    params = plot_params(request.args)
+    
+    scopes = {task_id: _export_scopes(task_id) for task_id in task_ids}
+    missing = [task_id for task_id, task_scopes in scopes.items() if task_scopes is None]
+    if missing:
+        return jsonify({'error': 'Results not found', 'task_ids': missing}), 404
+    
+    runs = (run for task_id, task_scopes in scopes.items()
+            for run in _table_runs(task_id, task_scopes, params))
+    return _table_response(plot_table(runs), format_type, 'plot_data')
+
+def _export_scopes(task_id):
+    """``(title, test_index, inline_plots)`` for each run an export covers
+
+    Batches get one scope per test (completed tests only while running);
+    plain tasks a single untitled scope. Series aren't read here. Returns
+    None if the task has no results.
+    """
+    results = redis_service.get_task_results(task_id, with_series=False)
+    if results is None:
+        state = redis_service.get_batch_state(task_id)
+        if state:
+            results = {'test_results': redis_service.get_batch_test_results(
+                task_id, state.get('total_tests', 0))}
+        elif any(redis_service.get_series_length(task_id, name) for name in SERIES_FIELDS):
+            results = {}  # Still running
+        else:
+            return None
+    
+    if 'test_results' not in results:
+        return [(None, None, results.get('complete_plots', {}))]
+    
+    return [(f"Test {result.get('test_index', 0) + 1}: {result.get('test_name', '')}",
+             result.get('test_index'), result.get('complete_plots', {}))
+            for result in results['test_results']]
+
+def _completed_plots_body(task_id, params, encoding, test_index=None):
+    """``(encoding, body)`` of a completed run's plots rendered with ``params``
+
+    Completed results never change, so each rendering is cached: a repeat
+    request costs one MGET. Small bodies are cached (and sent)
+    uncompressed. Returns None if the run hasn't completed.
+    """
+    variant = plots_variant(params, test_index)
+    cached = redis_service.get_cached_response(task_id, variant, encoding)
+    if cached:
+        return cached
+    
+    if test_index is None:
+        results = redis_service.get_task_results(task_id)
+    else:
+        results = redis_service.get_batch_test_result(task_id, test_index)
+        if results is not None:
+            redis_service.attach_series_plots(task_id, {'test_results': [results]})
+    if results is None:
+        return None
+    
+    body = json.dumps(render_plots(results.get('complete_plots', {}), **params)).encode()
+    if len(body) <= current_app.config.get('COMPRESSION_THRESHOLD', 50000):
+        encoding = None
+    elif encoding:
+        body = compress(body, encoding)
+    redis_service.cache_response(task_id, variant, encoding, body)
+    return encoding, body
+
+def _table_runs(task_id, scopes, params):
+    """``plot_table`` runs for a task's export scopes, with their series read"""
+    test_indexes = [test_index for _, test_index, _ in scopes]
+    series_plots = redis_service.get_series_plots(task_id, test_indexes)
+    for (_, test_index, inline_plots), plots in zip(scopes, series_plots):
+        complete_plots = downsample_plots({**plots, **inline_plots},
+                                          params['max_points'], params['downsample'])
+        yield task_id, -1 if test_index is None else test_index, complete_plots
+
+def _table_response(table, format_type, filename):
+    """Serve a plot table as a binary attachment"""
+    mimetype, extension, _ = TABLE_FORMATS[format_type]
+    response = Response(encode_table(table, format_type), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.{extension}'
+    return response
+
+def _series_reader(task_id, test_index, inline_plots, params):
+    """Read function for ``plot_csv_rows`` over one run's series
+
+    Series are streamed from Redis in chunks, unless they have to be loaded
+    whole to be downsampled or were stored inline with legacy results.
+    """
+    def read(name):
+        if name in inline_plots:
+            yield downsample_series(name, inline_plots[name],
+                                    params['max_points'], params['downsample'])
+        elif params['max_points']:
+            series = redis_service.get_series(task_id, name, test_index=test_index)
+            yield downsample_series(name, series, params['max_points'], params['downsample'])
+        else:
+            yield from redis_service.iter_series(task_id, name, test_index)
+    return read
 
 @bp.route('/results/<task_id>/page', methods=['GET'])
 def get_results_page(task_id):
@@ -86,25 +277,95 @@ def get_results_page(task_id):
     page = int(request.args.get('page', 1))
     per_page = int(request.args.get('per_page', 10))
     
-    # Get results
-    results = redis_service.get_task_results(task_id)
-    if not results:
-        return jsonify({'error': 'Results not found'}), 404
-    
-    # Get complete plot data
-    all_data = results.get('complete_plots', {})
+    errors = validate_layout_params(request.args)
+    if errors:
+        return jsonify({'errors': errors}), 400
     
-    # Paginate convergence data as example
-    convergence_data = all_data.get('convergence', [])
     start = (page - 1) * per_page
     end = start + per_page
-    page_data = convergence_data[start:end]
+    
+    # Paginate convergence data as example, reading only the requested
+    # range of the series (also available while the task is running)
+    total = redis_service.get_series_length(task_id, 'convergence')
+    if total:
+        convergence_page = redis_service.get_series(task_id, 'convergence', start, end)
+    else:
+        # Results stored before series were persisted per iteration
+        results = redis_service.get_task_results(task_id)
+        if not results:
+            return jsonify({'error': 'Results not found'}), 404
+        convergence_data = results.get('complete_plots', {}).get('convergence', [])
+        total = series_length(convergence_data)
+        convergence_page = slice_series(convergence_data, start, end)
+    
+    page_data = apply_layout(
+        {'convergence': convergence_page},
+        request.args.get('layout', 'points'),
+        request.args.get('dtype', 'float64')
+    )['convergence']
     
     return jsonify({
         'page': page,
         'per_page': per_page,
-        'total': len(convergence_data),
+        'total': total,
         'data': page_data,
-        'has_next': end < len(convergence_data),
+        'has_next': end < total,
         'has_prev': page > 1
-    })
\ No newline at end of file
+    })
+
+@bp.route('/results/<task_id>/series/<name>', methods=['GET'])
+def get_series_range(task_id, name):
+    """Get one series over an x range at a resolution that fits max_points
+
+    Completed tasks answer from the pyramid level whose buckets fit the
+    range into ``max_points``; level 0 is the raw series, coarser levels
+    carry min/max/mean per bucket. Running tasks are downsampled instead.
+    """
+    
+    # Validate task ID
+    if not validate_task_id(task_id):
+        return jsonify({'error': 'Invalid task ID'}), 400
+    
+    if name not in SERIES_FIELDS:
+        return jsonify({'error': f'Unknown series: {name}'}), 404
+    
+    errors = validate_layout_params(request.args) + validate_range_params(request.args)
+    if errors:
+        return jsonify({'errors': errors}), 400
+    
+    params = plot_params(request.args, current_app.config['MAX_PLOT_POINTS'])
+    x_from = float(request.args.get('from', -math.inf))
+    x_to = float(request.args.get('to', math.inf))
+    test_index = request.args.get('test_index', type=int)
+    
+    meta = redis_service.get_series_pyramid_meta(task_id, name, test_index)
+    if meta is None:
+        # No pyramid until the task completes: reduce the raw series
+        if not redis_service.get_series_length(task_id, name, test_index):
+            return jsonify({'error': 'Results not found'}), 404
+        level = 0
+        series = redis_service.get_series(task_id, name, test_index=test_index)
+        series = slice_range(series, x_from, x_to)
+        series = downsample_series(name, series, params['max_points'], params['downsample'])
+    else:
+        # Step to a coarser level if the even-spacing estimate fell short
+        level = select_level(meta, x_from, x_to, params['max_points'])
+        while True:
+            if level == 0:
+                series = redis_service.get_series(task_id, name, test_index=test_index)
+            else:
+                series = redis_service.get_series_pyramid_level(task_id, name, level, test_index)
+            series = slice_range(series, x_from, x_to)
+            if series_length(series) <= params['max_points'] or level == len(meta['factors']):
+                break
+            level += 1
+    
+    return jsonify({
+        'task_id': task_id,
+        'series': name,
+        'level': level,
+        'factor': meta['factors'][level - 1] if level else 1,
+        'total': meta['length'] if meta else None,
+        'points': series_length(series),
+        'data': apply_layout({name: series}, params['layout'], params['dtype'])[name]
+    })
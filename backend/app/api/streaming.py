@@ -1,10 +1,21 @@
 # app/api/streaming.py
-from flask import Blueprint, Response, current_app, jsonify, stream_with_context
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 from app.services.sse_service import SSEService
 from app.services.redis_service import RedisService
-import json, time
+from app.services.broadcast_hub import SubscriptionGroup, broadcast_hub, control_stream_id
+from app.services.series import plot_params, render_plots
+from app.services.sse_encoding import SSEEncoder
+from app.services.sse_pacing import EventPacer
+from app.services.sse_streams import FOLLOW, MultiTaskStream, TaskStream
+from app.utils.validators import (
+    validate_event_id, validate_layout_params, validate_max_rate, validate_sse_encoding,
+    validate_stream_tasks, validate_task_id
+)
+import hashlib
+import logging, uuid
 
 bp = Blueprint('streaming', __name__)
+logger = logging.getLogger(__name__)
 
 @bp.route('/stream/<task_id>')
 def stream_plots(task_id):
@@ -16,56 +27,58 @@ def stream_plots(task_id):
     sse_service = SSEService()
     redis_service = RedisService()
 
+    # Plots embedded in events are rendered in the client's layout, payloads
+    # in the encoding it negotiated and progress at the rate it asked for
+    encoding = request.args.get('encoding', 'json')
+    max_rate = request.args.get('max_rate')
+    errors = (validate_layout_params(request.args) + validate_sse_encoding(encoding)
+              + validate_max_rate(max_rate))
+    if errors:
+        return jsonify({'errors': errors}), 400
+    params = plot_params(request.args, cfg['MAX_PLOT_POINTS'])
+    dictionary = redis_service.get_sse_dictionary() if 'zstd' in encoding else None
+    encoder = SSEEncoder(encoding, dictionary)
+    pacer = EventPacer(float(max_rate) if max_rate else cfg.get('SSE_MAX_EVENT_RATE'))
+
+    # EventSource sends Last-Event-ID when it reconnects
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if not validate_event_id(last_event_id):
+        last_event_id = None
+
     @stream_with_context
     def generate():
         """Generator for SSE stream"""
-        # Initial hello
-        yield sse_service.format_message({'type': 'connected', 'task_id': task_id})
-
-        # Snapshot if present
-        state = redis_service.get_task_progress(task_id)
-        if state:
-            yield sse_service.format_message({'type': 'current_state', 'state': state})
+        stream = TaskStream(sse_service, encoder, pacer, params, cfg)
+        # A resuming client already has the task's state
+        state = None if last_event_id else redis_service.get_task_progress(task_id)
+        yield from stream.opening(task_id, state)
 
-        # Timers
-        start_time = time.time()
-        last_activity = time.time()                   # activity = any event/heartbeat sent
-        hb_interval = cfg.get('SSE_HEARTBEAT_INTERVAL', 30)
-        timeout = cfg.get('SSE_TIMEOUT', 300)
+        # Share this process's reader for the task, replaying from the
+        # client's last event or from the start of the log
+        subscription = broadcast_hub.subscribe(app, task_id, last_event_id or '0-0')
 
         try:
+            events = subscription.replay(redis_service)
             while True:
-                # Blocking poll from Redis (short timeout)
-                msg = redis_service.get_sse_message(task_id, timeout=1)
-
-                if msg:
-                    yield sse_service.format_message(msg)
-                    last_activity = time.time()
-                    if msg.get('type') == 'calculation_complete':
-                        break
-                else:
-                    now = time.time()
-                    # heartbeat
-                    if now - last_activity >= hb_interval:
-                        yield sse_service.format_heartbeat()
-                        last_activity = now
-
-                # cancellation
-                if redis_service.is_task_cancelled(task_id):
-                    yield sse_service.format_message({'type': 'cancelled'})
+                yield from stream.frames(events, subscription.overflowed)
+                if not stream.closed:
+                    yield from stream.idle()
+                if stream.closed:
                     break
 
-                # absolute timeout (since connection start)
-                if time.time() - start_time >= timeout:
-                    yield sse_service.format_message({'type': 'timeout'})
-                    break
+                # Wait for the shared reader to fan out new events, or for
+                # coalesced progress to be due
+                events = subscription.get_events(timeout=stream.wait_time())
 
         except GeneratorExit:
             # client disconnected
             pass
         except Exception as e:
             # don't raise after headers sent; emit SSE error
-            yield sse_service.format_message({'type': 'error', 'message': str(e)})
+            yield stream.failed(e)
+        finally:
+            broadcast_hub.unsubscribe(subscription)
+            logger.info(f"SSE stream for task {task_id} closed: {stream.stats()}")
 
     resp = Response(generate(), mimetype='text/event-stream')
     resp.headers['Cache-Control'] = 'no-cache'
@@ -73,14 +86,166 @@ def stream_plots(task_id):
     resp.headers['Connection'] = 'keep-alive'
     return resp
 
+def _split_ids(value):
+    """Ids from a comma-separated query parameter"""
+    return [item for item in (value or '').split(',') if item]
+
+@bp.route('/stream')
+def stream_tasks():
+    """SSE endpoint multiplexing the events of several tasks
+
+    Follows the tasks in ``?tasks=a,b,c`` and the batch in ``?batch=<id>``
+    (a batch streams every test's events under its own id), tagging each
+    event with its ``task_id``; a task is dropped after its final event.
+    The ``connected`` event names the stream, so
+    ``POST /api/stream/<stream_id>/subscriptions`` can change its tasks
+    without reconnecting. Events carry no ids: a reconnecting client gets
+    each task's state and events again, as on its first connection.
+    """
+    app = current_app._get_current_object()
+    cfg = app.config
+
+    sse_service = SSEService()
+    redis_service = RedisService()
+
+    task_ids = list(dict.fromkeys(_split_ids(request.args.get('tasks'))
+                                  + _split_ids(request.args.get('batch'))))
+    encoding = request.args.get('encoding', 'json')
+    max_rate = request.args.get('max_rate')
+    errors = (validate_stream_tasks(task_ids, cfg['SSE_MAX_STREAM_TASKS'])
+              + validate_layout_params(request.args)
+              + validate_sse_encoding(encoding) + validate_max_rate(max_rate))
+    if not task_ids:
+        errors.append('tasks or batch is required')
+    if errors:
+        return jsonify({'errors': errors}), 400
+    params = plot_params(request.args, cfg['MAX_PLOT_POINTS'])
+    dictionary = redis_service.get_sse_dictionary() if 'zstd' in encoding else None
+    encoder = SSEEncoder(encoding, dictionary)
+    pacer = EventPacer(float(max_rate) if max_rate else cfg.get('SSE_MAX_EVENT_RATE'))
+
+    stream_id = str(uuid.uuid4())
+
+    @stream_with_context
+    def generate():
+        """Generator for the multiplexed SSE stream"""
+        group = SubscriptionGroup(cfg.get('SSE_SUBSCRIBER_QUEUE_SIZE', 1000))
+        stream = MultiTaskStream(sse_service, encoder, pacer, params, cfg, stream_id, group,
+                                 broadcast_hub.unsubscribe)
+
+        # Subscription changes arrive as events on the stream's own control
+        # stream, through the same shared readers as task events
+        start_id = redis_service.queue_sse_message(stream.control_id, {'type': 'opened'})
+        broadcast_hub.subscribe(app, stream.control_id, start_id, group=group)
+
+        def follow(task_id):
+            """Subscribe to a task; returns its snapshot and the events it already has"""
+            if not stream.can_follow(task_id):
+                return []
+            events = []
+            state = redis_service.get_task_progress(task_id)
+            if state:
+                events.append((task_id, None, {'type': 'current_state', 'state': state}))
+            member = broadcast_hub.subscribe(app, task_id, '0-0', group=group)
+            events.extend((task_id, event_id, message)
+                          for event_id, message in member.replay(redis_service))
+            return events
+
+        yield from stream.opening(task_ids)
+
+        try:
+            outgoing = [(task_id, FOLLOW, None) for task_id in task_ids]
+            while True:
+                outgoing = [event for entry in outgoing
+                            for event in (follow(entry[0]) if entry[1] is FOLLOW else [entry])]
+                yield from stream.frames(outgoing)
+                if not stream.closed:
+                    # One heartbeat covers every task on the connection
+                    yield from stream.idle()
+                if stream.closed:
+                    break
+
+                outgoing = stream.select(group.get_events(timeout=stream.wait_time()))
+
+        except GeneratorExit:
+            pass
+        except Exception as e:
+            yield stream.failed(e)
+        finally:
+            stream.close()
+            logger.info(f"SSE stream {stream_id} for {len(task_ids)} tasks closed: "
+                        f"{stream.stats()}")
+
+    resp = Response(generate(), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    resp.headers['Connection'] = 'keep-alive'
+    return resp
+
+@bp.route('/stream/<stream_id>/subscriptions', methods=['POST'])
+def update_stream_subscriptions(stream_id):
+    """Add tasks to, or remove them from, an open multi-task stream"""
+    data = request.get_json(silent=True) or {}
+    add, remove = data.get('add', []), data.get('remove', [])
+    if not isinstance(add, list) or not isinstance(remove, list):
+        return jsonify({'errors': ['add and remove must be lists of task ids']}), 400
+
+    limit = current_app.config['SSE_MAX_STREAM_TASKS']
+    errors = validate_stream_tasks(add, limit) + validate_stream_tasks(remove, limit)
+    if errors:
+        return jsonify({'errors': errors}), 400
+
+    redis_service = RedisService()
+    control_id = control_stream_id(stream_id)
+    if not validate_task_id(stream_id) or redis_service.get_last_sse_event_id(control_id) == '0-0':
+        return jsonify({'error': 'Stream not found'}), 404
+
+    redis_service.queue_sse_message(control_id,
+                                    {'type': 'subscriptions', 'add': add, 'remove': remove})
+    return jsonify({'stream_id': stream_id, 'add': add, 'remove': remove}), 202
+
+@bp.route('/sse/dictionary', methods=['GET'])
+def get_sse_dictionary():
+    """The zstd dictionary ``zstd`` and ``delta+zstd`` streams are compressed with"""
+    if validate_sse_encoding('zstd'):
+        return jsonify({'error': 'zstd encoding is not available'}), 404
+
+    dictionary = RedisService().get_sse_dictionary()
+    response = Response(dictionary, mimetype='application/octet-stream')
+    response.set_etag(hashlib.sha256(dictionary).hexdigest()[:16])
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response.make_conditional(request)
+
+@bp.route('/sse/queue-stats', methods=['GET'])
+def get_sse_queue_stats():
+    """How the task event queues are bounded, and what that has cost"""
+    return jsonify({
+        'policy': current_app.config.get('SSE_QUEUE_POLICY', 'keep_terminal'),
+        'max_progress_events': current_app.config['SSE_STREAM_MAXLEN'],
+        **RedisService().get_sse_queue_stats()
+    })
+
 @bp.route('/plots/<task_id>/snapshot', methods=['GET'])
 def get_plot_snapshot(task_id):
     """Get current state of all plots"""
+    errors = validate_layout_params(request.args)
+    if errors:
+        return jsonify({'errors': errors}), 400
+
+    params = plot_params(request.args, current_app.config['MAX_PLOT_POINTS'])
+
     redis_service = RedisService()
     results = redis_service.get_task_results(task_id)
     if results:
-        return jsonify(results.get('complete_plots', {}))
+        return jsonify(render_plots(results.get('complete_plots', {}), **params))
     progress = redis_service.get_task_progress(task_id)
     if progress:
-        return jsonify({'status': 'running', 'state': progress})
+        # Include the points persisted so far
+        partial = redis_service.get_partial_results(task_id) or {}
+        return jsonify({
+            'status': 'running',
+            'state': progress,
+            'plots': render_plots(partial.get('complete_plots', {}), **params)
+        })
     return jsonify({'error': 'No data available'}), 404
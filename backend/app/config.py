@@ -24,11 +24,33 @@ class Config:
     # CORS, SSE, Data unchanged...
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:3000').split(',')
     SSE_REDIS_QUEUE_TTL = 3600
+    SSE_STREAM_MAXLEN = 2000  # Progress events kept per task for replay
+    SSE_QUEUE_POLICY = os.environ.get('SSE_QUEUE_POLICY', 'keep_terminal')  # or 'latest_progress'
+    SSE_SUBSCRIBER_QUEUE_SIZE = 1000  # Buffered events per connected client
+    SSE_HUB_BLOCK_TIMEOUT = 1
     SSE_HEARTBEAT_INTERVAL = 30
     SSE_TIMEOUT = 300
+    SSE_MAX_STREAM_TASKS = 50  # Tasks one multi-task stream may follow
+    SSE_MAX_EVENT_RATE = 10  # Progress events per second per stream, unless it asks for ?max_rate=
+    ACK_TIMEOUT = 10  # Seconds before an unacknowledged message is redelivered
+    ACK_MAX_DELIVERIES = 3
+    ACK_REAPER_INTERVAL = 1
+    # Payload codec per Redis key family (json, orjson or msgpack)
+    REDIS_CODEC_DEFAULT = 'json'
+    REDIS_CODECS = {
+        'results': os.environ.get('REDIS_CODEC_RESULTS', 'orjson'),
+        'task_meta': os.environ.get('REDIS_CODEC_TASK_META', 'orjson'),
+        'progress': os.environ.get('REDIS_CODEC_PROGRESS', 'json'),
+        'sse': os.environ.get('REDIS_CODEC_SSE', 'json'),
+        'acks': os.environ.get('REDIS_CODEC_ACKS', 'json'),
+        'series': os.environ.get('REDIS_CODEC_SERIES', 'json'),
+    }
     MAX_PLOT_POINTS = 1000
+    BATCH_MAX_CONCURRENCY = 4  # Tests of a parallel batch running at once
+    MAX_EXPORT_TASKS = 20  # Tasks one multi-task export may combine
     RESULT_EXPIRY_SECONDS = 3600
     COMPRESSION_THRESHOLD = 50000
+    COMPRESSION_LEVELS = {'gzip': 6, 'br': 5, 'zstd': 3}
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -6,4 +6,5 @@ from celery import Celery
 
 cors = CORS()
 redis_client = FlaskRedis()
+redis_binary_client = FlaskRedis()  # Returns bytes, for codec-encoded values
 celery = Celery()
@@ -3,12 +3,13 @@
 
 from .redis_service import RedisService
 from .sse_service import SSEService
-from .data_processing import DataProcessor
+from .data_processing import DataProcessor, Histogram
 from .message_queue import MessageQueue
 
 __all__ = [
     'RedisService',
     'SSEService', 
     'DataProcessor',
+    'Histogram',
     'MessageQueue'
 ]
\ No newline at end of file
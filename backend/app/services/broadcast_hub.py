@@ -0,0 +1,254 @@
+# app/services/broadcast_hub.py
+"""In-process broadcast of task event streams to SSE clients"""
+import logging
+import queue
+import threading
+import time
+from app.services.redis_service import RedisService
+from app.services.cancellation import cancellation_listener
+
+logger = logging.getLogger(__name__)
+
+# Events after which a task sends nothing more, so its streams stop following it
+FINAL_EVENTS = ('calculation_complete', 'batch_completed', 'cancelled', 'error', 'batch_error')
+
+def control_stream_id(stream_id):
+    """Event stream carrying subscription changes for a multi-task stream"""
+    return f'stream-{stream_id}'
+
+def parse_event_id(event_id):
+    """Convert a Redis stream id into a comparable tuple"""
+    millis, sequence = event_id.split('-')
+    return int(millis), int(sequence)
+
+class Subscription:
+    """A single SSE client's view of a task's events"""
+
+    def __init__(self, task_id, last_event_id, maxsize):
+        self.task_id = task_id
+        self.cursor = last_event_id
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def publish(self, event_id, message):
+        """Hand an event to this subscriber (called from the reader thread)"""
+        try:
+            self.queue.put_nowait((event_id, message))
+        except queue.Full:
+            # The client can't keep up; it will resume via Last-Event-ID
+            self.overflowed = True
+
+    def replay(self, redis_service):
+        """Read events the client missed before it subscribed"""
+        events = []
+        while True:
+            read = redis_service.get_sse_events(self.task_id, self.cursor, timeout=None)
+            batch = self._accept(read)
+            if not batch:
+                return events
+            events.extend(batch)
+
+    def get_events(self, timeout=1):
+        """Wait up to ``timeout`` seconds for new events"""
+        try:
+            items = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return self._accept(items)
+
+    def _accept(self, items):
+        """Drop events already delivered and advance the cursor"""
+        accepted = []
+        for event_id, message in items:
+            if event_id is not None:
+                if parse_event_id(event_id) <= parse_event_id(self.cursor):
+                    continue
+                self.cursor = event_id
+            accepted.append((event_id, message))
+        return accepted
+
+class GroupMember(Subscription):
+    """One task's subscription within a multi-task stream"""
+
+    def __init__(self, group, task_id, last_event_id):
+        self.task_id = task_id
+        self.cursor = last_event_id
+        self.group = group
+
+    @property
+    def overflowed(self):
+        return self.group.overflowed
+
+    def publish(self, event_id, message):
+        """Hand an event to the stream's shared queue"""
+        self.group.publish(self, event_id, message)
+
+class SubscriptionGroup:
+    """Events of several tasks merged into one SSE connection
+
+    Every member publishes into one queue, so the stream waits on a single
+    queue however many tasks it follows.
+    """
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.members = {}
+        self.overflowed = False
+
+    def publish(self, member, event_id, message):
+        """Hand a member's event to the stream (called from reader threads)"""
+        try:
+            self.queue.put_nowait((member, event_id, message))
+        except queue.Full:
+            self.overflowed = True
+
+    def get_events(self, timeout=1):
+        """Wait up to ``timeout`` seconds for new ``(task_id, event_id, message)`` events"""
+        try:
+            items = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return self._accept(items)
+
+    def _accept(self, items):
+        """Tag events with their task, dropping duplicates"""
+        events = []
+        for member, event_id, message in items:
+            # Events still queued for a task the stream has left are dropped
+            if self.members.get(member.task_id) is member:
+                events.extend((member.task_id, accepted_id, accepted)
+                              for accepted_id, accepted in member._accept([(event_id, message)]))
+        return events
+
+class TaskChannel:
+    """Single Redis reader for one task, shared by all of its subscribers"""
+
+    def __init__(self, hub, app, task_id, last_event_id):
+        self.hub = hub
+        self.app = app
+        self.task_id = task_id
+        self.cursor = last_event_id
+        self.subscribers = set()
+        self.cancel_sent = False
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name=f'sse-channel-{task_id[:8]}')
+
+    def _run(self):
+        """Read the task's stream and fan events out to every subscriber"""
+        with self.app.app_context():
+            redis_service = RedisService()
+            block_timeout = self.app.config.get('SSE_HUB_BLOCK_TIMEOUT', 1)
+
+            while self.hub._has_subscribers(self):
+                try:
+                    events = redis_service.get_sse_events(self.task_id, self.cursor,
+                                                          timeout=block_timeout)
+                except Exception as e:
+                    logger.warning(f"SSE channel for task {self.task_id} read failed: {e}")
+                    time.sleep(block_timeout)
+                    continue
+
+                for event_id, message in events:
+                    self.cursor = event_id
+                    self._broadcast(event_id, message)
+
+        cancellation_listener.unwatch(self.task_id)
+
+    def cancel(self):
+        """Tell every subscriber the task was cancelled (once)"""
+        if not self.cancel_sent:
+            self.cancel_sent = True
+            self._broadcast(None, {'type': 'cancelled'})
+
+    def _broadcast(self, event_id, message):
+        """Publish an event to a snapshot of current subscribers"""
+        for subscription in list(self.subscribers):
+            subscription.publish(event_id, message)
+
+class BroadcastHub:
+    """Share one Redis reader per task among all SSE clients in the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+        cancellation_listener.on_cancel(self._handle_cancel)
+
+    def subscribe(self, app, task_id, last_event_id='0-0', group=None):
+        """Register a client for a task's events, starting the reader if needed
+
+        With ``group``, the task's events go to that multi-task stream.
+        """
+        if group is not None:
+            subscription = group.members[task_id] = GroupMember(group, task_id, last_event_id)
+        else:
+            subscription = Subscription(task_id, last_event_id,
+                                        app.config.get('SSE_SUBSCRIBER_QUEUE_SIZE', 1000))
+
+        with self._lock:
+            channel = self._channels.get(task_id)
+            if channel is None:
+                with app.app_context():
+                    start_id = RedisService().get_last_sse_event_id(task_id)
+                    cancelled = cancellation_listener.watch(task_id)
+                channel = TaskChannel(self, app, task_id, start_id)
+                self._channels[task_id] = channel
+                channel.subscribers.add(subscription)
+                channel.thread.start()
+                if cancelled.is_set():
+                    channel.cancel()
+            else:
+                channel.subscribers.add(subscription)
+                if channel.cancel_sent:
+                    subscription.publish(None, {'type': 'cancelled'})
+
+        logger.debug(f"SSE client subscribed to task {task_id}")
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a client; the reader stops after its last client leaves"""
+        if isinstance(subscription, GroupMember):
+            members = subscription.group.members
+            if members.get(subscription.task_id) is subscription:
+                del members[subscription.task_id]
+        with self._lock:
+            channel = self._channels.get(subscription.task_id)
+            if channel:
+                channel.subscribers.discard(subscription)
+
+    def subscriber_count(self, task_id):
+        """Number of clients watching a task in this process"""
+        with self._lock:
+            channel = self._channels.get(task_id)
+            return len(channel.subscribers) if channel else 0
+
+    def _handle_cancel(self, task_id):
+        """Push a cancellation to the task's subscribers"""
+        with self._lock:
+            channel = self._channels.get(task_id)
+            if channel:
+                channel.cancel()
+
+    def _has_subscribers(self, channel):
+        """Check whether a channel should keep reading, retiring it if not"""
+        with self._lock:
+            if channel.subscribers:
+                return True
+            if self._channels.get(channel.task_id) is channel:
+                del self._channels[channel.task_id]
+            return False
+
+broadcast_hub = BroadcastHub()
@@ -0,0 +1,125 @@
+# app/services/cancellation.py
+"""Push-based task cancellation over Redis pub/sub"""
+import logging
+import os
+import threading
+import time
+from app.services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+class CancellationListener:
+    """Deliver cancellations to watched tasks in this process
+
+    One pub/sub subscription per process receives every cancel. Checking a
+    watched task is a local Event lookup, so it costs no Redis operations
+    while nobody is cancelling.
+    """
+
+    # Seconds to wait for Redis to confirm the subscription
+    SUBSCRIBE_TIMEOUT = 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = {}
+        self._watchers = {}
+        self._callbacks = []
+        self._pubsub = None
+        self._thread = None
+        self._pid = None
+
+    def watch(self, task_id, event=None):
+        """Start receiving cancellations for a task and return its Event
+
+        Passing the Event of another watched id makes either cancel set it.
+        """
+        self._ensure_started()
+
+        with self._lock:
+            event = self._events.setdefault(task_id, event or threading.Event())
+            self._watchers[task_id] = self._watchers.get(task_id, 0) + 1
+
+        # Cancels published before we subscribed are caught by the marker key
+        if RedisService().is_task_cancelled(task_id):
+            event.set()
+        return event
+
+    def unwatch(self, task_id):
+        """Stop tracking a task once its last watcher is done"""
+        with self._lock:
+            remaining = self._watchers.get(task_id, 0) - 1
+            if remaining > 0:
+                self._watchers[task_id] = remaining
+            else:
+                self._watchers.pop(task_id, None)
+                self._events.pop(task_id, None)
+
+    def is_cancelled(self, task_id):
+        """Check a watched task without touching Redis"""
+        event = self._events.get(task_id)
+        return event is not None and event.is_set()
+
+    def on_cancel(self, callback):
+        """Call ``callback(task_id)`` from the listener thread on every cancel"""
+        self._callbacks.append(callback)
+
+    def _ensure_started(self):
+        """Subscribe once per process (re-subscribing after a fork)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+
+            pubsub = RedisService().redis.pubsub()
+            pubsub.subscribe(RedisService.CANCEL_CHANNEL)
+            # Wait for the confirmation so no cancel can slip past watch(),
+            # but not forever: every watch() queues behind this lock
+            deadline = time.monotonic() + self.SUBSCRIBE_TIMEOUT
+            while pubsub.get_message(timeout=max(0, deadline - time.monotonic())) is None:
+                if time.monotonic() >= deadline:
+                    pubsub.close()
+                    logger.error("No cancellation subscription confirmed within "
+                                 f"{self.SUBSCRIBE_TIMEOUT}s")
+                    raise ConnectionError('Could not subscribe to task cancellations')
+            self._pubsub = pubsub
+
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name='cancellation-listener')
+            self._thread.start()
+
+    def _run(self):
+        """Dispatch published cancellations until the process exits"""
+        while True:
+            try:
+                for message in self._pubsub.listen():
+                    if message['type'] == 'message':
+                        self._dispatch(message['data'])
+            except Exception as e:
+                logger.warning(f"Cancellation listener disconnected: {e}")
+                time.sleep(1)
+                self._recheck_markers()
+
+    def _dispatch(self, task_id):
+        """Mark a task cancelled locally and notify callbacks"""
+        event = self._events.get(task_id)
+        if event is not None:
+            event.set()
+
+        for callback in self._callbacks:
+            try:
+                callback(task_id)
+            except Exception as e:
+                logger.warning(f"Cancellation callback failed for task {task_id}: {e}")
+
+    def _recheck_markers(self):
+        """Catch cancels published while the subscription was down"""
+        try:
+            with self._lock:
+                task_ids = list(self._events)
+            for task_id, cancelled in zip(task_ids, RedisService().are_tasks_cancelled(task_ids)):
+                if cancelled:
+                    self._dispatch(task_id)
+        except Exception as e:
+            logger.warning(f"Cancellation marker check failed: {e}")
+
+cancellation_listener = CancellationListener()
@@ -1,56 +1,289 @@
 # app/services/data_processing.py
 """Data processing utilities"""
+import math
 import numpy as np
 
-class DataProcessor:
-    """Process and transform data for visualization"""
-    
-    @staticmethod
-    def create_histogram(data, num_bins=20):
-        """Create histogram bins from raw data"""
-        if not data:
-            return []
-            
-        min_val = min(data)
-        max_val = max(data)
-        bin_width = (max_val - min_val) / num_bins if max_val != min_val else 1
-        
+def _range_label(start, end, width):
+    """``start-end`` label with enough decimals to tell bins ``width`` apart"""
+    decimals = max(2, math.ceil(-math.log10(width)) + 1) if width > 0 else 2
+    return f"{start:.{decimals}f}-{end:.{decimals}f}"
+
+class Histogram:
+    """Mergeable fixed-width histogram with running moments
+
+    Bins are aligned to multiples of ``bin_width`` rather than to the data's
+    range, so histograms built from different iterations or tests line up
+    and merge by adding counts; no raw samples are kept. Widths picked from
+    the data are powers of two, so a finer histogram merges into a coarser
+    one by summing neighbouring bins.
+    """
+
+    # Most bins a width picked from the data may produce
+    MAX_BINS = 100
+
+    def __init__(self, bin_width):
+        self.bin_width = bin_width
+        self.offset = 0  # Index of the first bin (bin i covers [i, i + 1) * bin_width)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.count = 0
+        self.sum = 0.0
+        self.sum_sq = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    @classmethod
+    def bin_width_for(cls, values):
+        """Freedman-Diaconis bin width for ``values``, rounded up to a power of two"""
+        values = np.asarray(values, dtype=float)
+        if values.size < 2:
+            return 1.0
+        q1, q3 = np.percentile(values, [25, 75])
+        spread = float(values.max() - values.min())
+        width = 2 * (q3 - q1) / values.size ** (1 / 3) or spread / math.sqrt(values.size) or 1.0
+        width = max(width, spread / cls.MAX_BINS)
+        return 2.0 ** math.ceil(math.log2(width))
+
+    @classmethod
+    def from_values(cls, values, bin_width=None):
+        """Build a histogram from raw samples, with bins sized from them by default"""
+        histogram = cls(bin_width or cls.bin_width_for(values))
+        histogram.add(values)
+        return histogram
+
+    def _add_counts(self, offset, counts):
+        """Add a dense run of bin counts starting at bin ``offset``"""
+        if not len(self.counts):
+            self.offset, self.counts = offset, counts.astype(np.int64)
+            return
+
+        start = min(self.offset, offset)
+        end = max(self.offset + len(self.counts), offset + len(counts))
+        merged = np.zeros(end - start, dtype=np.int64)
+        merged[self.offset - start:self.offset - start + len(self.counts)] += self.counts
+        merged[offset - start:offset - start + len(counts)] += counts
+        self.offset, self.counts = start, merged
+
+    def add(self, values):
+        """Add raw samples"""
+        values = np.asarray(values, dtype=float)
+        if not values.size:
+            return self
+
+        indexes = np.floor(values / self.bin_width).astype(np.int64)
+        low = int(indexes.min())
+        self._add_counts(low, np.bincount(indexes - low))
+
+        self.count += int(values.size)
+        self.sum += float(values.sum())
+        self.sum_sq += float(np.square(values).sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        return self
+
+    def coarsen(self, bin_width):
+        """Regroup the bins into ``bin_width`` wide ones
+
+        ``bin_width`` must be a multiple of the current width.
+        """
+        factor = bin_width / self.bin_width
+        if factor < 1 or factor != round(factor):
+            raise ValueError(f'Cannot regroup bins of width {self.bin_width} '
+                             f'into width {bin_width}')
+        factor = int(factor)
+        if factor > 1 and len(self.counts):
+            # Pad so the bins start and end on a multiple of factor
+            start = self.offset // factor * factor
+            end = self.offset + len(self.counts)
+            padded = np.zeros(-(-(end - start) // factor) * factor, dtype=np.int64)
+            padded[self.offset - start:self.offset - start + len(self.counts)] = self.counts
+            self.offset, self.counts = start // factor, padded.reshape(-1, factor).sum(axis=1)
+        self.bin_width = bin_width
+        return self
+
+    def merge(self, other):
+        """Add another histogram's counts and moments to this one
+
+        The result has the coarser of the two bin widths.
+        """
+        if other.bin_width < self.bin_width:
+            other = Histogram.from_dict(other.to_dict()).coarsen(self.bin_width)
+        elif other.bin_width > self.bin_width:
+            self.coarsen(other.bin_width)
+        if other.count:
+            self._add_counts(other.offset, other.counts)
+            self.count += other.count
+            self.sum += other.sum
+            self.sum_sq += other.sum_sq
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        return self
+
+    def statistics(self):
+        """Count, mean, std, min and max of every sample added"""
+        if not self.count:
+            return {}
+        mean = self.sum / self.count
+        return {
+            'count': self.count,
+            'mean': mean,
+            'std': math.sqrt(max(self.sum_sq / self.count - mean * mean, 0.0)),
+            'min': self.min,
+            'max': self.max
+        }
+
+    def to_bins(self):
+        """Bins in the same shape as ``DataProcessor.create_histogram``"""
         bins = []
-        for i in range(num_bins):
-            bin_start = min_val + i * bin_width
-            bin_end = bin_start + bin_width
-            count = sum(1 for val in data if bin_start <= val < bin_end)
+        for index, count in enumerate(self.counts.tolist()):
+            bin_start = (self.offset + index) * self.bin_width
+            bin_end = bin_start + self.bin_width
             bins.append({
-                'range': f"{bin_start:.2f}-{bin_end:.2f}",
+                'range': _range_label(bin_start, bin_end, self.bin_width),
                 'count': count,
                 'start': bin_start,
                 'end': bin_end
             })
-        
         return bins
-    
+
+    def to_dict(self):
+        """JSON-safe representation"""
+        return {
+            'bin_width': self.bin_width,
+            'offset': self.offset,
+            'counts': self.counts.tolist(),
+            'count': self.count,
+            'sum': self.sum,
+            'sum_sq': self.sum_sq,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a histogram from ``to_dict`` output"""
+        histogram = cls(data['bin_width'])
+        histogram.offset = data['offset']
+        histogram.counts = np.asarray(data['counts'], dtype=np.int64)
+        histogram.count = data['count']
+        histogram.sum = data['sum']
+        histogram.sum_sq = data['sum_sq']
+        if histogram.count:
+            histogram.min, histogram.max = data['min'], data['max']
+        return histogram
+
+class DataProcessor:
+    """Process and transform data for visualization"""
+
+    @staticmethod
+    def create_histogram(data, num_bins=20):
+        """Create histogram bins from raw data
+
+        The last bin is closed, so the maximum value is counted.
+        """
+        if len(data) == 0:
+            return []
+
+        values = np.asarray(data, dtype=float)
+        min_val = float(values.min())
+        max_val = float(values.max())
+        # A constant series gets unit-width bins starting at its value
+        upper = max_val if max_val != min_val else min_val + num_bins
+
+        counts, edges = np.histogram(values, bins=num_bins, range=(min_val, upper))
+
+        width = (upper - min_val) / num_bins
+        return [{
+            'range': _range_label(bin_start, bin_end, width),
+            'count': count,
+            'start': bin_start,
+            'end': bin_end
+        } for count, bin_start, bin_end in zip(counts.tolist(), edges[:-1].tolist(),
+                                               edges[1:].tolist())]
+
     @staticmethod
     def decimate_data(data, max_points=1000):
-        """Reduce data points for performance"""
+        """Reduce data points for performance
+
+        Takes ``max_points`` evenly spaced points, always keeping the first
+        and last. Use ``lttb_indices`` or ``minmax_indices`` where the shape
+        (spikes, dips) of the series matters.
+        """
         if len(data) <= max_points:
             return data
-            
-        # Simple decimation - take every nth point
-        step = len(data) // max_points
-        return data[::step]
-    
+
+        indices = np.linspace(0, len(data) - 1, max_points).round().astype(np.int64)
+        if isinstance(data, np.ndarray):
+            return data[indices]
+        return [data[i] for i in indices]
+
+    @staticmethod
+    def lttb_indices(x, y, max_points):
+        """Indices of the points Largest-Triangle-Three-Buckets keeps
+
+        The first and last points are always kept. Every other bucket
+        contributes the point forming the largest triangle with the point
+        kept before it and the average of the next bucket.
+        """
+        n = len(y)
+        if n <= max_points or max_points < 3:
+            return np.arange(n)
+
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+
+        indices = np.empty(max_points, dtype=np.int64)
+        indices[0], indices[-1] = 0, n - 1
+        previous = 0
+
+        for bucket in range(max_points - 2):
+            start, end = edges[bucket], edges[bucket + 1]
+            if bucket + 2 < len(edges):
+                next_end = edges[bucket + 2]
+                avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+            else:
+                avg_x, avg_y = x[-1], y[-1]
+
+            areas = np.abs(
+                (x[previous] - avg_x) * (y[start:end] - y[previous])
+                - (x[previous] - x[start:end]) * (avg_y - y[previous])
+            )
+            previous = start + int(areas.argmax())
+            indices[bucket + 1] = previous
+
+        return indices
+
+    @staticmethod
+    def minmax_indices(y, max_points):
+        """Indices of each bucket's minimum and maximum, in order"""
+        n = len(y)
+        if n <= max_points or max_points < 2:
+            return np.arange(n)
+
+        y = np.asarray(y, dtype=float)
+        edges = np.linspace(0, n, max_points // 2 + 1).astype(np.int64)
+        indices = []
+        for start, end in zip(edges[:-1], edges[1:]):
+            bucket = y[start:end]
+            indices.extend((start + int(bucket.argmin()), start + int(bucket.argmax())))
+
+        return np.unique(indices)
+
     @staticmethod
     def calculate_statistics(data):
-        """Calculate basic statistics"""
-        if not data:
+        """Calculate basic statistics as plain Python floats"""
+        if len(data) == 0:
             return {}
-            
+
+        values = np.asarray(data, dtype=float)
+        q1, median, q3 = np.percentile(values, [25, 50, 75]).tolist()
+
         return {
-            'mean': np.mean(data),
-            'std': np.std(data),
-            'min': np.min(data),
-            'max': np.max(data),
-            'median': np.median(data),
-            'q1': np.percentile(data, 25),
-            'q3': np.percentile(data, 75)
-        }
\ No newline at end of file
+            'mean': float(values.mean()),
+            'std': float(values.std()),
+            'min': float(values.min()),
+            'max': float(values.max()),
+            'median': median,
+            'q1': q1,
+            'q3': q3
+        }
@@ -0,0 +1,133 @@
+# app/services/export.py
+"""Exports of plot data: streamed CSV and columnar binary tables"""
+from app.services.series import SERIES_FIELDS, iter_rows, series_length, to_columnar
+import csv
+import io
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Series written to CSV exports, with their section heading and column names
+CSV_SECTIONS = (
+    ('convergence', 'Convergence Data', ('Iteration', 'Loss', 'Validation Loss')),
+    ('accuracy', 'Accuracy Metrics', ('Iteration', 'Accuracy', 'Precision', 'Recall')),
+    ('performance', 'Performance Metrics', ('Time', 'Throughput', 'Memory', 'CPU'))
+)
+
+def plot_csv_rows(read_series, title=None):
+    """Yield the CSV rows of one run's plots, section by section
+
+    ``read_series(name)`` yields a series as column chunks, so rows are
+    produced as the chunks are read. Batch exports pass a ``title`` per test.
+    """
+    if title:
+        yield [f'##### {title} #####']
+    
+    for index, (name, heading, header) in enumerate(CSV_SECTIONS):
+        if index:
+            yield []  # Empty row separator
+        yield [f'=== {heading} ===']
+        yield list(header)
+        for chunk in read_series(name):
+            yield from iter_rows(chunk, SERIES_FIELDS[name])
+    
+    if title:
+        yield []  # Separate the next test's section
+
+def stream_csv(rows, rows_per_chunk=500):
+    """Encode rows as CSV text, yielding a chunk every ``rows_per_chunk`` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue()
+
+# Columns of an exported plot table: one row per point of every series of
+# every run, with NaN (null in Arrow) for fields the series doesn't have.
+# ``x`` holds the iteration, or ``time`` for the performance series.
+TABLE_VALUE_FIELDS = tuple(dict.fromkeys(
+    field for fields in SERIES_FIELDS.values() for field in fields[1:]
+))
+
+# Binary table formats: (mimetype, file extension, needs pyarrow)
+TABLE_FORMATS = {
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow', True),
+    'parquet': ('application/vnd.apache.parquet', 'parquet', True),
+    'npz': ('application/octet-stream', 'npz', False)
+}
+
+def table_format_available(format_type):
+    """Whether a binary table format can be written in this environment"""
+    return not TABLE_FORMATS[format_type][2] or pyarrow is not None
+
+def plot_table(runs):
+    """Build one columnar table, as NumPy arrays, from several runs' plots
+
+    ``runs`` yields ``(task_id, test_index, complete_plots)``; ``test_index``
+    is -1 for runs that aren't part of a batch.
+    """
+    parts = []
+    for task_id, test_index, complete_plots in runs:
+        for name, fields in SERIES_FIELDS.items():
+            series = complete_plots.get(name)
+            if series is None or not series_length(series):
+                continue
+            columns = to_columnar(series, fields)
+            n = len(columns[fields[0]])
+            part = {
+                'task_id': np.full(n, task_id),
+                'test_index': np.full(n, test_index, dtype=np.int64),
+                'series': np.full(n, name),
+                'x': np.asarray(columns[fields[0]], dtype=np.int64)
+            }
+            for field in TABLE_VALUE_FIELDS:
+                part[field] = (np.asarray(columns[field], dtype=np.float64) if field in columns
+                               else np.full(n, np.nan))
+            parts.append(part)
+    
+    if not parts:
+        empty = {'task_id': np.array([], dtype=str), 'test_index': np.array([], dtype=np.int64),
+                 'series': np.array([], dtype=str), 'x': np.array([], dtype=np.int64)}
+        return {**empty, **{field: np.array([], dtype=np.float64) for field in TABLE_VALUE_FIELDS}}
+    return {column: np.concatenate([part[column] for part in parts]) for column in parts[0]}
+
+def _arrow_table(table):
+    """Convert a plot table to a pyarrow Table with dictionary-encoded labels"""
+    arrays = {}
+    for column, values in table.items():
+        if column in ('task_id', 'series'):
+            arrays[column] = pyarrow.array(values.tolist(), pyarrow.string()).dictionary_encode()
+        elif column == 'test_index':
+            arrays[column] = pyarrow.array(values, mask=values < 0)
+        elif column in TABLE_VALUE_FIELDS:
+            arrays[column] = pyarrow.array(values, mask=np.isnan(values))
+        else:
+            arrays[column] = pyarrow.array(values)
+    return pyarrow.table(arrays)
+
+def encode_table(table, format_type):
+    """Serialize a plot table as an Arrow IPC file, Parquet or NPZ"""
+    buffer = io.BytesIO()
+    if format_type == 'npz':
+        np.savez_compressed(buffer, **table)
+    elif format_type == 'arrow':
+        arrow_table = _arrow_table(table)
+        with pyarrow.ipc.new_file(buffer, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+    elif format_type == 'parquet':
+        pyarrow.parquet.write_table(_arrow_table(table), buffer)
+    else:
+        raise ValueError(f'Unsupported table format: {format_type}')
+    return buffer.getvalue()
@@ -1,8 +1,11 @@
 # app/services/message_queue.py
 """Message queue with acknowledgment support for SSE communications"""
 import uuid
+import os
 import time
 import logging
+import threading
+from flask import current_app
 from app.services.redis_service import RedisService
 from app.services.sse_service import SSEService
 
@@ -23,8 +26,12 @@ class MessageQueue:
             self.sse_service.queue_message(task_id, message)
             return None
     
-    def send_with_ack(self, task_id, message, timeout=10):
-        """Send message and wait for acknowledgment"""
+    def send_with_ack(self, task_id, message, timeout=None):
+        """Send message and track its acknowledgment without waiting
+
+        The message is registered as outstanding and the task carries on;
+        the ack reaper redelivers it or gives up if no ack arrives in time.
+        """
         message_id = str(uuid.uuid4())
         message['message_id'] = message_id
         message['requires_ack'] = True
@@ -34,25 +41,24 @@ class MessageQueue:
         # Send the message
         self.sse_service.queue_message(task_id, message)
         
-        # Wait for acknowledgment
-        start_time = time.time()
-        check_interval = 0.1  # Check every 100ms
-        
-        while time.time() - start_time < timeout:
-            if self.redis_service.get_message_ack(task_id, message_id):
-                logger.debug(f"Message {message_id} acknowledged")
-                return message_id
-            
-            # Check if task was cancelled during wait
-            if self.redis_service.is_task_cancelled(task_id):
-                logger.info(f"Task {task_id} cancelled while waiting for ack")
-                return None
-            
-            time.sleep(check_interval)
+        # Track the acknowledgment for the reaper
+        timeout = timeout or current_app.config.get('ACK_TIMEOUT', 10)
+        self.redis_service.track_pending_ack(task_id, message_id, {
+            'message': message,
+            'deliveries': 1,
+            'timeout': timeout
+        }, time.time() + timeout)
+        ack_reaper.ensure_started(current_app._get_current_object())
         
-        # Timeout reached
-        logger.warning(f"Message {message_id} acknowledgment timeout after {timeout}s")
-        return message_id  # Return anyway, don't block the task
+        return message_id
+    
+    def build_batch_update(self, task_id, message_type, **kwargs):
+        """Build a batch-related update message without sending it"""
+        return {
+            'type': message_type,
+            'task_id': task_id,
+            **kwargs
+        }
     
     def send_batch_update(self, task_id, message_type, **kwargs):
         """Send batch-related updates with appropriate acknowledgment requirements"""
@@ -64,12 +70,90 @@ class MessageQueue:
             'batch_started'
         }
         
-        message = {
-            'type': message_type,
-            task_id: task_id,
-            **kwargs
-        }
+        message = self.build_batch_update(task_id, message_type, **kwargs)
         
         requires_ack = message_type in critical_messages
         
-        return self.send_message(task_id, message, requires_ack=requires_ack)
\ No newline at end of file
+        return self.send_message(task_id, message, requires_ack=requires_ack)
+
+    def send_batch_update_in_order(self, task_id, position, message_type, **kwargs):
+        """Send a batch update only after every update before ``position``
+
+        Tests of a parallel batch finish in any order. Their updates are
+        staged in Redis and released strictly by position by whichever
+        worker holds the ordering lock; a worker that finds the lock taken
+        leaves its update to the holder, which re-checks after releasing.
+        """
+        self.redis_service.stage_ordered_message(task_id, position, {
+            'message_type': message_type,
+            'kwargs': kwargs
+        })
+        
+        lock = f'ordered_{task_id}'
+        while self.redis_service.has_ready_ordered_message(task_id):
+            if not self.redis_service.acquire_lock(lock, ttl=30):
+                return
+            try:
+                entry = self.redis_service.pop_ordered_message(task_id)
+                while entry is not None:
+                    self.send_batch_update(task_id, entry['message_type'], **entry['kwargs'])
+                    entry = self.redis_service.pop_ordered_message(task_id)
+            finally:
+                self.redis_service.release_lock(lock)
+
+class AckReaper:
+    """Redeliver or expire overdue acknowledgments in the background"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+    
+    def ensure_started(self, app):
+        """Start the reaper thread once per process (again after a fork)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, args=(app,), daemon=True,
+                                            name='ack-reaper')
+            self._thread.start()
+    
+    def _run(self, app):
+        """Periodically handle overdue acknowledgments"""
+        with app.app_context():
+            redis_service = RedisService()
+            sse_service = SSEService()
+            interval = app.config.get('ACK_REAPER_INTERVAL', 1)
+            
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reap(redis_service, sse_service,
+                              app.config.get('ACK_MAX_DELIVERIES', 3))
+                except Exception as e:
+                    logger.warning(f"Ack reaper failed: {e}")
+    
+    def reap(self, redis_service, sse_service, max_deliveries):
+        """Redeliver overdue messages, giving up after ``max_deliveries``"""
+        now = time.time()
+        for task_id, message_id in redis_service.claim_overdue_acks(now):
+            entry = redis_service.get_pending_ack(task_id, message_id)
+            if entry is None:
+                continue  # Acknowledged or cleaned up meanwhile
+            
+            if entry['deliveries'] >= max_deliveries or redis_service.is_task_cancelled(task_id):
+                logger.warning(
+                    f"Message {message_id} for task {task_id} not acknowledged "
+                    f"after {entry['deliveries']} deliveries"
+                )
+                redis_service.drop_pending_ack(task_id, message_id)
+                continue
+            
+            entry['deliveries'] += 1
+            logger.debug(f"Redelivering message {message_id} for task {task_id} "
+                         f"(attempt {entry['deliveries']})")
+            sse_service.queue_message(task_id, {**entry['message'], 'redelivery': True})
+            redis_service.track_pending_ack(task_id, message_id, entry, now + entry['timeout'])
+
+ack_reaper = AckReaper()
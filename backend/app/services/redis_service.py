@@ -1,96 +1,702 @@
 # app/services/redis_service.py - Enhanced with acknowledgment support
 """Redis service for data storage and retrieval with message acknowledgment support"""
-from app.extensions import redis_client
+from app.extensions import redis_client, redis_binary_client
+from app.services.series import SERIES_FIELDS, build_pyramid, pyramid_meta
+from app.services import sse_encoding
+from app.utils.events import coalesce_key
+from app.utils.serialization import encode_payload, decode_payload
 from flask import current_app
 import json
 import time
 
+# Append one event to a task stream and keep the stream within its queue
+# policy. KEYS: stream, progress index, stats hash. ARGV: payload, progress
+# line ('' if the event isn't progress), policy, max progress events, min
+# id of unexpired events, TTL. Returns the new event id.
+APPEND_SSE_EVENT_SCRIPT = """
+local stream, index, stats = KEYS[1], KEYS[2], KEYS[3]
+local line, policy, ttl = ARGV[2], ARGV[3], tonumber(ARGV[6])
+local id = redis.call('XADD', stream, '*', 'data', ARGV[1])
+
+local expired = redis.call('XTRIM', stream, 'MINID', ARGV[5])
+if expired > 0 then
+    redis.call('HINCRBY', stats, 'expired', expired)
+end
+
+local stale = {}
+if line ~= '' then
+    if policy == 'latest_progress' then
+        local previous = redis.call('HGET', index, line)
+        redis.call('HSET', index, line, id)
+        if previous then
+            stale = {previous}
+        end
+    else
+        local excess = redis.call('RPUSH', index, id) - tonumber(ARGV[4])
+        if excess > 0 then
+            stale = redis.call('LRANGE', index, 0, excess - 1)
+            redis.call('LTRIM', index, excess, -1)
+        end
+    end
+    redis.call('EXPIRE', index, ttl)
+end
+if #stale > 0 then
+    local dropped = redis.call('XDEL', stream, unpack(stale))
+    if dropped > 0 then
+        redis.call('HINCRBY', stats, 'dropped', dropped)
+    end
+end
+
+redis.call('EXPIRE', stream, ttl)
+return id
+"""
+
 class RedisService:
     """Handle Redis operations"""
     
+    # Pub/sub channel carrying the ids of cancelled tasks
+    CANCEL_CHANNEL = 'task_cancellations'
+    
+    # Sorted set of outstanding acknowledgments scored by deadline
+    ACK_DEADLINES_KEY = 'ack_deadlines'
+    
+    # Hash counting SSE events dropped by the queue policy or expired
+    SSE_QUEUE_STATS_KEY = 'sse_queue_stats'
+    
+    SSE_QUEUE_POLICIES = ('keep_terminal', 'latest_progress')
+    
+    # Keys of a task's SSE queue, which expire on SSE_REDIS_QUEUE_TTL
+    SSE_QUEUE_KEY_PREFIXES = ('sse_events_', 'sse_progress_')
+    
     def __init__(self):
         self.redis = redis_client
+        # Reads of codec-encoded values need a connection that returns bytes
+        self.binary = redis_binary_client
+        self._append_script = None
+    
+    def _encode(self, family, value):
+        """Serialize a value with the codec configured for its key family"""
+        config = current_app.config
+        default = config.get('REDIS_CODEC_DEFAULT', 'json')
+        codec = config.get('REDIS_CODECS', {}).get(family, default)
+        return encode_payload(value, codec)
+    
+    def _track_keys(self, pipe, task_id, *keys):
+        """Queue registration of keys owned by a task on ``pipe``
+
+        Every key a task writes is listed in ``task_keys_{task_id}``, so
+        cleanup can unlink exactly those keys without scanning the keyspace.
+        """
+        registry = f'task_keys_{task_id}'
+        pipe.sadd(registry, *keys)
+        pipe.expire(registry, current_app.config['RESULT_EXPIRY_SECONDS'])
+    
+    def _store_value(self, task_id, family, value):
+        """Store an encoded value owned by a task and register its key"""
+        key = f'{family}_{task_id}'
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(key, self._encode(family, value), ex=current_app.config['RESULT_EXPIRY_SECONDS'])
+        self._track_keys(pipe, task_id, key)
+        pipe.execute()
         
     def store_task_metadata(self, task_id, metadata):
         """Store task metadata"""
-        key = f'task_meta_{task_id}'
-        self.redis.set(key, json.dumps(metadata), 
-                      ex=current_app.config['RESULT_EXPIRY_SECONDS'])
+        self._store_value(task_id, 'task_meta', metadata)
     
     def get_task_metadata(self, task_id):
         """Get task metadata"""
-        data = self.redis.get(f'task_meta_{task_id}')
-        return json.loads(data) if data else None
+        return decode_payload(self.binary.get(f'task_meta_{task_id}'))
     
     def update_task_progress(self, task_id, progress):
         """Update task progress"""
-        key = f'progress_{task_id}'
-        self.redis.set(key, json.dumps(progress),
-                      ex=current_app.config['RESULT_EXPIRY_SECONDS'])
+        self._store_value(task_id, 'progress', progress)
     
     def get_task_progress(self, task_id):
         """Get task progress"""
-        data = self.redis.get(f'progress_{task_id}')
-        return json.loads(data) if data else None
+        return decode_payload(self.binary.get(f'progress_{task_id}'))
+    
+    @staticmethod
+    def test_progress_key(task_id, test_index):
+        """Name of the key holding the progress of one test of a parallel batch"""
+        return f'progress_{task_id}_{test_index}'
+    
+    def get_batch_tests_progress(self, task_id, total_tests):
+        """Progress of each test of a parallel batch, by test index
+
+        Only tests that reported any progress are included.
+        """
+        keys = [self.test_progress_key(task_id, test_index) for test_index in range(total_tests)]
+        values = self.binary.mget(keys) if keys else []
+        return {test_index: decode_payload(value)
+                for test_index, value in enumerate(values) if value is not None}
     
     def store_task_results(self, task_id, results):
-        """Store final task results"""
+        """Store final task results
+
+        Every other key the task registered then expires with them: series,
+        pyramids and batch data written early in a long run would otherwise
+        expire before the results that refer to them. The SSE queue keeps
+        its own ``SSE_REDIS_QUEUE_TTL``.
+        """
         key = f'results_{task_id}'
-        self.redis.set(key, json.dumps(results),
-                      ex=current_app.config['RESULT_EXPIRY_SECONDS'])
+        expiry = current_app.config['RESULT_EXPIRY_SECONDS']
+        owned = self.redis.smembers(f'task_keys_{task_id}')
+        
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(key, self._encode('results', results), ex=expiry)
+        for owned_key in owned:
+            if not owned_key.startswith(self.SSE_QUEUE_KEY_PREFIXES):
+                pipe.expire(owned_key, expiry)
+        self._track_keys(pipe, task_id, key)
+        pipe.execute()
     
-    def get_task_results(self, task_id):
-        """Get task results"""
-        data = self.redis.get(f'results_{task_id}')
-        return json.loads(data) if data else None
+    def get_task_results(self, task_id, with_series=True):
+        """Get task results, with their plot series read back from Redis
+
+        Pass ``with_series=False`` to skip the series, e.g. when they are
+        going to be streamed with ``iter_series``.
+        """
+        results = decode_payload(self.binary.get(f'results_{task_id}'))
+        if results is not None and with_series:
+            self.attach_series_plots(task_id, results)
+        return results
     
-    def queue_sse_message(self, task_id, message):
-        """Queue SSE message for streaming"""
-        key = f'sse_queue_{task_id}'
-        self.redis.rpush(key, json.dumps(message))
-        self.redis.expire(key, current_app.config['SSE_REDIS_QUEUE_TTL'])
-    
-    def get_sse_message(self, task_id, timeout=1):
-        """Get SSE message from queue (blocking)"""
-        key = f'sse_queue_{task_id}'
-        message = self.redis.blpop(key, timeout=timeout)
-        if message:
-            return json.loads(message[1])
+    def get_partial_results(self, task_id):
+        """Get the series persisted so far by a task that has not finished"""
+        plots = self.get_series_plots(task_id)[0]
+        if not plots:
+            return None
+        progress = self.get_task_progress(task_id) or {}
+        return {'status': progress.get('status', 'running'), 'partial': True,
+                'complete_plots': plots}
+    
+    def record_iteration(self, task_id, progress, messages=(), points=None, test_index=None,
+                         test_progress=False):
+        """Write one iteration's SSE messages, points and progress in a single round trip
+
+        Queues ``messages`` for streaming, appends ``points`` (a point per
+        series name) to the task's series and stores ``progress`` through one
+        pipeline. With ``test_progress`` the progress is the test's own (see
+        ``test_progress_key``), as tests of a parallel batch run at once.
+        Cancellation is pushed to workers (see CancellationListener), so it is
+        not read here.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        
+        if messages:
+            self._append_sse_events(pipe, task_id, messages)
+        
+        if points:
+            self._append_series_points(pipe, task_id, points, test_index)
+        
+        if test_progress:
+            progress_key = self.test_progress_key(task_id, test_index)
+        else:
+            progress_key = f'progress_{task_id}'
+        pipe.set(progress_key, self._encode('progress', progress),
+                 ex=current_app.config['RESULT_EXPIRY_SECONDS'])
+        self._track_keys(pipe, task_id, progress_key)
+        pipe.execute()
+    
+    @staticmethod
+    def response_cache_key(task_id, variant, encoding):
+        """Name of the key caching one rendering of a task's results"""
+        return f'response_cache_{task_id}_{variant}_{encoding or "identity"}'
+    
+    def get_cached_response(self, task_id, variant, encoding):
+        """``(encoding, body)`` of a cached rendering of completed results, or None
+
+        Looks up ``encoding`` and the uncompressed rendering in one MGET;
+        ``encoding`` of the match is None when it's the uncompressed one.
+        A client accepting ``encoding`` only gets an uncompressed body small
+        enough to be sent that way anyway (large ones are cached
+        uncompressed for clients that don't accept compression).
+        """
+        encodings = [encoding, None] if encoding else [None]
+        bodies = self.binary.mget([self.response_cache_key(task_id, variant, candidate)
+                                   for candidate in encodings])
+        threshold = current_app.config.get('COMPRESSION_THRESHOLD', 50000)
+        for candidate, body in zip(encodings, bodies):
+            if body is None or (encoding and candidate is None and len(body) > threshold):
+                continue
+            return candidate, body
         return None
     
+    def cache_response(self, task_id, variant, encoding, body):
+        """Cache a rendering of completed results (they never change)"""
+        key = self.response_cache_key(task_id, variant, encoding)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(key, body, ex=current_app.config['RESULT_EXPIRY_SECONDS'])
+        self._track_keys(pipe, task_id, key)
+        pipe.execute()
+    
+    @staticmethod
+    def series_key(task_id, name, test_index=None):
+        """Name of the list holding one series of a task (or of one batch test)"""
+        scope = task_id if test_index is None else f'{task_id}_{test_index}'
+        return f'series_{scope}_{name}'
+    
+    def _append_series_points(self, pipe, task_id, points, test_index=None):
+        """Queue RPUSHes of one row per series on ``pipe``"""
+        keys = []
+        for name, point in points.items():
+            key = self.series_key(task_id, name, test_index)
+            pipe.rpush(key, self._encode('series', [point[field] for field in SERIES_FIELDS[name]]))
+            pipe.expire(key, current_app.config['RESULT_EXPIRY_SECONDS'])
+            keys.append(key)
+        self._track_keys(pipe, task_id, *keys)
+    
+    @staticmethod
+    def _rows_to_columns(name, rows):
+        """Convert stored rows of a series into one list per field"""
+        fields = SERIES_FIELDS[name]
+        columns = {field: [] for field in fields}
+        for row in rows:
+            for field, value in zip(fields, decode_payload(row)):
+                columns[field].append(value)
+        return columns
+    
+    def get_series(self, task_id, name, start=0, end=None, test_index=None):
+        """Read points ``start:end`` of a series as columns"""
+        if end is not None and end <= start:
+            return self._rows_to_columns(name, [])
+        rows = self.binary.lrange(self.series_key(task_id, name, test_index),
+                                  start, -1 if end is None else end - 1)
+        return self._rows_to_columns(name, rows)
+    
+    def iter_series(self, task_id, name, test_index=None, chunk_size=1000):
+        """Yield a series as column chunks of at most ``chunk_size`` points
+
+        Reads one LRANGE window at a time, so memory stays bounded however
+        long the series is.
+        """
+        key = self.series_key(task_id, name, test_index)
+        start = 0
+        while True:
+            rows = self.binary.lrange(key, start, start + chunk_size - 1)
+            if rows:
+                yield self._rows_to_columns(name, rows)
+            if len(rows) < chunk_size:
+                return
+            start += chunk_size
+    
+    def get_series_length(self, task_id, name, test_index=None):
+        """Number of points persisted for a series"""
+        return self.redis.llen(self.series_key(task_id, name, test_index))
+    
+    def get_series_plots(self, task_id, test_indexes=(None,)):
+        """Read every series of a task (or of several batch tests) in one round trip
+
+        Returns one plots dict per entry of ``test_indexes``, holding only
+        the series that have points.
+        """
+        pipe = self.binary.pipeline(transaction=False)
+        for test_index in test_indexes:
+            for name in SERIES_FIELDS:
+                pipe.lrange(self.series_key(task_id, name, test_index), 0, -1)
+        rows = iter(pipe.execute())
+        
+        return [{name: self._rows_to_columns(name, series_rows)
+                 for name, series_rows in zip(SERIES_FIELDS, rows) if series_rows}
+                for _ in test_indexes]
+    
+    @staticmethod
+    def pyramid_key(task_id, name, test_index=None):
+        """Name of the hash holding a series' level-of-detail pyramid"""
+        scope = task_id if test_index is None else f'{task_id}_{test_index}'
+        return f'lod_{scope}_{name}'
+    
+    def store_series_pyramids(self, task_id, plots, test_index=None):
+        """Precompute and store the pyramid of every series in ``plots``
+
+        Each pyramid is a hash with a small ``meta`` field and one field per
+        level, so range queries read only the level they need.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        keys = []
+        for name, series in plots.items():
+            levels = build_pyramid(name, series)
+            key = self.pyramid_key(task_id, name, test_index)
+            mapping = {'meta': self._encode('series', pyramid_meta(name, series, levels))}
+            mapping.update({str(level + 1): self._encode('series', data)
+                            for level, data in enumerate(levels)})
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, current_app.config['RESULT_EXPIRY_SECONDS'])
+            keys.append(key)
+        self._track_keys(pipe, task_id, *keys)
+        pipe.execute()
+    
+    def get_series_pyramid_meta(self, task_id, name, test_index=None):
+        """Get a pyramid's summary, or None if it hasn't been built"""
+        return decode_payload(self.binary.hget(self.pyramid_key(task_id, name, test_index), 'meta'))
+    
+    def get_series_pyramid_level(self, task_id, name, level, test_index=None):
+        """Get one aggregated level of a pyramid (level 1 and up)"""
+        key = self.pyramid_key(task_id, name, test_index)
+        return decode_payload(self.binary.hget(key, str(level)))
+    
+    def attach_series_plots(self, task_id, results):
+        """Fill ``complete_plots`` of stored results (or batch test results) from the series
+
+        Results keep only the plots that are not persisted per iteration;
+        anything stored inline (results written before series existed) wins.
+        """
+        test_results = results.get('test_results')
+        if test_results is None:
+            targets, test_indexes = [results], [None]
+        else:
+            targets, test_indexes = test_results, [r.get('test_index') for r in test_results]
+        
+        for target, plots in zip(targets, self.get_series_plots(task_id, test_indexes)):
+            target['complete_plots'] = {**plots, **target.get('complete_plots', {})}
+        return results
+    
+    @staticmethod
+    def sse_events_key(task_id):
+        """Name of the task's SSE event stream"""
+        return f'sse_events_{task_id}'
+    
+    @staticmethod
+    def decode_sse_events(entries):
+        """Convert raw stream entries into ``(event_id, message)`` tuples"""
+        events = []
+        for event_id, fields in entries:
+            data = fields[b'data'] if b'data' in fields else fields['data']
+            if isinstance(event_id, bytes):
+                event_id = event_id.decode()
+            events.append((event_id, decode_payload(data)))
+        return events
+    
+    @staticmethod
+    def sse_progress_key(task_id, policy):
+        """Name of the index of a task's progress events kept under ``policy``"""
+        return f'sse_progress_{task_id}_{policy}'
+    
+    @classmethod
+    def sse_append_arguments(cls, config, task_id, message, payload):
+        """Keys and arguments of ``APPEND_SSE_EVENT_SCRIPT`` for one event
+
+        ``payload`` is ``message`` encoded with the ``sse`` codec. Shared with
+        the asyncio tier, which appends through the same script.
+        """
+        policy = config.get('SSE_QUEUE_POLICY', 'keep_terminal')
+        if policy not in cls.SSE_QUEUE_POLICIES:
+            raise ValueError(f'Unknown SSE queue policy: {policy}')
+        
+        line = coalesce_key(message)
+        ttl = config['SSE_REDIS_QUEUE_TTL']
+        keys = [cls.sse_events_key(task_id), cls.sse_progress_key(task_id, policy),
+                cls.SSE_QUEUE_STATS_KEY]
+        args = [payload, '' if line is None else json.dumps(line), policy,
+                config['SSE_STREAM_MAXLEN'], int((time.time() - ttl) * 1000), ttl]
+        return keys, args
+    
+    def _append_sse_events(self, pipe, task_id, messages):
+        """Queue appends of ``messages`` to the task's event stream
+
+        The stream stays bounded by the queue policy (``SSE_QUEUE_POLICY``):
+
+        - ``keep_terminal``: at most ``SSE_STREAM_MAXLEN`` progress events,
+          dropping the oldest; every other event is kept
+        - ``latest_progress``: only the newest progress event of each
+          progress line (see ``coalesce_key``)
+
+        and events older than ``SSE_REDIS_QUEUE_TTL`` expire. Each append
+        runs as one script, so the progress index lives in Redis beside the
+        stream and every worker sees the same bound. The first results of
+        the pipeline are the new event ids.
+        """
+        if self._append_script is None:
+            self._append_script = self.redis.register_script(APPEND_SSE_EVENT_SCRIPT)
+        
+        for message in messages:
+            keys, args = self.sse_append_arguments(current_app.config, task_id, message,
+                                                   self._encode('sse', message))
+            self._append_script(keys=keys, args=args, client=pipe)
+        # The stream and its progress index
+        self._track_keys(pipe, task_id, *keys[:2])
+    
+    def queue_sse_message(self, task_id, message):
+        """Append SSE message to the task's event stream
+
+        Returns the stream id of the new event, which is used as the SSE
+        event id.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        self._append_sse_events(pipe, task_id, [message])
+        return pipe.execute()[0]
+    
+    def get_sse_queue_stats(self):
+        """Counts of SSE events dropped by the queue policy and expired"""
+        stats = self.redis.hgetall(self.SSE_QUEUE_STATS_KEY)
+        return {name: int(stats.get(name, 0)) for name in ('dropped', 'expired')}
+    
+    def get_sse_events(self, task_id, last_event_id='0-0', timeout=1, count=100):
+        """Read events newer than ``last_event_id`` (blocking)
+
+        Events stay in the stream, so reconnecting or additional clients can
+        replay them. Returns a list of ``(event_id, message)`` tuples.
+        """
+        key = self.sse_events_key(task_id)
+        response = self.binary.xread({key: last_event_id}, count=count,
+                                    block=int(timeout * 1000) if timeout else None)
+        if not response:
+            return []
+        
+        _, entries = response[0]
+        return self.decode_sse_events(entries)
+    
+    def get_last_sse_event_id(self, task_id):
+        """Get the id of the newest event in the task's stream"""
+        newest = self.binary.xrevrange(self.sse_events_key(task_id), count=1)
+        entries = self.decode_sse_events(newest)
+        return entries[0][0] if entries else '0-0'
+    
+    def get_sse_dictionary(self):
+        """Zstd dictionary for SSE payloads, trained by the first process that needs it"""
+        data = self.binary.get(sse_encoding.DICTIONARY_KEY)
+        if data is None:
+            self.binary.set(sse_encoding.DICTIONARY_KEY, sse_encoding.train_dictionary(), nx=True)
+            data = self.binary.get(sse_encoding.DICTIONARY_KEY)
+        return data
+    
+    @staticmethod
+    def batch_state_key(task_id):
+        """Name of the hash holding a batch's counters and fields"""
+        return f'batch_state_{task_id}'
+    
+    def init_batch_state(self, task_id, fields):
+        """Create a batch's state hash
+
+        Each field is JSON-encoded on its own, so integers stay valid
+        HINCRBY targets and updates touch only the fields that change.
+        """
+        key = self.batch_state_key(task_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(key)
+        pipe.hset(key, mapping={field: encode_payload(value) for field, value in fields.items()})
+        pipe.expire(key, current_app.config['RESULT_EXPIRY_SECONDS'])
+        self._track_keys(pipe, task_id, key)
+        pipe.execute()
+    
+    def update_batch_state(self, task_id, **fields):
+        """Set fields of a batch's state hash, restarting its expiry"""
+        key = self.batch_state_key(task_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, mapping={field: encode_payload(value) for field, value in fields.items()})
+        pipe.expire(key, current_app.config['RESULT_EXPIRY_SECONDS'])
+        self._track_keys(pipe, task_id, key)
+        pipe.execute()
+    
+    def get_batch_state(self, task_id):
+        """Get a batch's state hash as a dict (empty if there is none)"""
+        return {field: decode_payload(value)
+                for field, value in self.redis.hgetall(self.batch_state_key(task_id)).items()}
+    
+    @staticmethod
+    def batch_test_key(task_id, test_index):
+        """Name of the key holding one test's result in a batch"""
+        return f'batch_test_{task_id}_{test_index}'
+    
+    def store_batch_test_result(self, task_id, test_index, result):
+        """Store one test's result and count it as completed
+
+        Each result has its own key and the completion count is an atomic
+        HINCRBY, so the write cost doesn't grow with the batch and tests of a
+        parallel batch can finish in any order. Returns the number of
+        completed tests.
+        """
+        key = self.batch_test_key(task_id, test_index)
+        state_key = self.batch_state_key(task_id)
+        expiry = current_app.config['RESULT_EXPIRY_SECONDS']
+        
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(key, self._encode('results', result), ex=expiry)
+        pipe.hincrby(state_key, 'completed_tests', 1)
+        pipe.expire(state_key, expiry)
+        self._track_keys(pipe, task_id, key, state_key)
+        return pipe.execute()[1]
+    
+    def get_batch_test_result(self, task_id, test_index):
+        """Get the stored result of one completed test of a batch"""
+        return decode_payload(self.binary.get(self.batch_test_key(task_id, test_index)))
+    
+    def get_batch_test_results(self, task_id, total_tests):
+        """Get the stored results of a batch's completed tests, in test order"""
+        if not total_tests:
+            return []
+        values = self.binary.mget([self.batch_test_key(task_id, i) for i in range(total_tests)])
+        return [decode_payload(value) for value in values if value is not None]
+    
+    def acquire_lock(self, name, ttl):
+        """Take a short-lived lock; returns whether it was acquired"""
+        return bool(self.redis.set(f'lock_{name}', '1', nx=True, px=int(ttl * 1000)))
+    
+    def release_lock(self, name):
+        """Release a lock taken with ``acquire_lock``"""
+        self.redis.delete(f'lock_{name}')
+    
+    def stage_ordered_message(self, task_id, position, entry):
+        """Hold a message until every message before ``position`` is released"""
+        key = f'ordered_{task_id}'
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, position, self._encode('sse', entry))
+        pipe.expire(key, current_app.config['RESULT_EXPIRY_SECONDS'])
+        self._track_keys(pipe, task_id, key, f'ordered_next_{task_id}')
+        pipe.execute()
+    
+    def has_ready_ordered_message(self, task_id):
+        """Check whether the next message in order has been staged"""
+        position = int(self.redis.get(f'ordered_next_{task_id}') or 0)
+        return bool(self.redis.hexists(f'ordered_{task_id}', position))
+    
+    def pop_ordered_message(self, task_id):
+        """Take the next staged message in order, or None if it isn't ready
+
+        Only call this while holding the task's ordering lock.
+        """
+        position = int(self.redis.get(f'ordered_next_{task_id}') or 0)
+        entry = self.binary.hget(f'ordered_{task_id}', position)
+        if entry is None:
+            return None
+        
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hdel(f'ordered_{task_id}', position)
+        pipe.set(f'ordered_next_{task_id}', position + 1,
+                 ex=current_app.config['RESULT_EXPIRY_SECONDS'])
+        pipe.execute()
+        return decode_payload(entry)
+    
+    @staticmethod
+    def batch_failure_id(task_id):
+        """Cancellation id that stops the tests of a parallel batch once one fails
+
+        SSE streams don't watch it, so their clients see the batch's error
+        rather than a cancellation.
+        """
+        return f'{task_id}-failed'
+    
+    def fail_batch(self, task_id, test_index):
+        """Mark a parallel batch failed by one of its tests and stop the others
+
+        Returns True only for the first failure, the one to report. Updates
+        still staged for in-order release are dropped, as they would follow
+        the batch's terminal error.
+        """
+        key = self.batch_state_key(task_id)
+        if not self.redis.hsetnx(key, 'failed_test', encode_payload(test_index)):
+            return False
+        
+        failure_id = self.batch_failure_id(task_id)
+        marker = f'cancelled_{failure_id}'
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, mapping={'status': encode_payload('failed')})
+        pipe.delete(f'ordered_{task_id}')
+        pipe.set(marker, '1', ex=current_app.config['RESULT_EXPIRY_SECONDS'])
+        self._track_keys(pipe, task_id, marker)
+        pipe.publish(self.CANCEL_CHANNEL, failure_id)
+        pipe.execute()
+        return True
+    
     def is_task_cancelled(self, task_id):
         """Check if task is cancelled"""
         return self.redis.get(f'cancelled_{task_id}') is not None
     
+    def are_tasks_cancelled(self, task_ids):
+        """Check the cancellation markers of several tasks in one round trip"""
+        if not task_ids:
+            return []
+        return [flag is not None for flag in
+                self.redis.mget([f'cancelled_{task_id}' for task_id in task_ids])]
+    
     def mark_task_cancelled(self, task_id):
-        """Mark task as cancelled"""
-        self.redis.set(f'cancelled_{task_id}', '1', ex=60)
+        """Mark task as cancelled and notify listeners"""
+        self.mark_tasks_cancelled([task_id])
+    
+    def mark_tasks_cancelled(self, task_ids):
+        """Mark several tasks as cancelled and notify listeners in one pipeline
+
+        The marker key catches workers and streams that start watching after
+        the cancel; the publish reaches those already running.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for task_id in task_ids:
+            marker = f'cancelled_{task_id}'
+            pipe.set(marker, '1', ex=current_app.config['RESULT_EXPIRY_SECONDS'])
+            self._track_keys(pipe, task_id, marker)
+            pipe.publish(self.CANCEL_CHANNEL, task_id)
+        pipe.execute()
     
     def store_message_ack(self, task_id, message_id):
-        """Store message acknowledgment"""
-        key = f'ack_{task_id}_{message_id}'
-        self.redis.set(key, '1', ex=300)  # 5 minute expiry
+        """Store message acknowledgment and clear it from the pending set"""
+        key = f'acks_{task_id}'
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, message_id, '1')
+        pipe.expire(key, current_app.config['RESULT_EXPIRY_SECONDS'])
+        self._track_keys(pipe, task_id, key)
+        pipe.hdel(f'acks_pending_{task_id}', message_id)
+        pipe.zrem(self.ACK_DEADLINES_KEY, f'{task_id}:{message_id}')
+        pipe.execute()
     
     def get_message_ack(self, task_id, message_id):
         """Check if message has been acknowledged"""
-        key = f'ack_{task_id}_{message_id}'
-        return self.redis.get(key) is not None
+        return self.redis.hget(f'acks_{task_id}', message_id) is not None
+    
+    def track_pending_ack(self, task_id, message_id, entry, deadline):
+        """Record an outstanding acknowledgment and when it is due"""
+        key = f'acks_pending_{task_id}'
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, message_id, self._encode('acks', entry))
+        pipe.expire(key, current_app.config['RESULT_EXPIRY_SECONDS'])
+        self._track_keys(pipe, task_id, key)
+        pipe.zadd(self.ACK_DEADLINES_KEY, {f'{task_id}:{message_id}': deadline})
+        pipe.execute()
+    
+    def get_pending_ack(self, task_id, message_id):
+        """Get an outstanding acknowledgment entry"""
+        return decode_payload(self.binary.hget(f'acks_pending_{task_id}', message_id))
+    
+    def drop_pending_ack(self, task_id, message_id):
+        """Forget an outstanding acknowledgment"""
+        self.redis.hdel(f'acks_pending_{task_id}', message_id)
+    
+    def claim_overdue_acks(self, now, limit=100):
+        """Claim acknowledgments past their deadline
+
+        Each overdue entry is removed from the deadline index; only the caller
+        whose ZREM succeeds gets it, so concurrent reapers never handle the
+        same message twice. Returns ``(task_id, message_id)`` tuples.
+        """
+        members = self.redis.zrangebyscore(self.ACK_DEADLINES_KEY, '-inf', now,
+                                           start=0, num=limit)
+        if not members:
+            return []
+        
+        pipe = self.redis.pipeline(transaction=False)
+        for member in members:
+            pipe.zrem(self.ACK_DEADLINES_KEY, member)
+        
+        return [tuple(member.split(':', 1))
+                for member, removed in zip(members, pipe.execute()) if removed]
     
     def cleanup_task(self, task_id):
-        """Clean up all task-related data"""
-        keys_to_delete = [
+        """Clean up all task-related data
+
+        Unlinks the keys listed in the task's registry (plus the fixed key
+        names, for data written before the registry existed) in one command,
+        so the cost depends only on the task's own footprint.
+        """
+        registry = f'task_keys_{task_id}'
+        keys_to_delete = set(self.redis.smembers(registry))
+        keys_to_delete.update([
+            registry,
             f'task_meta_{task_id}',
             f'progress_{task_id}',
             f'results_{task_id}',
-            f'sse_queue_{task_id}',
-            f'cancelled_{task_id}'
-        ]
-        
-        # Also cleanup acknowledgment keys
-        ack_pattern = f'ack_{task_id}_*'
-        ack_keys = self.redis.keys(ack_pattern)
-        if ack_keys:
-            keys_to_delete.extend(ack_keys)
-        
-        for key in keys_to_delete:
-            self.redis.delete(key)
\ No newline at end of file
+            f'sse_events_{task_id}',
+            f'cancelled_{task_id}',
+            f'acks_{task_id}',
+            f'acks_pending_{task_id}'
+        ])
+        
+        self.redis.unlink(*keys_to_delete)
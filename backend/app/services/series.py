@@ -0,0 +1,330 @@
+# app/services/series.py
+"""Columnar storage of plot series
+
+Series are stored as one list per field (``{'x': [...], 'loss': [...]}``)
+instead of a list of point dicts, so field names are not repeated on every
+point. Converters at the API edge serve clients that still expect points.
+"""
+import base64
+import hashlib
+import numpy as np
+from app.services.data_processing import DataProcessor
+from app.utils.serialization import encode_payload
+
+# Fields of each plot series, in column order
+SERIES_FIELDS = {
+    'convergence': ('x', 'loss', 'val_loss'),
+    'accuracy': ('x', 'accuracy', 'precision', 'recall'),
+    'performance': ('time', 'throughput', 'memory', 'cpu'),
+}
+
+# Fields holding iteration numbers rather than measurements
+INTEGER_FIELDS = ('x', 'time')
+
+LAYOUTS = ('points', 'columnar', 'packed')
+PACKED_DTYPES = ('float32', 'float64')
+DOWNSAMPLERS = ('lttb', 'minmax')
+
+# Each level of a series pyramid aggregates this many points of the one below
+PYRAMID_FACTOR = 4
+
+class SeriesPoint:
+    """Read-only view of one point in a SeriesBuffer, indexable like a dict"""
+    __slots__ = ('buffer', 'index')
+
+    def __init__(self, buffer, index):
+        self.buffer = buffer
+        self.index = index
+
+    def __getitem__(self, field):
+        return self.buffer.data[field][self.index].item()
+
+    def keys(self):
+        return self.buffer.fields
+
+    def to_dict(self):
+        return {field: self[field] for field in self.buffer.fields}
+
+class SeriesBuffer:
+    """Preallocated, typed collector for one series of a running task
+
+    Points are stored in a NumPy structured array sized for the whole run,
+    so memory stays flat per point instead of one dict per iteration.
+    """
+    __slots__ = ('name', 'fields', 'data', 'length')
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.fields = SERIES_FIELDS[name]
+        self.data = np.zeros(capacity, dtype=[
+            (field, 'i8' if field in INTEGER_FIELDS else 'f8') for field in self.fields
+        ])
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('series index out of range')
+        return SeriesPoint(self, index)
+
+    def __iter__(self):
+        return (SeriesPoint(self, index) for index in range(self.length))
+
+    def append(self, point):
+        """Add a point (a dict of field values)"""
+        self.data[self.length] = tuple(point[field] for field in self.fields)
+        self.length += 1
+
+    def column(self, field):
+        """View of one field over the points appended so far"""
+        return self.data[field][:self.length]
+
+    def to_columnar(self):
+        """Copy the points into one list per field"""
+        return {field: self.column(field).tolist() for field in self.fields}
+
+def plot_buffers(capacity):
+    """One SeriesBuffer per plot series, sized for ``capacity`` iterations"""
+    return {name: SeriesBuffer(name, capacity) for name in SERIES_FIELDS}
+
+def to_columnar(series, fields):
+    """Convert a list of point dicts into one list per field"""
+    if isinstance(series, dict):
+        return series  # Already columnar
+    if isinstance(series, SeriesBuffer):
+        return series.to_columnar()
+    return {field: [point[field] for point in series] for field in fields}
+
+def to_points(series):
+    """Convert columns back into a list of point dicts"""
+    if not isinstance(series, dict):
+        return series  # Already points
+    fields = list(series)
+    return [dict(zip(fields, values)) for values in zip(*series.values())]
+
+def series_length(series):
+    """Number of points in a series of either layout"""
+    if isinstance(series, dict):
+        return len(next(iter(series.values()), []))
+    return len(series)
+
+def iter_rows(series, fields):
+    """Yield one tuple per point, in ``fields`` order"""
+    columns = to_columnar(series, fields)
+    return zip(*(columns[field] for field in fields))
+
+def slice_series(series, start, end):
+    """Take points ``start:end`` from a series of either layout"""
+    if isinstance(series, dict):
+        return {field: values[start:end] for field, values in series.items()}
+    return series[start:end]
+
+def pack(series, dtype='float64'):
+    """Pack columns into base64-encoded little-endian float arrays"""
+    if not isinstance(series, dict):
+        series = to_columnar(series, list(series[0]) if series else [])
+
+    packed_dtype = np.dtype(dtype).newbyteorder('<')
+    return {
+        'dtype': dtype,
+        'length': series_length(series),
+        'fields': {
+            field: base64.b64encode(np.asarray(values, dtype=packed_dtype).tobytes()).decode()
+            for field, values in series.items()
+        }
+    }
+
+def without_series(complete_plots):
+    """Drop the series persisted per iteration, keeping the rest of the plots"""
+    return {name: data for name, data in complete_plots.items() if name not in SERIES_FIELDS}
+
+def downsample_series(name, series, max_points, method='lttb'):
+    """Reduce a series to at most ``max_points`` points, keeping its shape
+
+    Each measurement field picks its own points from an equal share of the
+    budget and the union is kept, so a spike in any field survives.
+    """
+    fields = SERIES_FIELDS[name]
+    columns = to_columnar(series, fields)
+    if not max_points or series_length(columns) <= max_points:
+        return series
+
+    x = columns[fields[0]]
+    value_fields = fields[1:]
+    budget = max_points // len(value_fields)
+
+    keep = np.unique(np.concatenate([
+        DataProcessor.lttb_indices(x, columns[field], budget) if method == 'lttb'
+        else DataProcessor.minmax_indices(columns[field], budget)
+        for field in value_fields
+    ])).tolist()
+
+    return {field: [columns[field][i] for i in keep] for field in fields}
+
+def downsample_plots(complete_plots, max_points, method='lttb'):
+    """Downsample every known series of ``complete_plots``"""
+    if not complete_plots or not max_points:
+        return complete_plots
+    return {
+        name: downsample_series(name, data, max_points, method) if name in SERIES_FIELDS else data
+        for name, data in complete_plots.items()
+    }
+
+def build_pyramid(name, series, factor=PYRAMID_FACTOR):
+    """Aggregate a series into levels of ``factor``, ``factor**2``, ... points
+
+    Every level is columnar: the x field (``x`` or ``time``) and its ``_end``
+    column bound each bucket, ``count`` is its size, and each measurement
+    field has ``_min``, ``_max`` and ``_mean`` columns. The raw series itself
+    is level 0 and isn't repeated.
+    """
+    fields = SERIES_FIELDS[name]
+    columns = to_columnar(series, fields)
+    x = np.asarray(columns[fields[0]])
+    n = len(x)
+
+    levels = []
+    bucket = factor
+    while bucket < n:
+        starts = np.arange(0, n, bucket)
+        ends = np.append(starts[1:], n)
+        counts = ends - starts
+        level = {
+            fields[0]: x[starts].tolist(),
+            f'{fields[0]}_end': x[ends - 1].tolist(),
+            'count': counts.tolist()
+        }
+        for field in fields[1:]:
+            values = np.asarray(columns[field], dtype=float)
+            level[f'{field}_min'] = np.minimum.reduceat(values, starts).tolist()
+            level[f'{field}_max'] = np.maximum.reduceat(values, starts).tolist()
+            level[f'{field}_mean'] = (np.add.reduceat(values, starts) / counts).tolist()
+        levels.append(level)
+        bucket *= factor
+
+    return levels
+
+def pyramid_meta(name, series, levels, factor=PYRAMID_FACTOR):
+    """Summary of a pyramid used to pick a level without loading any"""
+    x = to_columnar(series, SERIES_FIELDS[name])[SERIES_FIELDS[name][0]]
+    return {
+        'length': len(x),
+        'x_first': x[0] if len(x) else None,
+        'x_last': x[-1] if len(x) else None,
+        'factors': [factor ** (level + 1) for level in range(len(levels))]
+    }
+
+def select_level(meta, x_from, x_to, max_points):
+    """Finest pyramid level expected to fit ``max_points`` points in a range
+
+    Assumes points are spread evenly over x, which holds for iteration
+    series; callers should step to a coarser level if the estimate is short.
+    """
+    length, x_first, x_last = meta['length'], meta['x_first'], meta['x_last']
+    if not length or x_last == x_first:
+        return 0
+
+    covered = (min(x_to, x_last) - max(x_from, x_first)) / (x_last - x_first)
+    span = max(covered, 0) * (length - 1) + 1
+    for level, factor in enumerate([1] + meta['factors']):
+        if span / factor <= max_points:
+            return level
+    return len(meta['factors'])
+
+def slice_range(series, x_from, x_to):
+    """Keep the points (or buckets) of a columnar series overlapping [x_from, x_to]"""
+    x_field = next(iter(series))
+    x = np.asarray(series[x_field])
+    x_end = np.asarray(series.get(f'{x_field}_end', series[x_field]))
+    keep = np.flatnonzero((x_end >= x_from) & (x <= x_to)).tolist()
+    return {field: [values[i] for i in keep] for field, values in series.items()}
+
+def plot_params(args, default_max_points=None):
+    """Read plot rendering options from (validated) query parameters"""
+    max_points = args.get('max_points')
+    return {
+        'layout': args.get('layout', 'points'),
+        'dtype': args.get('dtype', 'float64'),
+        'max_points': int(max_points) if max_points else default_max_points,
+        'downsample': args.get('downsample', 'lttb')
+    }
+
+def content_hash(complete_plots):
+    """SHA-256 of a run's complete plots, identifying them in result references"""
+    return hashlib.sha256(encode_payload(complete_plots)).hexdigest()
+
+def plots_variant(params, test_index=None):
+    """Name of one rendering of a run's plots, used in cache keys and ETags"""
+    variant = '-'.join(str(params[name])
+                       for name in ('layout', 'dtype', 'max_points', 'downsample'))
+    return variant if test_index is None else f'{variant}-t{test_index}'
+
+def plots_etag(plots_hash, params):
+    """Opaque tag of plots rendered with ``params``
+
+    Used as a weak ETag: the JSON is the same whatever Content-Encoding it
+    is sent with.
+    """
+    return f'{plots_hash[:16]}-{plots_variant(params)}'
+
+def result_reference(task_id, plots_hash, test_index=None, max_points=None):
+    """Where a completed run's plots can be fetched, for completion events
+
+    The URL carries the content hash, so it names one immutable result,
+    and ``etag`` matches what the URL serves with default parameters
+    (downsampled to ``max_points``, the ``MAX_PLOT_POINTS`` setting).
+    """
+    query = f'v={plots_hash[:16]}'
+    if test_index is not None:
+        query = f'test_index={test_index}&{query}'
+    return {
+        'url': f'/api/results/{task_id}/plots?{query}',
+        'content_hash': f'sha256:{plots_hash}',
+        'etag': f'W/"{plots_etag(plots_hash, plot_params({}, max_points))}"'
+    }
+
+def render_plots(complete_plots, layout='points', dtype='float64', max_points=None,
+                 downsample='lttb'):
+    """Downsample stored plots and render them in the client's layout"""
+    return apply_layout(downsample_plots(complete_plots, max_points, downsample), layout, dtype)
+
+def columnar_plots(complete_plots):
+    """Convert every known series of ``complete_plots`` to columns"""
+    return {
+        name: to_columnar(data, SERIES_FIELDS[name]) if name in SERIES_FIELDS else data
+        for name, data in complete_plots.items()
+    }
+
+def apply_layout(complete_plots, layout='points', dtype='float64'):
+    """Render stored plots in the layout a client asked for"""
+    if not complete_plots or layout == 'columnar':
+        return complete_plots
+
+    convert = to_points if layout == 'points' else (lambda series: pack(series, dtype))
+    return {
+        name: convert(data) if name in SERIES_FIELDS else data
+        for name, data in complete_plots.items()
+    }
+
+def apply_layout_to_message(message, layout='points', dtype='float64', max_points=None,
+                            downsample='lttb'):
+    """Render any plots embedded in an SSE message"""
+    if layout == 'columnar' and not max_points:
+        return message
+
+    options = (layout, dtype, max_points, downsample)
+    if 'complete_plots' in message:
+        message = {**message, 'complete_plots': render_plots(message['complete_plots'], *options)}
+
+    test_result = message.get('test_result')
+    if isinstance(test_result, dict) and 'complete_plots' in test_result:
+        message = {**message, 'test_result': {
+            **test_result,
+            'complete_plots': render_plots(test_result['complete_plots'], *options)
+        }}
+
+    return message
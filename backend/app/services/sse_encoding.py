@@ -0,0 +1,198 @@
+# app/services/sse_encoding.py
+"""Per-stream encodings of SSE payloads
+
+A client picks the encoding of its stream when it connects (``?encoding=``):
+
+- ``json``: every event is the full JSON message (the default)
+- ``delta``: after the first event of a type, events carry a JSON merge
+  patch (RFC 7386) against the previous event of that type, as
+  ``{"type": ..., "$delta": {...}}``
+- ``zstd``: every event is a base64-encoded zstd frame, compressed with a
+  dictionary trained on our own event shapes (see ``/api/sse/dictionary``)
+- ``delta+zstd``: deltas, then dictionary compression
+
+Encoders live as long as one connection, so a reconnecting client gets
+full events again before any delta.
+"""
+import base64
+import functools
+import json
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SSE_ENCODINGS = ('json', 'delta', 'zstd', 'delta+zstd')
+
+# Redis key of the shared dictionary; every process must compress with the
+# dictionary clients download, so the first one to train it wins
+DICTIONARY_KEY = 'sse_zstd_dictionary'
+DICTIONARY_SIZE = 4096
+ZSTD_LEVEL = 3
+
+def encoding_available(encoding):
+    """Whether a stream encoding can be produced in this environment"""
+    return 'zstd' not in encoding or zstandard is not None
+
+def _has_null_member(value):
+    if isinstance(value, dict):
+        return any(item is None or _has_null_member(item) for item in value.values())
+    return False
+
+def _same(old, new):
+    # 1 == 1.0 == True in Python, but not once they are JSON
+    return type(old) is type(new) and old == new
+
+def merge_patch(previous, current):
+    """Merge patch turning ``previous`` into ``current``
+
+    Returns None when a patch can't express the change: a merge patch uses
+    null to delete members, so it can't set one to null.
+    """
+    patch = {key: None for key in previous.keys() - current.keys()}
+    for key, value in current.items():
+        old = previous.get(key)
+        if key in previous and _same(old, value):
+            continue
+        if value is None:
+            return None
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested = merge_patch(old, value)
+            if nested is None:
+                return None
+            patch[key] = nested
+        elif _has_null_member(value):
+            return None
+        else:
+            patch[key] = value
+    return patch
+
+def apply_merge_patch(target, patch):
+    """Apply a merge patch to a message (what delta clients do)"""
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
+
+def training_samples(seed=0):
+    """Events shaped like the ones our tasks send, to train the dictionary on
+
+    Both the full and the delta form of each event are included, so the
+    dictionary serves ``zstd`` and ``delta+zstd`` streams.
+    """
+    rng = np.random.default_rng(seed)
+
+    def task_id():
+        return '-'.join(rng.bytes(size).hex() for size in (4, 2, 2, 2, 6))
+
+    events = []
+    for _ in range(20):
+        task, total = task_id(), int(rng.integers(10, 200))
+        events.append({'type': 'connected', 'task_id': task})
+        events.append({'type': 'current_state', 'state': {
+            'current_iteration': 1, 'total_iterations': total, 'progress': 0, 'status': 'running'
+        }})
+        for i in range(1, 21):
+            progress = int(i / total * 100)
+            events.append({'type': 'plot_update', 'iteration': i, 'total_iterations': total,
+                           'progress': progress})
+            events.append({'type': 'test_iteration_update', 'task_id': task,
+                           'test_index': i % 4, 'iteration': i, 'total_iterations': total,
+                           'test_progress': progress})
+
+        plots_hash = rng.bytes(32).hex()
+        metrics = {'final_loss': float(rng.uniform(0, 10)),
+                   'final_accuracy': float(rng.uniform(50, 95)),
+                   'avg_throughput': float(rng.uniform(1000, 2000)),
+                   'total_memory': float(rng.uniform(500, 900)),
+                   'peak_cpu': float(rng.uniform(30, 100))}
+        reference = {'url': f'/api/results/{task}/plots?v={plots_hash[:16]}',
+                     'content_hash': f'sha256:{plots_hash}',
+                     'etag': f'W/"{plots_hash[:16]}-points-float64-1000-lttb"'}
+        test_config = {'name': 'Test 1', 'num_iterations': total}
+        test_result = {'test_index': 0, 'test_name': 'Test 1', 'final_metrics': metrics,
+                       'content_hash': plots_hash, 'status': 'completed', 'result': reference}
+        events.append({'type': 'test_started', 'task_id': task, 'test_index': 0,
+                       'test_name': 'Test 1', 'test_config': test_config})
+        events.append({'type': 'test_completed', 'task_id': task, 'test_index': 0,
+                       'test_name': 'Test 1', 'test_result': test_result,
+                       'batch_progress': 50, 'message_id': task_id(), 'requires_ack': True})
+        events.append({'type': 'calculation_complete', 'task_id': task, 'summary': metrics,
+                       'result': reference})
+
+    encoder = SSEEncoder('delta')
+    return [json.dumps(event, separators=(',', ':')).encode() for event in events] + \
+           [encoder.encode(event).encode() for event in events]
+
+def train_dictionary():
+    """Train the zstd dictionary for SSE payloads"""
+    return zstandard.train_dictionary(DICTIONARY_SIZE, training_samples()).as_bytes()
+
+@functools.lru_cache(maxsize=4)
+def _compression_dict(dictionary):
+    compression_dict = zstandard.ZstdCompressionDict(dictionary)
+    compression_dict.precompute_compress(level=ZSTD_LEVEL)
+    return compression_dict
+
+class SSEEncoder:
+    """Encode the messages of one SSE stream, and count what it saves"""
+
+    def __init__(self, encoding='json', dictionary=None):
+        self.encoding = encoding
+        self.delta = encoding.startswith('delta')
+        self.previous = {}  # Last message of each type
+        self.compressor = None
+        if encoding.endswith('zstd'):
+            self.compressor = zstandard.ZstdCompressor(
+                level=ZSTD_LEVEL, dict_data=_compression_dict(dictionary), write_checksum=False
+            )
+
+        self.events = 0
+        self.raw_bytes = 0  # What the events would have cost as plain JSON
+        self.sent_bytes = 0
+
+    def _delta(self, message):
+        kind = message.get('type')
+        previous = self.previous.get(kind)
+        self.previous[kind] = message
+        if previous is None:
+            return message
+
+        patch = merge_patch(previous, message)
+        if patch is None:
+            return message
+        return {'type': kind, '$delta': patch}
+
+    def encode(self, message):
+        """The ``data:`` payload of one message"""
+        if self.encoding == 'json':
+            data = json.dumps(message)
+            raw_size = len(data)
+        else:
+            raw_size = len(json.dumps(message))
+            payload = self._delta(message) if self.delta else message
+            data = json.dumps(payload, separators=(',', ':'))
+            if self.compressor is not None:
+                data = base64.b64encode(self.compressor.compress(data.encode())).decode()
+
+        self.events += 1
+        self.raw_bytes += raw_size
+        self.sent_bytes += len(data)
+        return data
+
+    def stats(self):
+        """Bytes per event before and after encoding"""
+        events = self.events or 1
+        return {
+            'encoding': self.encoding,
+            'events': self.events,
+            'raw_bytes_per_event': self.raw_bytes / events,
+            'sent_bytes_per_event': self.sent_bytes / events
+        }
@@ -0,0 +1,75 @@
+# app/services/sse_pacing.py
+"""Per-stream pacing of SSE events
+
+Workers queue a progress event on every iteration, however fast the client
+can render them. Each stream paces what it sends instead: progress events
+waiting for the stream's rate are coalesced into the latest one (progress
+events carry a full snapshot, so the latest supersedes the rest), while
+every other event is sent at once and never dropped.
+"""
+import time
+from app.utils.events import coalesce_key
+
+class EventPacer:
+    """Token bucket with coalescing, for the events of one stream
+
+    ``max_rate`` is the stream's progress events per second (None for no
+    limit); up to ``burst`` events go out back to back before pacing starts.
+    """
+
+    def __init__(self, max_rate=None, burst=1):
+        self.max_rate = max_rate
+        self.burst = burst
+        self.tokens = burst
+        self.refilled_at = time.monotonic()
+        self.pending = {}  # Latest unsent (event_id, message) per progress line
+        self.coalesced = 0
+
+    def _refill(self, now):
+        if self.max_rate:
+            elapsed = max(0.0, now - self.refilled_at)
+            self.tokens = min(self.burst, self.tokens + elapsed * self.max_rate)
+        self.refilled_at = now
+
+    def push(self, events, now=None):
+        """Take new events; returns the ones to send right away, in order
+
+        A non-progress event flushes the progress waiting before it, so
+        clients never see an older progress after e.g. a completion.
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        ready = []
+        for event_id, message in events:
+            key = coalesce_key(message)
+            if key is None:
+                ready.extend(self.pending.values())
+                self.pending.clear()
+                ready.append((event_id, message))
+                continue
+
+            if key in self.pending:
+                self.coalesced += 1
+                del self.pending[key]  # Keep the lines in arrival order
+            self.pending[key] = (event_id, message)
+
+        return ready + self.due(now)
+
+    def due(self, now=None):
+        """Progress events the rate allows sending now"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        ready = []
+        while self.pending and (not self.max_rate or self.tokens >= 1):
+            key = next(iter(self.pending))
+            ready.append(self.pending.pop(key))
+            if self.max_rate:
+                self.tokens -= 1
+        return ready
+
+    def wait_time(self, default, now=None):
+        """How long a stream may wait for new events before progress is due"""
+        if not self.pending or not self.max_rate:
+            return default
+        self._refill(time.monotonic() if now is None else now)
+        return min(default, max(0.0, (1 - self.tokens) / self.max_rate))
@@ -0,0 +1,169 @@
+# app/services/sse_streams.py
+"""What an SSE connection sends, independent of how it is served
+
+The Flask blueprint and the asyncio tier serve the same stream protocols.
+These classes choose, pace and frame a stream's events, and decide when it
+ends. The tiers only do the I/O: subscribing to the broadcast hubs, reading
+snapshots, waiting for events and writing the frames they get back.
+"""
+import time
+from app.services.broadcast_hub import FINAL_EVENTS, control_stream_id
+from app.services.series import apply_layout_to_message
+
+# Placeholders in a multi-task stream's outgoing events, resolved by the tier
+# (FOLLOW: subscribe to the task) or at framing time (SUBSCRIPTIONS)
+FOLLOW = object()
+SUBSCRIPTIONS = object()
+
+class EventStream:
+    """Timers and framing shared by every stream"""
+
+    def __init__(self, sse_service, encoder, pacer, plot_options, config):
+        self.sse_service = sse_service
+        self.encoder = encoder
+        self.pacer = pacer
+        self.plot_options = plot_options
+        self.hb_interval = config.get('SSE_HEARTBEAT_INTERVAL', 30)
+        self.timeout = config.get('SSE_TIMEOUT', 300)
+        self.start_time = self.last_activity = time.time()
+        self.closed = False
+
+    def message(self, message, event_id=None):
+        """Frame one message in the stream's encoding"""
+        return self.sse_service.format_message(message, event_id, self.encoder)
+
+    def idle(self):
+        """Heartbeat or timeout frames due while no events arrive"""
+        now = time.time()
+        frames = []
+        if now - self.last_activity >= self.hb_interval:
+            frames.append(self.sse_service.format_heartbeat())
+            self.last_activity = now
+        # The timeout counts from the connection's start, not its last event
+        if now - self.start_time >= self.timeout:
+            frames.append(self.message({'type': 'timeout'}))
+            self.closed = True
+        return frames
+
+    def wait_time(self):
+        """How long the tier may wait for events before calling back"""
+        return self.pacer.wait_time(1)
+
+    def failed(self, error):
+        """Frame an error raised while streaming (headers are already sent)"""
+        return self.message({'type': 'error', 'message': str(error)})
+
+    def stats(self):
+        return f"{self.encoder.stats()}, {self.pacer.coalesced} progress events coalesced"
+
+class TaskStream(EventStream):
+    """A stream of one task's events, resumable through event ids"""
+
+    def opening(self, task_id, state):
+        """Frames sent before any event: the greeting and the task's snapshot"""
+        frames = [self.message({'type': 'connected', 'task_id': task_id})]
+        if state:
+            frames.append(self.message({'type': 'current_state', 'state': state}))
+        return frames
+
+    def frames(self, events, overflowed=False):
+        """Frames for new ``(event_id, message)`` events, in the client's layout
+
+        The stream closes after the task's final event, or when the client
+        fell behind (it resumes via Last-Event-ID).
+        """
+        frames = []
+        for event_id, message in self.pacer.push(events):
+            rendered = apply_layout_to_message(message, **self.plot_options)
+            frames.append(self.message(rendered, event_id))
+            if message.get('type') in FINAL_EVENTS:
+                self.closed = True
+                break
+        if frames:
+            self.last_activity = time.time()
+        if overflowed:
+            self.closed = True
+        return frames
+
+class MultiTaskStream(EventStream):
+    """A stream multiplexing the events of several tasks
+
+    Events carry no ids but name their task. Subscription changes arrive on
+    the stream's control stream (see ``control_stream_id``); ``unsubscribe``
+    is the hub's, to drop a member of ``group``.
+    """
+
+    def __init__(self, sse_service, encoder, pacer, plot_options, config,
+                 stream_id, group, unsubscribe):
+        super().__init__(sse_service, encoder, pacer, plot_options, config)
+        self.stream_id = stream_id
+        self.control_id = control_stream_id(stream_id)
+        self.group = group
+        self.unsubscribe = unsubscribe
+        self.max_tasks = config.get('SSE_MAX_STREAM_TASKS', 50)
+
+    def opening(self, task_ids):
+        return [self.message({'type': 'connected', 'stream_id': self.stream_id, 'tasks': task_ids})]
+
+    def followed(self):
+        return [task_id for task_id in self.group.members if task_id != self.control_id]
+
+    def can_follow(self, task_id):
+        """Whether the tier should subscribe to a task it was asked to add"""
+        return task_id not in self.group.members and len(self.followed()) < self.max_tasks
+
+    def unfollow(self, task_id):
+        member = self.group.members.get(task_id)
+        if member is not None:
+            self.unsubscribe(member)
+
+    def select(self, events):
+        """Events to send from ``(task_id, event_id, message)`` events read
+
+        Subscription changes apply in order: removed tasks are dropped here,
+        and each added task comes out as a ``(task_id, FOLLOW, None)`` entry
+        for the tier to replace with the task's snapshot and events.
+        """
+        outgoing = []
+        for task_id, event_id, message in events:
+            if task_id == self.control_id:
+                if message.get('type') == 'subscriptions':
+                    for removed in message.get('remove', []):
+                        self.unfollow(removed)
+                    outgoing.extend((added, FOLLOW, None) for added in message.get('add', []))
+                    outgoing.append((None, None, SUBSCRIPTIONS))
+            elif task_id in self.group.members:
+                outgoing.append((task_id, event_id, message))
+        return outgoing
+
+    def frames(self, outgoing):
+        """Frames for events to send, each tagged with its task
+
+        A task is dropped after its final event; the stream closes when the
+        client fell behind (it reconnects).
+        """
+        # Progress is paced per task, so every event names its task first
+        tagged = []
+        for task_id, event_id, message in outgoing:
+            if message is SUBSCRIPTIONS:
+                message = {'type': 'subscriptions', 'tasks': self.followed()}
+            elif task_id:
+                message = {**apply_layout_to_message(message, **self.plot_options),
+                           'task_id': task_id}
+            tagged.append((event_id, message))
+
+        frames = []
+        for _, message in self.pacer.push(tagged):
+            frames.append(self.message(message))
+            if message.get('type') in FINAL_EVENTS:
+                self.unfollow(message['task_id'])
+        if frames:
+            self.last_activity = time.time()
+        if self.group.overflowed:
+            self.closed = True
+        return frames
+
+    def close(self):
+        """Leave every task still followed"""
+        for member in list(self.group.members.values()):
+            self.unsubscribe(member)
@@ -0,0 +1,525 @@
+# app/streaming_asgi.py
+"""Asyncio SSE serving tier
+
+Serves the same ``/api/stream/<task_id>`` and multi-task ``/api/stream``
+protocols as the Flask blueprint (whose API takes the subscription changes),
+but holds every open stream on a single event loop. All subscriptions in the
+process share one Redis connection: a single reader issues one multi-stream
+XREAD for every watched task and fans events out in memory. Cancellations
+arrive over a single pub/sub subscription.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from urllib.parse import parse_qs
+import redis.asyncio as aioredis
+from app.config import get_config
+from app.services.broadcast_hub import GroupMember, Subscription, SubscriptionGroup
+from app.services.redis_service import APPEND_SSE_EVENT_SCRIPT, RedisService
+from app.services.series import plot_params
+from app.services.sse_encoding import DICTIONARY_KEY, SSEEncoder, train_dictionary
+from app.services.sse_pacing import EventPacer
+from app.services.sse_service import SSEService
+from app.services.sse_streams import FOLLOW, MultiTaskStream, TaskStream
+from app.utils.serialization import decode_payload, encode_payload
+from app.utils.validators import (
+    validate_event_id, validate_layout_params, validate_max_rate, validate_sse_encoding,
+    validate_stream_tasks
+)
+
+logger = logging.getLogger(__name__)
+
+STREAM_PREFIX = '/api/stream/'
+
+async def replay_events(subscription, redis):
+    """Read the events a subscriber missed before it subscribed, from its cursor on"""
+    events = []
+    key = RedisService.sse_events_key(subscription.task_id)
+    while True:
+        response = await redis.xread({key: subscription.cursor}, count=100)
+        entries = RedisService.decode_sse_events(response[0][1]) if response else []
+        batch = subscription._accept(entries)
+        if not batch:
+            return events
+        events.extend(batch)
+
+class AsyncSubscription(Subscription):
+    """Subscription backed by an asyncio queue"""
+
+    def __init__(self, task_id, last_event_id, maxsize):
+        super().__init__(task_id, last_event_id, maxsize)
+        self.queue = asyncio.Queue(maxsize)
+
+    def publish(self, event_id, message):
+        """Hand an event to this subscriber (called from the reader)"""
+        try:
+            self.queue.put_nowait((event_id, message))
+        except asyncio.QueueFull:
+            # The client can't keep up; it will resume via Last-Event-ID
+            self.overflowed = True
+
+    async def replay(self, redis):
+        """Read events the client missed before it subscribed"""
+        return await replay_events(self, redis)
+
+    async def get_events(self, timeout=1):
+        """Wait up to ``timeout`` seconds for new events"""
+        try:
+            items = [await asyncio.wait_for(self.queue.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+
+        while not self.queue.empty():
+            items.append(self.queue.get_nowait())
+
+        return self._accept(items)
+
+class AsyncGroupMember(GroupMember):
+    """One task's subscription within an async multi-task stream"""
+
+    async def replay(self, redis):
+        """Read events the client missed before it subscribed"""
+        return await replay_events(self, redis)
+
+class AsyncSubscriptionGroup(SubscriptionGroup):
+    """Events of several tasks merged into one connection, on an asyncio queue"""
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.queue = asyncio.Queue(maxsize)
+
+    def publish(self, member, event_id, message):
+        """Hand a member's event to the stream (called from the reader)"""
+        try:
+            self.queue.put_nowait((member, event_id, message))
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get_events(self, timeout=1):
+        """Wait up to ``timeout`` seconds for new ``(task_id, event_id, message)`` events"""
+        try:
+            items = [await asyncio.wait_for(self.queue.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+
+        while not self.queue.empty():
+            items.append(self.queue.get_nowait())
+
+        return self._accept(items)
+
+class AsyncChannel:
+    """Reader state for one watched task"""
+
+    def __init__(self, task_id, last_event_id):
+        self.task_id = task_id
+        self.cursor = last_event_id
+        self.subscribers = set()
+        self.cancel_sent = False
+
+class AsyncBroadcastHub:
+    """Multiplex every watched task over one shared Redis connection"""
+
+    def __init__(self, config):
+        self.config = config
+        self.channels = {}
+        self._subscriber_redis = None
+        self._redis = None
+        self._reader = None
+        self._cancel_listener = None
+
+    async def start(self):
+        """Open the shared subscription connection and the request pool"""
+        if self._redis is not None:
+            return
+        # Values may be binary-encoded (see REDIS_CODECS), so keep raw bytes
+        url = self.config['REDIS_URL']
+        self._subscriber_redis = aioredis.from_url(url, single_connection_client=True)
+        self._redis = aioredis.from_url(url)
+        self._cancel_listener = asyncio.create_task(self._listen_for_cancels())
+
+    async def stop(self):
+        """Stop the reader and close connections"""
+        for task in (self._reader, self._cancel_listener):
+            if task:
+                task.cancel()
+        for client in (self._subscriber_redis, self._redis):
+            if client is not None:
+                await client.aclose()
+        self._subscriber_redis = self._redis = self._reader = self._cancel_listener = None
+
+    @property
+    def redis(self):
+        """Pooled client for one-off reads (snapshots, replays)"""
+        return self._redis
+
+    async def subscribe(self, task_id, last_event_id='0-0', group=None):
+        """Register a client for a task's events, starting the reader if needed
+
+        With ``group``, the task's events go to that multi-task stream.
+        """
+        await self.start()
+        if group is not None:
+            subscription = group.members[task_id] = AsyncGroupMember(group, task_id, last_event_id)
+        else:
+            subscription = AsyncSubscription(task_id, last_event_id,
+                                             self.config.get('SSE_SUBSCRIBER_QUEUE_SIZE', 1000))
+
+        channel = self.channels.get(task_id)
+        if channel is None:
+            entries = RedisService.decode_sse_events(
+                await self._redis.xrevrange(RedisService.sse_events_key(task_id), count=1)
+            )
+            # Cancels published before we started watching leave a marker
+            cancelled = await self._redis.get(f'cancelled_{task_id}')
+            # Another client may have created the channel while we awaited
+            channel = self.channels.setdefault(
+                task_id, AsyncChannel(task_id, entries[0][0] if entries else '0-0')
+            )
+            if cancelled is not None:
+                channel.cancel_sent = True
+        channel.subscribers.add(subscription)
+        if channel.cancel_sent:
+            subscription.publish(None, {'type': 'cancelled'})
+
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read_loop())
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a client; its channel is retired on the next read cycle"""
+        if isinstance(subscription, GroupMember):
+            members = subscription.group.members
+            if members.get(subscription.task_id) is subscription:
+                del members[subscription.task_id]
+        channel = self.channels.get(subscription.task_id)
+        if channel:
+            channel.subscribers.discard(subscription)
+
+    async def _read_loop(self):
+        """Read all watched streams with one XREAD and fan events out"""
+        block_ms = int(self.config.get('SSE_HUB_BLOCK_TIMEOUT', 1) * 1000)
+
+        while True:
+            for task_id in [t for t, c in self.channels.items() if not c.subscribers]:
+                del self.channels[task_id]
+            if not self.channels:
+                return
+
+            channels = {RedisService.sse_events_key(task_id): channel
+                        for task_id, channel in self.channels.items()}
+            try:
+                response = await self._subscriber_redis.xread(
+                    {key: channel.cursor for key, channel in channels.items()},
+                    count=100, block=block_ms
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Async SSE reader failed: {e}")
+                await asyncio.sleep(block_ms / 1000)
+                continue
+
+            for key, entries in response or []:
+                channel = channels[key.decode()]
+                for event_id, message in RedisService.decode_sse_events(entries):
+                    channel.cursor = event_id
+                    self._broadcast(channel, event_id, message)
+
+    async def _listen_for_cancels(self):
+        """Push published cancellations to the affected streams"""
+        while True:
+            pubsub = self._subscriber_redis.pubsub()
+            try:
+                await pubsub.subscribe(RedisService.CANCEL_CHANNEL)
+                # Catch cancels published while we were not subscribed
+                pending = [c for c in self.channels.values() if not c.cancel_sent]
+                if pending:
+                    markers = await self._redis.mget([f'cancelled_{c.task_id}' for c in pending])
+                    for channel, marker in zip(pending, markers):
+                        if marker is not None:
+                            channel.cancel_sent = True
+                            self._broadcast(channel, None, {'type': 'cancelled'})
+                async for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    channel = self.channels.get(message['data'].decode())
+                    if channel and not channel.cancel_sent:
+                        channel.cancel_sent = True
+                        self._broadcast(channel, None, {'type': 'cancelled'})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Async cancellation listener disconnected: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def _broadcast(self, channel, event_id, message):
+        """Publish an event to every subscriber of a channel"""
+        for subscription in list(channel.subscribers):
+            subscription.publish(event_id, message)
+
+class StreamingApp:
+    """Minimal ASGI application serving SSE streams"""
+
+    def __init__(self, config):
+        self.config = config
+        self.hub = AsyncBroadcastHub(config)
+        self.sse_service = SSEService()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        if scope['type'] != 'http':
+            return
+
+        path = scope['path']
+        if path in ('/', '/health'):
+            await self._send_json(send, 200, {'status': 'healthy', 'service': 'streaming-api'})
+        elif path == STREAM_PREFIX.rstrip('/') and scope['method'] == 'GET':
+            await self._stream_tasks(scope, receive, send)
+        elif path.startswith(STREAM_PREFIX) and scope['method'] == 'GET':
+            await self._stream(scope, receive, send, path[len(STREAM_PREFIX):])
+        else:
+            await self._send_json(send, 404, {'error': 'Resource not found'})
+
+    async def _lifespan(self, receive, send):
+        """Open and close Redis connections with the server"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.hub.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.hub.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _headers(self, scope, content_type):
+        """Response headers, including CORS for allowed origins"""
+        headers = [(b'content-type', content_type)]
+        origin = dict(scope['headers']).get(b'origin', b'').decode()
+        if origin and origin in self.config.get('CORS_ORIGINS', []):
+            headers.append((b'access-control-allow-origin', origin.encode()))
+            headers.append((b'vary', b'Origin'))
+        return headers
+
+    async def _send_json(self, send, status, data):
+        """Send a complete JSON response"""
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': json.dumps(data).encode()})
+
+    async def _sse_dictionary(self):
+        """The shared zstd dictionary, trained by the first process that needs it"""
+        dictionary = await self.hub.redis.get(DICTIONARY_KEY)
+        if dictionary is None:
+            # Training takes a while; keep the other streams going meanwhile
+            trained = await asyncio.get_running_loop().run_in_executor(None, train_dictionary)
+            await self.hub.redis.set(DICTIONARY_KEY, trained, nx=True)
+            dictionary = await self.hub.redis.get(DICTIONARY_KEY)
+        return dictionary
+
+    async def _queue_sse_message(self, task_id, message):
+        """Append an event to a task's stream, under the workers' queue policy
+
+        Returns the new event's id.
+        """
+        script = self.hub.redis.register_script(APPEND_SSE_EVENT_SCRIPT)
+        codec = self.config.get('REDIS_CODECS', {}).get(
+            'sse', self.config.get('REDIS_CODEC_DEFAULT', 'json')
+        )
+        keys, args = RedisService.sse_append_arguments(self.config, task_id, message,
+                                                       encode_payload(message, codec))
+        event_id = await script(keys=keys, args=args)
+        return event_id.decode() if isinstance(event_id, bytes) else event_id
+
+    async def _stream(self, scope, receive, send, task_id):
+        """Serve one SSE connection"""
+        # EventSource sends Last-Event-ID when it reconnects
+        query = parse_qs(scope.get('query_string', b'').decode())
+        last_event_id = (dict(scope['headers']).get(b'last-event-id', b'').decode()
+                         or query.get('last_event_id', [None])[0])
+        if not validate_event_id(last_event_id):
+            last_event_id = None
+
+        # Plots embedded in events are rendered in the client's layout, payloads
+        # in the encoding it negotiated and progress at the rate it asked for
+        params = {name: values[0] for name, values in query.items()}
+        encoding = params.get('encoding', 'json')
+        max_rate = params.get('max_rate')
+        errors = (validate_layout_params(params) + validate_sse_encoding(encoding)
+                  + validate_max_rate(max_rate))
+        if errors:
+            await self._send_json(send, 400, {'errors': errors})
+            return
+        plot_options = plot_params(params, self.config.get('MAX_PLOT_POINTS'))
+        pacer = EventPacer(float(max_rate) if max_rate else self.config.get('SSE_MAX_EVENT_RATE'))
+
+        headers = self._headers(scope, b'text/event-stream')
+        headers += [(b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        watcher = asyncio.create_task(watch_disconnect())
+
+        async def emit(chunk):
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+
+        subscription = None
+        stream = None
+        try:
+            # Redis clients exist already unless the server skipped lifespan
+            await self.hub.start()
+            dictionary = await self._sse_dictionary() if 'zstd' in encoding else None
+            stream = TaskStream(self.sse_service, SSEEncoder(encoding, dictionary), pacer,
+                                plot_options, self.config)
+
+            # A resuming client already has the task's state
+            state = None if last_event_id else await self.hub.redis.get(f'progress_{task_id}')
+            for frame in stream.opening(task_id, decode_payload(state) if state else None):
+                await emit(frame)
+
+            subscription = await self.hub.subscribe(task_id, last_event_id or '0-0')
+            events = await subscription.replay(self.hub.redis)
+            while not disconnected.is_set():
+                for frame in stream.frames(events, subscription.overflowed):
+                    await emit(frame)
+                if not stream.closed:
+                    for frame in stream.idle():
+                        await emit(frame)
+                if stream.closed:
+                    break
+
+                events = await subscription.get_events(timeout=stream.wait_time())
+
+        except Exception as e:
+            logger.warning(f"Async SSE stream for task {task_id} failed: {e}")
+            if not disconnected.is_set():
+                await emit(stream.failed(e) if stream else self.sse_service.format_message(
+                    {'type': 'error', 'message': str(e)}
+                ))
+        finally:
+            if subscription is not None:
+                self.hub.unsubscribe(subscription)
+            if stream is not None:
+                logger.info(f"SSE stream for task {task_id} closed: {stream.stats()}")
+            watcher.cancel()
+            if not disconnected.is_set():
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def _stream_tasks(self, scope, receive, send):
+        """Serve one SSE connection multiplexing several tasks (see the Flask ``/stream``)"""
+        query = parse_qs(scope.get('query_string', b'').decode())
+        params = {name: values[0] for name, values in query.items()}
+        task_ids = list(dict.fromkeys(item for name in ('tasks', 'batch')
+                                      for item in params.get(name, '').split(',') if item))
+        limit = self.config.get('SSE_MAX_STREAM_TASKS', 50)
+        encoding = params.get('encoding', 'json')
+        max_rate = params.get('max_rate')
+        errors = (validate_stream_tasks(task_ids, limit) + validate_layout_params(params)
+                  + validate_sse_encoding(encoding) + validate_max_rate(max_rate))
+        if not task_ids:
+            errors.append('tasks or batch is required')
+        if errors:
+            await self._send_json(send, 400, {'errors': errors})
+            return
+        plot_options = plot_params(params, self.config.get('MAX_PLOT_POINTS'))
+        pacer = EventPacer(float(max_rate) if max_rate else self.config.get('SSE_MAX_EVENT_RATE'))
+        stream_id = str(uuid.uuid4())
+
+        headers = self._headers(scope, b'text/event-stream')
+        headers += [(b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        watcher = asyncio.create_task(watch_disconnect())
+
+        async def emit(chunk):
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+
+        group = AsyncSubscriptionGroup(self.config.get('SSE_SUBSCRIBER_QUEUE_SIZE', 1000))
+        stream = None
+
+        async def follow(task_id):
+            """Subscribe to a task; returns its snapshot and the events it already has"""
+            if not stream.can_follow(task_id):
+                return []
+            events = []
+            state = await self.hub.redis.get(f'progress_{task_id}')
+            if state:
+                events.append((task_id, None,
+                               {'type': 'current_state', 'state': decode_payload(state)}))
+            member = await self.hub.subscribe(task_id, '0-0', group=group)
+            replayed = await member.replay(self.hub.redis)
+            events.extend((task_id, event_id, message) for event_id, message in replayed)
+            return events
+
+        try:
+            await self.hub.start()
+            dictionary = await self._sse_dictionary() if 'zstd' in encoding else None
+            stream = MultiTaskStream(self.sse_service, SSEEncoder(encoding, dictionary), pacer,
+                                     plot_options, self.config, stream_id, group,
+                                     self.hub.unsubscribe)
+
+            # Subscription changes arrive as events on the stream's own control
+            # stream, which the shared reader watches like any task
+            start_id = await self._queue_sse_message(stream.control_id, {'type': 'opened'})
+            await self.hub.subscribe(stream.control_id, start_id, group=group)
+
+            for frame in stream.opening(task_ids):
+                await emit(frame)
+
+            outgoing = [(task_id, FOLLOW, None) for task_id in task_ids]
+            while not disconnected.is_set():
+                outgoing = [event for entry in outgoing
+                            for event in (await follow(entry[0])
+                                          if entry[1] is FOLLOW else [entry])]
+                for frame in stream.frames(outgoing):
+                    await emit(frame)
+                if not stream.closed:
+                    # One heartbeat covers every task on the connection
+                    for frame in stream.idle():
+                        await emit(frame)
+                if stream.closed:
+                    break
+
+                outgoing = stream.select(await group.get_events(timeout=stream.wait_time()))
+
+        except Exception as e:
+            logger.warning(f"Async SSE stream {stream_id} failed: {e}")
+            if not disconnected.is_set():
+                await emit(stream.failed(e) if stream else self.sse_service.format_message(
+                    {'type': 'error', 'message': str(e)}
+                ))
+        finally:
+            if stream is not None:
+                stream.close()
+                logger.info(f"SSE stream {stream_id} for {len(task_ids)} tasks closed: "
+                            f"{stream.stats()}")
+            watcher.cancel()
+            if not disconnected.is_set():
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+def create_streaming_app(config=None):
+    """Create the ASGI streaming application"""
+    config_class = config or get_config()
+    settings = {key: getattr(config_class, key) for key in dir(config_class) if key.isupper()}
+    return StreamingApp(settings)
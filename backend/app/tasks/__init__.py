@@ -2,11 +2,13 @@
 """Tasks package initialization"""
 
 from .calculations import long_calculation_task
-from .batch_calculations import batch_calculation_task
+from .batch_calculations import batch_calculation_task, batch_test_task, finalize_batch_task
 from .plot_generators import PlotDataGenerator
 
 __all__ = [
     'long_calculation_task',
     'batch_calculation_task', 
+    'batch_test_task',
+    'finalize_batch_task',
     'PlotDataGenerator'
 ]
\ No newline at end of file
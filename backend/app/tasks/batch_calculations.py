@@ -1,11 +1,19 @@
 # app/tasks/batch_calculations.py - Enhanced with structured logging
 """Batch calculation tasks with comprehensive logging"""
+from celery import chain, chord
+from flask import current_app
 from app.extensions import celery
 from app.services.redis_service import RedisService
 from app.services.message_queue import MessageQueue
+from app.services.cancellation import cancellation_listener
 from app.tasks.plot_generators import PlotDataGenerator
+from app.services.series import (
+    columnar_plots, content_hash, plot_buffers, result_reference, without_series
+)
+from app.services.data_processing import Histogram
 from app.utils.task_logger import TaskLogger, log_task_execution
 import time
+import array
 import numpy as np
 
 @celery.task(bind=True)
@@ -25,19 +33,30 @@ def batch_calculation_task(self, batch_config):
     # Log batch initialization
     task_logger.info("Starting batch calculation", {
         'total_tests': total_tests,
-        'test_names': [test.get('name', f'Test {i+1}') for i, test in enumerate(tests)]
+        'test_names': [test.get('name', f'Test {i+1}') for i, test in enumerate(tests)],
+        'parallel': bool(batch_config.get('parallel'))
     })
     
+    if batch_config.get('parallel'):
+        # Hand the batch over to one task per test; the join step inherits
+        # this task's id, so status and results stay keyed by it
+        return self.replace(start_parallel_batch(task_id, batch_config,
+                                                 redis_service, message_queue))
+    
+    # Cancellations are pushed to this event as soon as they are published
+    cancelled = cancellation_listener.watch(task_id)
+    
+    # Results of completed tests (each is also stored under its own key)
+    test_results = []
+    
     try:
-        # Initialize batch metadata
-        batch_metadata = {
+        # Initialize batch state
+        redis_service.init_batch_state(task_id, {
             'total_tests': total_tests,
             'completed_tests': 0,
             'current_test_index': 0,
-            'status': 'running',
-            'test_results': []
-        }
-        redis_service.store_task_metadata(task_id, batch_metadata)
+            'status': 'running'
+        })
         
         # Send batch started message
         message_queue.send_batch_update(
@@ -55,8 +74,7 @@ def batch_calculation_task(self, batch_config):
             task_logger.log_test_progress(test_index, total_tests, test_name)
             
             # Update batch progress
-            batch_metadata['current_test_index'] = test_index
-            redis_service.store_task_metadata(task_id, batch_metadata)
+            redis_service.update_batch_state(task_id, current_test_index=test_index)
             
             # Send test started message
             message_queue.send_batch_update(
@@ -75,7 +93,8 @@ def batch_calculation_task(self, batch_config):
                 redis_service, 
                 message_queue, 
                 plot_generator,
-                task_logger
+                task_logger,
+                cancelled
             )
             
             test_duration = time.time() - test_start_time
@@ -90,10 +109,13 @@ def batch_calculation_task(self, batch_config):
                 'avg_test_duration': f'{np.mean(test_timings):.2f}s'
             })
             
-            # Store individual test result
-            batch_metadata['test_results'].append(test_result)
-            batch_metadata['completed_tests'] = test_index + 1
-            redis_service.store_task_metadata(task_id, batch_metadata)
+            # Store individual test result (its series are already in Redis)
+            stored_result = {
+                **test_result,
+                'complete_plots': without_series(test_result['complete_plots'])
+            }
+            test_results.append(stored_result)
+            redis_service.store_batch_test_result(task_id, test_index, stored_result)
             
             # Send test completed message
             message_queue.send_batch_update(
@@ -101,58 +123,20 @@ def batch_calculation_task(self, batch_config):
                 'test_completed',
                 test_index=test_index,
                 test_name=test_name,
-                test_result=test_result,
+                test_result=completed_test_summary(task_id, test_result),
                 batch_progress=int((test_index + 1) / total_tests * 100)
             )
             
             # Check for cancellation
-            if redis_service.is_task_cancelled(task_id):
+            if cancelled.is_set():
                 task_logger.warning("Batch cancelled by user", {
                     'completed_tests': test_index + 1,
                     'remaining_tests': total_tests - test_index - 1
                 })
                 raise Exception('Batch cancelled by user')
         
-        # Calculate batch summary
-        batch_summary = calculate_batch_summary(batch_metadata['test_results'])
-        
-        # Log batch summary
-        task_logger.info("Batch calculation completed successfully", {
-            'total_tests': total_tests,
-            'total_duration': f'{sum(test_timings):.2f}s',
-            'avg_test_duration': f'{np.mean(test_timings):.2f}s',
-            'best_accuracy': f"{batch_summary['best_final_accuracy']:.2f}%",
-            'avg_accuracy': f"{batch_summary['avg_final_accuracy']:.2f}%",
-            'best_performing_test': batch_summary['best_performing_test']
-        })
-        
-        # Final batch results
-        final_results = {
-            'status': 'completed',
-            'total_tests': total_tests,
-            'completed_tests': total_tests,
-            'test_results': batch_metadata['test_results'],
-            'batch_summary': batch_summary,
-            'timing_stats': {
-                'total_duration': sum(test_timings),
-                'avg_test_duration': np.mean(test_timings),
-                'min_test_duration': min(test_timings),
-                'max_test_duration': max(test_timings)
-            }
-        }
-        
-        # Store final results
-        redis_service.store_task_results(task_id, final_results)
-        
-        # Send batch completion message
-        message_queue.send_batch_update(
-            task_id,
-            'batch_completed',
-            batch_summary=batch_summary,
-            total_tests=total_tests
-        )
-        
-        return final_results
+        return complete_batch(task_id, test_results, test_timings,
+                              redis_service, message_queue, task_logger)
         
     except Exception as e:
         import traceback
@@ -161,9 +145,9 @@ def batch_calculation_task(self, batch_config):
         task_logger.error("Batch calculation failed", {
             'error_type': type(e).__name__,
             'error_message': error_message,
-            'completed_tests': batch_metadata.get('completed_tests', 0),
+            'completed_tests': len(test_results),
             'total_tests': total_tests,
-            'current_test': batch_metadata.get('current_test_index', -1) + 1,
+            'current_test': len(test_results) + 1,
             'traceback': traceback.format_exc()
         }, exc_info=True)
         
@@ -178,11 +162,230 @@ def batch_calculation_task(self, batch_config):
             'status': 'failed',
             'error': error_message
         })
+        redis_service.update_batch_state(task_id, status='failed')
+        
+        raise
+    
+    finally:
+        cancellation_listener.unwatch(task_id)
+
+def complete_batch(task_id, test_results, test_timings, redis_service, message_queue, task_logger,
+                   total_duration=None):
+    """Summarize a finished batch, store its results and announce completion
+
+    ``total_duration`` is the batch's wall time; it defaults to the sum of
+    ``test_timings``, which is the same when tests run one after another.
+    """
+    total_tests = len(test_results)
+    if total_duration is None:
+        total_duration = sum(test_timings)
+    
+    # Calculate batch summary
+    batch_summary = calculate_batch_summary(test_results)
+    
+    # Log batch summary
+    task_logger.info("Batch calculation completed successfully", {
+        'total_tests': total_tests,
+        'total_duration': f'{total_duration:.2f}s',
+        'avg_test_duration': f'{np.mean(test_timings):.2f}s',
+        'best_accuracy': f"{batch_summary['best_final_accuracy']:.2f}%",
+        'avg_accuracy': f"{batch_summary['avg_final_accuracy']:.2f}%",
+        'best_performing_test': batch_summary['best_performing_test']
+    })
+    
+    # Final batch results
+    final_results = {
+        'status': 'completed',
+        'total_tests': total_tests,
+        'completed_tests': total_tests,
+        'test_results': test_results,
+        'batch_summary': batch_summary,
+        'timing_stats': {
+            'total_duration': total_duration,
+            'avg_test_duration': np.mean(test_timings),
+            'min_test_duration': min(test_timings),
+            'max_test_duration': max(test_timings)
+        }
+    }
+    
+    # Store final results
+    redis_service.store_task_results(task_id, final_results)
+    redis_service.update_batch_state(task_id, status='completed', batch_summary=batch_summary)
+    
+    # Send batch completion message
+    message_queue.send_batch_update(
+        task_id,
+        'batch_completed',
+        batch_summary=batch_summary,
+        total_tests=total_tests
+    )
+    
+    return final_results
+
+def start_parallel_batch(task_id, batch_config, redis_service, message_queue):
+    """Initialize a parallel batch and build its chord
+
+    Tests are dealt round-robin onto at most ``max_concurrency`` chains, so
+    no more than that many run at once, and ``finalize_batch_task`` joins
+    them once every chain has finished.
+    """
+    tests = batch_config.get('tests', [])
+    total_tests = len(tests)
+    max_concurrency = (batch_config.get('max_concurrency')
+                       or current_app.config['BATCH_MAX_CONCURRENCY'])
+    lanes = min(max_concurrency, total_tests)
+    
+    # Tests run at once, so there is no current test; the start time gives
+    # the batch's wall time at the join
+    redis_service.init_batch_state(task_id, {
+        'total_tests': total_tests,
+        'completed_tests': 0,
+        'status': 'running',
+        'parallel': True,
+        'max_concurrency': lanes,
+        'started_at': time.time()
+    })
+    
+    message_queue.send_batch_update(
+        task_id,
+        'batch_started',
+        total_tests=total_tests
+    )
+    
+    return chord(
+        [chain(*[batch_test_task.si(task_id, test_index, tests[test_index], total_tests)
+                 for test_index in range(lane, total_tests, lanes)])
+         for lane in range(lanes)],
+        finalize_batch_task.si(task_id, total_tests)
+    )
+
+@celery.task(bind=True)
+@log_task_execution
+def batch_test_task(self, batch_id, test_index, test_config, total_tests):
+    """Run one test of a parallel batch"""
+    task_logger = TaskLogger(batch_id, 'batch_calculation')
+    
+    redis_service = RedisService()
+    message_queue = MessageQueue()
+    plot_generator = PlotDataGenerator()
+    
+    test_name = test_config.get('name', f'Test {test_index + 1}')
+    cancelled = cancellation_listener.watch(batch_id)
+    # The first test to fail stops the others through the same Event
+    failure_id = RedisService.batch_failure_id(batch_id)
+    cancellation_listener.watch(failure_id, cancelled)
+    
+    try:
+        # Tests still queued when the batch was cancelled or failed don't start
+        if cancelled.is_set():
+            raise Exception('Batch cancelled')
+        
+        task_logger.log_test_progress(test_index, total_tests, test_name)
+        
+        message_queue.send_batch_update(
+            batch_id,
+            'test_started',
+            test_index=test_index,
+            test_name=test_name,
+            test_config=test_config
+        )
+        
+        test_result = run_single_calculation(
+            batch_id,
+            test_index,
+            test_config,
+            redis_service,
+            message_queue,
+            plot_generator,
+            task_logger,
+            cancelled,
+            parallel=True
+        )
+        
+        # Store the result under its own key (its series are already in Redis)
+        completed_tests = redis_service.store_batch_test_result(batch_id, test_index, {
+            **test_result,
+            'complete_plots': without_series(test_result['complete_plots'])
+        })
+        
+        task_logger.info(f"Completed {test_name}", {
+            'test_index': test_index + 1,
+            'completed_tests': f'{completed_tests}/{total_tests}',
+            'final_accuracy': f"{test_result['final_metrics']['final_accuracy']:.2f}%",
+            'final_loss': f"{test_result['final_metrics']['final_loss']:.4f}"
+        })
+        
+        # Released in test order, so every earlier test is done by then
+        message_queue.send_batch_update_in_order(
+            batch_id,
+            test_index,
+            'test_completed',
+            test_index=test_index,
+            test_name=test_name,
+            test_result=completed_test_summary(batch_id, test_result),
+            batch_progress=int((test_index + 1) / total_tests * 100)
+        )
+        
+        return {'test_index': test_index, 'status': 'completed'}
+        
+    except Exception as e:
+        error_message = str(e)
+        
+        if cancelled.is_set():
+            # Stopped by a cancel, or by another test's failure, which is
+            # reported on its own
+            task_logger.warning(f"{test_name} stopped", {'test_index': test_index + 1})
+            raise
+        
+        task_logger.error(f"{test_name} failed", {
+            'error_type': type(e).__name__,
+            'error_message': error_message,
+            'test_index': test_index + 1
+        }, exc_info=True)
+        
+        if redis_service.fail_batch(batch_id, test_index):
+            message_queue.send_batch_update(
+                batch_id,
+                'batch_error',
+                error=error_message,
+                test_index=test_index
+            )
+            
+            redis_service.update_task_progress(batch_id, {
+                'status': 'failed',
+                'error': error_message
+            })
         
         raise
+    
+    finally:
+        cancellation_listener.unwatch(failure_id)
+        cancellation_listener.unwatch(batch_id)
 
-def run_single_calculation(task_id, test_index, test_config, redis_service, message_queue, plot_generator, parent_logger):
-    """Run a single calculation within a batch with detailed logging"""
+@celery.task(bind=True)
+@log_task_execution
+def finalize_batch_task(self, batch_id, total_tests):
+    """Join step of a parallel batch: summarize the results of every test"""
+    task_logger = TaskLogger(batch_id, 'batch_calculation')
+    
+    redis_service = RedisService()
+    message_queue = MessageQueue()
+    
+    test_results = redis_service.get_batch_test_results(batch_id, total_tests)
+    test_timings = [result['timing_stats']['total_duration'] for result in test_results]
+    started_at = redis_service.get_batch_state(batch_id).get('started_at')
+    
+    total_duration = time.time() - started_at if started_at else None
+    
+    return complete_batch(batch_id, test_results, test_timings,
+                          redis_service, message_queue, task_logger, total_duration)
+
+def run_single_calculation(task_id, test_index, test_config, redis_service, message_queue,
+                           plot_generator, parent_logger, cancelled, parallel=False):
+    """Run a single calculation within a batch with detailed logging
+
+    Tests of a ``parallel`` batch run at once, so each keeps its own progress.
+    """
     num_iterations = test_config.get('num_iterations', 30)
     test_params = test_config.get('test_params', {})
     test_name = test_config.get('name', f'Test {test_index + 1}')
@@ -195,28 +398,33 @@ def run_single_calculation(task_id, test_index, test_config, redis_service, mess
         'test_params': test_params
     })
     
-    # Initialize collectors for complete data
-    all_convergence_data = []
-    all_accuracy_data = []
-    all_performance_data = []
-    final_error_distribution = None
+    # Initialize collectors for complete data (preallocated for the test)
+    buffers = plot_buffers(num_iterations)
+    
+    iteration_timings = array.array('d')
     
-    iteration_timings = []
+    # Seeded tests get their own generator so they are reproducible
+    if 'seed' in test_params:
+        plot_generator = PlotDataGenerator(seed=test_params['seed'])
+    
+    # Generate the whole test up front in one vectorized block
+    run = plot_generator.generate_run(num_iterations)
     
     for i in range(num_iterations):
         iteration_start_time = time.time()
         
-        # Simulate computation
+        # Simulate computation (wakes immediately on cancellation)
         compute_time = np.random.uniform(0.5, 1.5)
-        time.sleep(compute_time)
+        if cancelled.wait(compute_time):
+            test_logger.warning(f"{test_name} cancelled", {'at_iteration': i + 1})
+            raise Exception('Task cancelled by user')
         
-        # Generate plot data
-        plot_data = plot_generator.generate_iteration_data(i, num_iterations)
+        # Take this iteration's points from the pregenerated run
+        points = run.points(i)
         
         # Collect complete data
-        all_convergence_data.append(plot_data['convergence_point'])
-        all_accuracy_data.append(plot_data['accuracy_point'])
-        all_performance_data.append(plot_data['performance_point'])
+        for name, point in points.items():
+            buffers[name].append(point)
         
         iteration_duration = time.time() - iteration_start_time
         iteration_timings.append(iteration_duration)
@@ -228,16 +436,12 @@ def run_single_calculation(task_id, test_index, test_config, redis_service, mess
                 'progress': f'{int((i + 1) / num_iterations * 100)}%',
                 'iteration_time': f'{iteration_duration:.2f}s',
                 'avg_iteration_time': f'{np.mean(iteration_timings):.2f}s',
-                'loss': f'{plot_data["convergence_point"]["loss"]:.4f}',
-                'accuracy': f'{plot_data["accuracy_point"]["accuracy"]:.2f}%'
+                'loss': f'{points["convergence"]["loss"]:.4f}',
+                'accuracy': f'{points["accuracy"]["accuracy"]:.2f}%'
             })
         
-        # Store the final error distribution
-        if i == num_iterations - 1:
-            final_error_distribution = plot_data['plots']['error_distribution']
-        
         # Send iteration progress
-        message_queue.send_batch_update(
+        iteration_update = message_queue.build_batch_update(
             task_id,
             'test_iteration_update',
             test_index=test_index,
@@ -246,25 +450,25 @@ def run_single_calculation(task_id, test_index, test_config, redis_service, mess
             test_progress=int((i + 1) / num_iterations * 100)
         )
         
-        # Update progress in Redis
-        redis_service.update_task_progress(task_id, {
+        # Send the update, persist the points and update progress in the
+        # same round trip
+        redis_service.record_iteration(task_id, {
             'current_test_index': test_index,
             'current_iteration': i + 1,
             'total_iterations': num_iterations,
             'test_progress': int((i + 1) / num_iterations * 100),
             'status': 'running'
-        })
-        
-        # Check for cancellation
-        if redis_service.is_task_cancelled(task_id):
-            test_logger.warning(f"{test_name} cancelled", {'at_iteration': i + 1})
-            raise Exception('Task cancelled by user')
+        }, [iteration_update], points=points, test_index=test_index, test_progress=parallel)
+    
+    # Only the final iteration's error distribution is kept
+    final_error_distribution = plot_generator.error_distribution(num_iterations - 1, num_iterations,
+                                                                 test=test_index)
     
     # Calculate final metrics for this test
     final_metrics = plot_generator.calculate_final_metrics(
-        all_convergence_data,
-        all_accuracy_data,
-        all_performance_data
+        buffers['convergence'],
+        buffers['accuracy'],
+        buffers['performance']
     )
     
     # Log test completion with performance stats
@@ -277,12 +481,11 @@ def run_single_calculation(task_id, test_index, test_config, redis_service, mess
         'avg_throughput': f"{final_metrics['avg_throughput']:.0f} ops/s"
     })
     
-    # Prepare complete plot data
-    complete_plots = {
-        'convergence': all_convergence_data,
-        'accuracy': all_accuracy_data,
-        'performance': all_performance_data,
-    }
+    # Precompute zoom levels for range queries
+    redis_service.store_series_pyramids(task_id, buffers, test_index=test_index)
+    
+    # Prepare complete plot data (one list per field)
+    complete_plots = columnar_plots(buffers)
     
     if final_error_distribution:
         complete_plots['error_distribution'] = final_error_distribution
@@ -293,6 +496,7 @@ def run_single_calculation(task_id, test_index, test_config, redis_service, mess
         'test_config': test_config,
         'final_metrics': final_metrics,
         'complete_plots': complete_plots,
+        'content_hash': content_hash(complete_plots),
         'status': 'completed',
         'timing_stats': {
             'total_duration': sum(iteration_timings),
@@ -302,6 +506,14 @@ def run_single_calculation(task_id, test_index, test_config, redis_service, mess
         }
     }
 
+def completed_test_summary(task_id, test_result):
+    """A test result for its test_completed event: the plots by reference"""
+    summary = {key: value for key, value in test_result.items() if key != 'complete_plots'}
+    summary['result'] = result_reference(task_id, test_result['content_hash'],
+                                         test_result['test_index'],
+                                         current_app.config['MAX_PLOT_POINTS'])
+    return summary
+
 def calculate_batch_summary(test_results):
     """Calculate summary statistics for the entire batch"""
     if not test_results:
@@ -312,7 +524,16 @@ def calculate_batch_summary(test_results):
     final_accuracies = [r['final_metrics']['final_accuracy'] for r in test_results]
     avg_throughputs = [r['final_metrics']['avg_throughput'] for r in test_results]
     
-    return {
+    # Combine every test's final error distribution without the raw samples
+    error_histogram = None
+    for r in test_results:
+        histogram = r.get('complete_plots', {}).get('error_distribution', {}).get('histogram')
+        if histogram:
+            histogram = Histogram.from_dict(histogram)
+            error_histogram = (histogram if error_histogram is None
+                               else error_histogram.merge(histogram))
+    
+    summary = {
         'total_tests': len(test_results),
         'avg_final_loss': np.mean(final_losses),
         'best_final_loss': np.min(final_losses),
@@ -323,4 +544,12 @@ def calculate_batch_summary(test_results):
         'avg_throughput': np.mean(avg_throughputs),
         'best_performing_test': test_results[np.argmax(final_accuracies)]['test_name'],
         'worst_performing_test': test_results[np.argmin(final_accuracies)]['test_name']
-    }
\ No newline at end of file
+    }
+    
+    if error_histogram is not None:
+        summary['error_distribution'] = {
+            'bins': error_histogram.to_bins(),
+            'stats': error_histogram.statistics()
+        }
+    
+    return summary
\ No newline at end of file
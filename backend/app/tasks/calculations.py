@@ -1,9 +1,14 @@
 # app/tasks/calculations.py - Enhanced with structured logging
 """Calculation tasks with comprehensive logging"""
+from flask import current_app
 from app.extensions import celery
 from app.services.redis_service import RedisService
 from app.services.sse_service import SSEService
+from app.services.cancellation import cancellation_listener
 from app.tasks.plot_generators import PlotDataGenerator
+from app.services.series import (
+    columnar_plots, content_hash, plot_buffers, result_reference, without_series
+)
 from app.utils.task_logger import TaskLogger, log_task_execution
 import time
 import numpy as np
@@ -17,13 +22,10 @@ def long_calculation_task(self, num_iterations, test_params):
     
     redis_service = RedisService()
     sse_service = SSEService()
-    plot_generator = PlotDataGenerator()
+    plot_generator = PlotDataGenerator(seed=test_params.get('seed'))
     
-    # Initialize collectors for complete data
-    all_convergence_data = []
-    all_accuracy_data = []
-    all_performance_data = []
-    final_error_distribution = None
+    # Initialize collectors for complete data (preallocated for the run)
+    buffers = plot_buffers(num_iterations)
     
     # Log task initialization
     task_logger.info("Initializing calculation", {
@@ -31,33 +33,36 @@ def long_calculation_task(self, num_iterations, test_params):
         'test_params': test_params
     })
     
+    # Cancellations are pushed to this event as soon as they are published
+    cancelled = cancellation_listener.watch(task_id)
+    
     try:
+        # Generate the whole run up front in one vectorized block
+        run = plot_generator.generate_run(num_iterations)
+        
         for i in range(num_iterations):
             iteration_start_time = time.time()
             
-            # Simulate computation
+            # Simulate computation (wakes immediately on cancellation)
             compute_time = np.random.uniform(0.5, 1.5)
-            time.sleep(compute_time)
+            if cancelled.wait(compute_time):
+                task_logger.warning("Task cancelled by user", {'at_iteration': i + 1})
+                raise Exception('Task cancelled by user')
             
-            # Generate plot data
-            plot_data = plot_generator.generate_iteration_data(i, num_iterations)
+            # Take this iteration's points from the pregenerated run
+            points = run.points(i)
             
             # Collect complete data
-            all_convergence_data.append(plot_data['convergence_point'])
-            all_accuracy_data.append(plot_data['accuracy_point'])
-            all_performance_data.append(plot_data['performance_point'])
-            
-            # Store the final error distribution (from last iteration)
-            if i == num_iterations - 1:
-                final_error_distribution = plot_data['plots']['error_distribution']
+            for name, point in points.items():
+                buffers[name].append(point)
             
             # Log iteration details
             iteration_duration = time.time() - iteration_start_time
             task_logger.log_iteration(i + 1, num_iterations, {
                 'compute_time': f'{compute_time:.2f}s',
                 'iteration_duration': f'{iteration_duration:.2f}s',
-                'loss': f'{plot_data["convergence_point"]["loss"]:.4f}',
-                'accuracy': f'{plot_data["accuracy_point"]["accuracy"]:.2f}%'
+                'loss': f'{points["convergence"]["loss"]:.4f}',
+                'accuracy': f'{points["accuracy"]["accuracy"]:.2f}%'
             })
             
             # Create SSE update message
@@ -68,27 +73,24 @@ def long_calculation_task(self, num_iterations, test_params):
                 'progress': int((i + 1) / num_iterations * 100),
             }
             
-            # Send SSE message
-            sse_service.queue_message(task_id, sse_message)
-            
-            # Update progress in Redis
-            redis_service.update_task_progress(task_id, {
+            # Send SSE message, persist the points and update progress in a
+            # single Redis round trip
+            redis_service.record_iteration(task_id, {
                 'current_iteration': i + 1,
                 'total_iterations': num_iterations,
                 'progress': int((i + 1) / num_iterations * 100),
                 'status': 'running'
-            })
-            
-            # Check for cancellation
-            if redis_service.is_task_cancelled(task_id):
-                task_logger.warning("Task cancelled by user", {'at_iteration': i + 1})
-                raise Exception('Task cancelled by user')
+            }, [sse_message], points=points)
+        
+        # Only the final iteration's error distribution is kept
+        final_error_distribution = plot_generator.error_distribution(num_iterations - 1,
+                                                                     num_iterations)
         
         # Calculate final metrics
         final_metrics = plot_generator.calculate_final_metrics(
-            all_convergence_data,
-            all_accuracy_data,
-            all_performance_data
+            buffers['convergence'],
+            buffers['accuracy'],
+            buffers['performance']
         )
         
         # Log final metrics
@@ -100,34 +102,36 @@ def long_calculation_task(self, num_iterations, test_params):
             'peak_cpu': final_metrics['peak_cpu']
         })
         
-        # Prepare complete plot data
-        complete_plots = {
-            'convergence': all_convergence_data,
-            'accuracy': all_accuracy_data,
-            'performance': all_performance_data,
-        }
+        # Precompute zoom levels for range queries
+        redis_service.store_series_pyramids(task_id, buffers)
+        
+        # Prepare complete plot data (one list per field)
+        complete_plots = columnar_plots(buffers)
         
         # Add error distribution if available
         if final_error_distribution:
             complete_plots['error_distribution'] = final_error_distribution
         
-        # Prepare final results
+        # Prepare final results (the series are already in Redis and are
+        # read back from there, so only the rest of the plots is stored)
         final_results = {
             'status': 'completed',
             'total_iterations': num_iterations,
             'final_metrics': final_metrics,
-            'complete_plots': complete_plots
+            'complete_plots': without_series(complete_plots),
+            'content_hash': content_hash(complete_plots)
         }
         
         # Store final results
         redis_service.store_task_results(task_id, final_results)
         
-        # Send completion message with complete plot data
+        # Send completion message; clients fetch the plots by reference
         sse_service.queue_message(task_id, {
             'type': 'calculation_complete',
             'task_id': task_id,
             'summary': final_metrics,
-            'complete_plots': complete_plots
+            'result': result_reference(task_id, final_results['content_hash'],
+                                       max_points=current_app.config['MAX_PLOT_POINTS'])
         })
         
         task_logger.info("Calculation completed successfully", {
@@ -145,7 +149,7 @@ def long_calculation_task(self, num_iterations, test_params):
         task_logger.error("Calculation failed", {
             'error_type': type(e).__name__,
             'error_message': error_message,
-            'completed_iterations': len(all_convergence_data),
+            'completed_iterations': len(buffers['convergence']),
             'total_iterations': num_iterations
         }, exc_info=True)
         
@@ -160,4 +164,7 @@ def long_calculation_task(self, num_iterations, test_params):
             'error': error_message
         })
         
-        raise
\ No newline at end of file
+        raise
+    
+    finally:
+        cancellation_listener.unwatch(task_id)
\ No newline at end of file
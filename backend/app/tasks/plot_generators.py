@@ -2,84 +2,155 @@
 """Plot data generation utilities"""
 import numpy as np
 from datetime import datetime
+from app.services.series import SeriesBuffer
+from app.services.data_processing import Histogram
+
+class PlotBlock:
+    """Plot series for a block of iterations, one NumPy array per field
+
+    Arrays run along the last axis over iterations ``start`` to
+    ``start + len(block) - 1``; blocks generated for several tests in
+    lockstep have a leading test axis.
+    """
+
+    def __init__(self, start, series):
+        self.start = start
+        self.series = series
+
+    def __len__(self):
+        return self.series['convergence']['x'].shape[-1]
+
+    def point(self, name, offset, test=None):
+        """One iteration of a series as a point dict of Python scalars"""
+        columns = self.series[name]
+        if test is None:
+            return {field: values[offset].item() for field, values in columns.items()}
+        return {field: values[test, offset].item() for field, values in columns.items()}
+
+    def points(self, offset, test=None):
+        """One iteration of every series, keyed by series name"""
+        return {name: self.point(name, offset, test) for name in self.series}
 
 class PlotDataGenerator:
-    """Generate plot data for various visualization types"""
-    
+    """Generate plot data for various visualization types
+
+    Data is drawn from a seeded ``numpy.random.Generator`` a block of
+    iterations at a time. Error distributions are derived from the seed and
+    the iteration alone, so they are only computed for the iterations that
+    are actually asked for.
+    """
+
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self._error_seed = int(self.rng.integers(2**63))
+
+    def generate_block(self, start, count, num_tests=None):
+        """Generate iterations ``start`` to ``start + count - 1`` as arrays
+
+        With ``num_tests``, every array has shape ``(num_tests, count)`` and
+        each row is an independent test run in lockstep.
+        """
+        i = np.arange(start, start + count)
+        size = (count,) if num_tests is None else (num_tests, count)
+        x = np.broadcast_to(i + 1, size)
+        normal = self.rng.normal
+
+        return PlotBlock(start, {
+            'convergence': {
+                'x': x,
+                'loss': 100 * np.exp(-i / 10) + normal(0, 2, size),
+                'val_loss': 110 * np.exp(-i / 10) + normal(0, 3, size)
+            },
+            'accuracy': {
+                'x': x,
+                'accuracy': np.minimum(95, 50 + i * 4 + normal(0, 2, size)),
+                'precision': np.minimum(98, 55 + i * 3.5 + normal(0, 1.5, size)),
+                'recall': np.minimum(96, 48 + i * 4.2 + normal(0, 2.5, size))
+            },
+            'performance': {
+                'time': x,
+                'throughput': 1000 + i * 50 + normal(0, 20, size),
+                'memory': 512 + i * 10 + normal(0, 5, size),
+                'cpu': np.minimum(100, 30 + i * 2 + normal(0, 10, size))
+            }
+        })
+
+    def generate_run(self, total_iterations):
+        """Generate every iteration of a run in one block"""
+        return self.generate_block(0, total_iterations)
+
+    def generate_tests(self, num_tests, total_iterations):
+        """Generate whole runs for ``num_tests`` tests in lockstep"""
+        return self.generate_block(0, total_iterations, num_tests)
+
+    def error_distribution(self, iteration, total_iterations, test=None):
+        """Error distribution plot for one iteration, computed on demand"""
+        rng = np.random.default_rng([self._error_seed, iteration, 0 if test is None else test + 1])
+
+        # More samples for a more refined distribution on the final iteration
+        samples = 500 if iteration == total_iterations - 1 else 100
+        errors = rng.normal(0, 1 / (iteration + 1), samples)
+
+        return {
+            'type': 'histogram',
+            'data': errors.tolist(),
+            'stats': {
+                'mean': float(errors.mean()),
+                'std': float(errors.std()),
+                'min': float(errors.min()),
+                'max': float(errors.max())
+            },
+            'histogram': Histogram.from_values(errors).to_dict()
+        }
+
     def generate_iteration_data(self, iteration, total_iterations):
         """Generate plot data for a single iteration"""
-        i = iteration
-        
-        # Generate data points
-        convergence_point = {
-            'x': i + 1,
-            'loss': 100 * np.exp(-i / 10) + np.random.normal(0, 2),
-            'val_loss': 110 * np.exp(-i / 10) + np.random.normal(0, 3)
-        }
-        
-        accuracy_point = {
-            'x': i + 1,
-            'accuracy': min(95, 50 + i * 4 + np.random.normal(0, 2)),
-            'precision': min(98, 55 + i * 3.5 + np.random.normal(0, 1.5)),
-            'recall': min(96, 48 + i * 4.2 + np.random.normal(0, 2.5))
-        }
-        
-        performance_point = {
-            'time': i + 1,
-            'throughput': 1000 + i * 50 + np.random.normal(0, 20),
-            'memory': 512 + i * 10 + np.random.normal(0, 5),
-            'cpu': min(100, 30 + i * 2 + np.random.normal(0, 10))
-        }
-        
-        # Generate error distribution (more refined for final iteration)
-        if i == total_iterations - 1:
-            # Generate a more comprehensive error distribution for the final iteration
-            errors = np.random.normal(0, 1 / (i + 1), 500).tolist()  # More samples for final
-        else:
-            errors = np.random.normal(0, 1 / (i + 1), 100).tolist()
-        
+        points = self.generate_block(iteration, 1).points(0)
+
         # Prepare plot update
         plots = {
             'convergence': {
                 'type': 'line',
-                'new_point': convergence_point,
+                'new_point': points['convergence'],
                 'full_data': None
             },
             'accuracy': {
                 'type': 'line',
-                'new_point': accuracy_point,
+                'new_point': points['accuracy'],
                 'full_data': None
             },
             'performance': {
                 'type': 'multi_line',
-                'new_point': performance_point,
+                'new_point': points['performance'],
                 'full_data': None
             },
-            'error_distribution': {
-                'type': 'histogram',
-                'data': errors,
-                'stats': {
-                    'mean': np.mean(errors),
-                    'std': np.std(errors),
-                    'min': np.min(errors),
-                    'max': np.max(errors)
-                }
-            }
+            'error_distribution': self.error_distribution(iteration, total_iterations)
         }
-        
+
         return {
-            'convergence_point': convergence_point,
-            'accuracy_point': accuracy_point,
-            'performance_point': performance_point,
+            'convergence_point': points['convergence'],
+            'accuracy_point': points['accuracy'],
+            'performance_point': points['performance'],
             'plots': plots
         }
-    
+
     def calculate_final_metrics(self, convergence_data, accuracy_data, performance_data):
-        """Calculate final metrics from complete data"""
+        """Calculate final metrics from complete data
+
+        Works directly on SeriesBuffers (or lists of point dicts).
+        """
+        def column(series, field):
+            if isinstance(series, SeriesBuffer):
+                return series.column(field)
+            return np.array([point[field] for point in series], dtype=float)
+
+        def summary(series, field, reduce=lambda values: values[-1]):
+            return reduce(column(series, field)).item() if len(series) else 0
+
         return {
-            'final_loss': convergence_data[-1]['loss'] if convergence_data else 0,
-            'final_accuracy': accuracy_data[-1]['accuracy'] if accuracy_data else 0,
-            'avg_throughput': np.mean([p['throughput'] for p in performance_data]) if performance_data else 0,
-            'total_memory': performance_data[-1]['memory'] if performance_data else 0,
-            'peak_cpu': max([p['cpu'] for p in performance_data]) if performance_data else 0
-        }
\ No newline at end of file
+            'final_loss': summary(convergence_data, 'loss'),
+            'final_accuracy': summary(accuracy_data, 'accuracy'),
+            'avg_throughput': summary(performance_data, 'throughput', np.mean),
+            'total_memory': summary(performance_data, 'memory'),
+            'peak_cpu': summary(performance_data, 'cpu', np.max)
+        }
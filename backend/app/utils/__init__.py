@@ -4,16 +4,29 @@
 from .validators import (
     validate_calculation_params,
     validate_batch_params,
-    validate_task_id
+    validate_task_id,
+    validate_event_id,
+    validate_layout_params,
+    validate_range_params,
+    validate_max_rate,
+    validate_stream_tasks,
+    validate_sse_encoding
 )
-from .compression import compress_response, compress_for_sse
+from .compression import compress_response, compress_stream, negotiate_encoding
 from .logging_config import setup_logging
 
 __all__ = [
     'validate_calculation_params',
     'validate_batch_params', 
     'validate_task_id',
+    'validate_event_id',
+    'validate_layout_params',
+    'validate_range_params',
+    'validate_max_rate',
+    'validate_stream_tasks',
+    'validate_sse_encoding',
     'compress_response',
-    'compress_for_sse',
+    'compress_stream',
+    'negotiate_encoding',
     'setup_logging'
 ]
\ No newline at end of file
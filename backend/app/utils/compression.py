@@ -1,43 +1,104 @@
 # app/utils/compression.py
 """Compression utilities"""
 import gzip
-import io
-import base64
-from flask import Response, current_app
+import zlib
+from flask import Response, current_app, has_request_context, request
 
-def compress_response(data, format='json'):
-    """Compress response data if above threshold"""
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Content-Encodings we can produce, in order of preference when the client
+# accepts several equally
+AVAILABLE_ENCODINGS = [encoding for encoding, available in (
+    ('zstd', zstandard is not None),
+    ('br', brotli is not None),
+    ('gzip', True)
+) if available]
+
+# Compression levels used unless COMPRESSION_LEVELS overrides them
+DEFAULT_LEVELS = {'gzip': 6, 'br': 5, 'zstd': 3}
+
+def negotiate_encoding(accept_encodings):
+    """Pick the Content-Encoding for a request's ``Accept-Encoding``
+
+    Honours q-values (``q=0`` refuses an encoding); returns None when the
+    body should be sent uncompressed.
+    """
+    return accept_encodings.best_match(AVAILABLE_ENCODINGS)
+
+def _level(encoding):
+    """Configured compression level for an encoding"""
+    if encoding not in DEFAULT_LEVELS:
+        raise ValueError(f'Unsupported encoding: {encoding}')
+    levels = current_app.config.get('COMPRESSION_LEVELS', {})
+    return levels.get(encoding, DEFAULT_LEVELS[encoding])
+
+def compress(data, encoding):
+    """Compress a whole body with the given Content-Encoding"""
+    level = _level(encoding)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=level)
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of str/bytes chunks on the fly
+
+    Yields compressed bytes as the compressor produces them, so the whole
+    body is never held in memory.
+    """
+    level = _level(encoding)
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+    elif encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        process, finish = compressor.compress, compressor.flush
+    
+    for chunk in chunks:
+        compressed = process(chunk.encode() if isinstance(chunk, str) else chunk)
+        if compressed:
+            yield compressed
+    yield finish()
+
+def encoded_response(body, encoding, mimetype):
+    """Response for a body (bytes or an iterable of chunks) in ``encoding``"""
+    response = Response(body, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+def compress_response(data, format='json', encoding=None):
+    """Compress response data if above threshold
+
+    The encoding is negotiated from the request's ``Accept-Encoding``
+    unless given. The body is already built, so it is compressed in one
+    call; bodies produced incrementally go through ``compress_stream``.
+    """
     import json
     
     if format == 'json':
         json_str = json.dumps(data) if not isinstance(data, str) else data
         
-        if len(json_str) > current_app.config.get('COMPRESSION_THRESHOLD', 50000):
-            gz_buffer = io.BytesIO()
-            with gzip.GzipFile(mode='wb', fileobj=gz_buffer) as gz_file:
-                gz_file.write(json_str.encode())
-            
-            response = Response(gz_buffer.getvalue())
-            response.headers['Content-Encoding'] = 'gzip'
-            response.headers['Content-Type'] = 'application/json'
-            return response
+        if encoding is None and has_request_context():
+            encoding = negotiate_encoding(request.accept_encodings)
         
-        return Response(json_str, mimetype='application/json')
+        if encoding and len(json_str) > current_app.config.get('COMPRESSION_THRESHOLD', 50000):
+            return encoded_response(compress(json_str.encode(), encoding), encoding,
+                                    'application/json')
+        
+        return encoded_response(json_str, None, 'application/json')
     
     return Response(data)
-
-def compress_for_sse(data):
-    """Compress data for SSE transmission"""
-    import json
-    
-    json_str = json.dumps(data)
-    
-    # Only compress if data is large
-    if len(json_str) > 1000:
-        compressed = gzip.compress(json_str.encode())
-        return {
-            'compressed': True,
-            'data': base64.b64encode(compressed).decode()
-        }
-    
-    return data
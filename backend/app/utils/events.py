@@ -0,0 +1,21 @@
+# app/utils/events.py
+"""Kinds of task events, shared by the queues that store them and the streams that send them"""
+
+# Progress events, and the fields that tell one progress line from another
+# (each test of a batch reports its own progress, and multi-task streams
+# tag events with their task)
+COALESCED_EVENTS = {
+    'plot_update': ('task_id',),
+    'test_iteration_update': ('task_id', 'test_index'),
+}
+
+def coalesce_key(message):
+    """Key of the progress line a message belongs to, or None if it's not progress
+
+    A progress event carries a full snapshot, so a later event of the same
+    line supersedes it.
+    """
+    fields = COALESCED_EVENTS.get(message.get('type'))
+    if fields is None:
+        return None
+    return (message['type'],) + tuple(message.get(field) for field in fields)
@@ -0,0 +1,118 @@
+# app/utils/serialization.py
+"""Pluggable payload codecs for Redis values
+
+Payloads written by a binary codec start with a three byte header:
+``\\x00``, the header format version and the codec id. Plain JSON (the
+``json`` codec and everything written before codecs existed) has no header,
+so old and new payloads can be read side by side during a rollout.
+"""
+import json
+import logging
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+HEADER_MAGIC = b'\x00'
+HEADER_VERSION = 1
+
+def _numpy_default(obj):
+    """Convert NumPy values the encoders don't handle natively"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f'Object of type {type(obj).__name__} is not serializable')
+
+class JsonCodec:
+    """Standard library JSON, written without a header"""
+    name = 'json'
+    codec_id = 0
+    header = False
+
+    def encode(self, value):
+        return json.dumps(value, default=_numpy_default).encode()
+
+    def decode(self, data):
+        return json.loads(data)
+
+class OrjsonCodec:
+    """orjson, with native NumPy support"""
+    name = 'orjson'
+    codec_id = 1
+    header = True
+
+    def encode(self, value):
+        return orjson.dumps(value, default=_numpy_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+    def decode(self, data):
+        return orjson.loads(data)
+
+class MsgpackCodec:
+    """MessagePack; binary, so it needs a non-decoding Redis connection"""
+    name = 'msgpack'
+    codec_id = 2
+    header = True
+
+    def encode(self, value):
+        return msgpack.packb(value, default=_numpy_default, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+CODECS = {codec.name: codec for codec in (JsonCodec(), OrjsonCodec(), MsgpackCodec())}
+CODECS_BY_ID = {codec.codec_id: codec for codec in CODECS.values()}
+AVAILABLE = {'json': True, 'orjson': orjson is not None, 'msgpack': msgpack is not None}
+
+def get_codec(name):
+    """Look up a codec by name, falling back to JSON if it isn't installed"""
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ValueError(f'Unknown codec: {name}')
+    if not AVAILABLE[name]:
+        logger.warning(f"Codec {name} is not installed, using json")
+        return CODECS['json']
+    return codec
+
+def encode_payload(value, codec_name='json'):
+    """Serialize a value with the named codec, adding the versioned header"""
+    codec = get_codec(codec_name)
+    data = codec.encode(value)
+    if codec.header:
+        return HEADER_MAGIC + bytes([HEADER_VERSION, codec.codec_id]) + data
+    return data
+
+def decode_payload(data):
+    """Deserialize a payload written by any codec (or legacy plain JSON)"""
+    if data is None:
+        return None
+    if isinstance(data, str):
+        data = data.encode()
+
+    if not data.startswith(HEADER_MAGIC):
+        # Plain JSON; orjson parses it faster but rejects NaN, which the
+        # standard library writes
+        if orjson is not None:
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                pass
+        return json.loads(data)
+
+    version, codec_id = data[1], data[2]
+    if version != HEADER_VERSION:
+        raise ValueError(f'Unsupported payload header version: {version}')
+    codec = CODECS_BY_ID.get(codec_id)
+    if codec is None or not AVAILABLE[codec.name]:
+        raise ValueError(f'Payload codec {codec_id} is not available')
+    return codec.decode(data[3:])
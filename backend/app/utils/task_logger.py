@@ -3,6 +3,7 @@
 import logging
 import time
 import functools
+from celery.exceptions import Ignore
 from typing import Any, Dict
 
 class TaskLogger:
@@ -121,6 +122,11 @@ def log_task_execution(func):
             
             return result
             
+        except Ignore:
+            # Replaced by another task (e.g. a parallel batch's chord)
+            task_logger.info("Task replaced", {'duration': f'{time.time() - start_time:.2f}s'})
+            raise
+            
         except Exception as e:
             # Log error
             duration = time.time() - start_time
@@ -23,9 +23,16 @@ def validate_calculation_params(data):
     test_params = data.get('test_params', {})
     if not isinstance(test_params, dict):
         errors.append('test_params must be a dictionary')
+    elif not _valid_seed(test_params):
+        errors.append('test_params.seed must be a non-negative integer')
     
     return errors
 
+def _valid_seed(test_params):
+    """Check the optional random seed of a calculation"""
+    seed = test_params.get('seed')
+    return seed is None or (isinstance(seed, int) and not isinstance(seed, bool) and seed >= 0)
+
 def validate_task_id(task_id):
     """Validate task ID format"""
     if not task_id:
@@ -39,6 +46,92 @@ def validate_task_id(task_id):
     )
     return bool(uuid_pattern.match(task_id))
 
+def validate_event_id(event_id):
+    """Validate SSE event ID format (Redis stream ID)"""
+    if not event_id:
+        return False
+    
+    import re
+    return bool(re.match(r'^\d+-\d+$', event_id))
+
+def validate_layout_params(args):
+    """Validate plot layout and resolution query parameters"""
+    from app.services.series import LAYOUTS, PACKED_DTYPES, DOWNSAMPLERS
+    errors = []
+    
+    layout = args.get('layout', 'points')
+    if layout not in LAYOUTS:
+        errors.append(f'layout must be one of: {", ".join(LAYOUTS)}')
+    
+    dtype = args.get('dtype', 'float64')
+    if dtype not in PACKED_DTYPES:
+        errors.append(f'dtype must be one of: {", ".join(PACKED_DTYPES)}')
+    
+    max_points = args.get('max_points')
+    if max_points is not None:
+        if not str(max_points).isdigit():
+            errors.append('max_points must be an integer')
+        elif not 10 <= int(max_points) <= 100000:
+            errors.append('max_points must be between 10 and 100000')
+    
+    downsample = args.get('downsample', 'lttb')
+    if downsample not in DOWNSAMPLERS:
+        errors.append(f'downsample must be one of: {", ".join(DOWNSAMPLERS)}')
+    
+    return errors
+
+def validate_sse_encoding(encoding):
+    """Validate the payload encoding a stream client asks for"""
+    from app.services.sse_encoding import SSE_ENCODINGS, encoding_available
+    if encoding not in SSE_ENCODINGS:
+        return [f'encoding must be one of: {", ".join(SSE_ENCODINGS)}']
+    if not encoding_available(encoding):
+        return [f'{encoding} encoding requires zstandard']
+    return []
+
+def validate_stream_tasks(task_ids, limit):
+    """Validate the tasks a multi-task stream follows"""
+    errors = [f'Invalid task id: {task_id}'
+              for task_id in task_ids if not validate_task_id(task_id)]
+    if len(task_ids) > limit:
+        errors.append(f'At most {limit} tasks per stream')
+    return errors
+
+def validate_max_rate(value):
+    """Validate the progress events per second a stream client asks for"""
+    if value is None:
+        return []
+    try:
+        rate = float(value)
+    except ValueError:
+        return ['max_rate must be a number']
+    if not 0 < rate <= 1000:
+        return ['max_rate must be greater than 0 and at most 1000']
+    return []
+
+def validate_range_params(args):
+    """Validate series range query parameters"""
+    errors = []
+    bounds = {}
+    
+    for name in ('from', 'to'):
+        value = args.get(name)
+        if value is None:
+            continue
+        try:
+            bounds[name] = float(value)
+        except ValueError:
+            errors.append(f'{name} must be a number')
+    
+    if len(bounds) == 2 and bounds['from'] > bounds['to']:
+        errors.append('from must not be greater than to')
+    
+    test_index = args.get('test_index')
+    if test_index is not None and not str(test_index).isdigit():
+        errors.append('test_index must be a non-negative integer')
+    
+    return errors
+
 def validate_batch_params(data):
     """Validate batch calculation parameters"""
     errors = []
@@ -51,6 +144,16 @@ def validate_batch_params(data):
         errors.append('batch_config must be a dictionary')
         return errors
     
+    if not isinstance(batch_config.get('parallel', False), bool):
+        errors.append('parallel must be a boolean')
+    
+    max_concurrency = batch_config.get('max_concurrency')
+    if max_concurrency is not None:
+        if not isinstance(max_concurrency, int) or isinstance(max_concurrency, bool):
+            errors.append('max_concurrency must be an integer')
+        elif not 1 <= max_concurrency <= 10:
+            errors.append('max_concurrency must be between 1 and 10')
+    
     tests = batch_config.get('tests', [])
     if not isinstance(tests, list):
         errors.append('tests must be a list')
@@ -80,5 +183,7 @@ def validate_batch_params(data):
         test_params = test.get('test_params', {})
         if not isinstance(test_params, dict):
             errors.append(f'Test {i+1}: test_params must be a dictionary')
+        elif not _valid_seed(test_params):
+            errors.append(f'Test {i+1}: test_params.seed must be a non-negative integer')
     
     return errors
@@ -0,0 +1,5 @@
+# asgi.py
+"""ASGI entry point for the async SSE streaming tier"""
+from app.streaming_asgi import create_streaming_app
+
+app = create_streaming_app()
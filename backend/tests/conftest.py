@@ -4,6 +4,8 @@ import pytest
 from app import create_app
 from app.extensions import redis_client
 import json
+import queue
+import time
 
 @pytest.fixture
 def app():
@@ -29,21 +31,36 @@ def redis_mock(monkeypatch):
     class RedisMock:
         def __init__(self):
             self.data = {}
+            self.pubsubs = []
         
-        def set(self, key, value, ex=None):
+        def set(self, key, value, ex=None, px=None, nx=False):
+            if nx and key in self.data:
+                return None
             self.data[key] = value
+            return True
         
         def get(self, key):
             return self.data.get(key)
         
+        def mget(self, keys):
+            return [self.data.get(key) for key in keys]
+        
         def delete(self, key):
             if key in self.data:
                 del self.data[key]
         
-        def rpush(self, key, value):
+        def rpush(self, key, *values):
             if key not in self.data:
                 self.data[key] = []
-            self.data[key].append(value)
+            self.data[key].extend(values)
+            return len(self.data[key])
+        
+        def lrange(self, key, start, end):
+            values = self.data.get(key, [])
+            return values[start:None if end == -1 else end + 1]
+        
+        def llen(self, key):
+            return len(self.data.get(key, []))
         
         def blpop(self, key, timeout=1):
             if key in self.data and self.data[key]:
@@ -52,7 +69,148 @@ def redis_mock(monkeypatch):
         
         def expire(self, key, seconds):
             pass
+        
+        def xadd(self, key, fields, maxlen=None, approximate=True):
+            stream = self.data.setdefault(key, [])
+            event_id = f'{int(stream[-1][0].split("-")[0]) + 1 if stream else 1}-0'
+            stream.append((event_id, fields))
+            return event_id
+        
+        def xread(self, streams, count=None, block=None):
+            response = []
+            for key, last_id in streams.items():
+                last = tuple(map(int, last_id.split('-')))
+                entries = [(event_id, fields) for event_id, fields in self.data.get(key, [])
+                           if tuple(map(int, event_id.split('-'))) > last]
+                if entries:
+                    response.append([key, entries[:count]])
+            if not response and block:
+                time.sleep(min(block, 50) / 1000)
+            return response
+        
+        def xdel(self, key, *event_ids):
+            stream = self.data.get(key, [])
+            self.data[key] = [entry for entry in stream if entry[0] not in event_ids]
+            return len(stream) - len(self.data[key])
+        
+        def xtrim(self, key, maxlen=None, approximate=True, minid=None):
+            # Mock ids aren't timestamps, so nothing ever ages out
+            return 0
+        
+        def xrevrange(self, key, max='+', min='-', count=None):
+            return list(reversed(self.data.get(key, [])))[:count]
+        
+        def unlink(self, *keys):
+            return sum(1 for key in keys if self.data.pop(key, None) is not None)
+        
+        def sadd(self, key, *members):
+            self.data.setdefault(key, set()).update(members)
+        
+        def smembers(self, key):
+            return set(self.data.get(key, set()))
+        
+        def hset(self, key, field=None, value=None, mapping=None):
+            values = self.data.setdefault(key, {})
+            if field is not None:
+                values[field] = value
+            values.update(mapping or {})
+        
+        def hsetnx(self, key, field, value):
+            values = self.data.setdefault(key, {})
+            if field in values:
+                return 0
+            values[field] = value
+            return 1
+        
+        def hgetall(self, key):
+            return dict(self.data.get(key, {}))
+        
+        def hget(self, key, field):
+            return self.data.get(key, {}).get(field)
+        
+        def hexists(self, key, field):
+            return field in self.data.get(key, {})
+        
+        def hincrby(self, key, field, amount=1):
+            values = self.data.setdefault(key, {})
+            values[field] = str(int(values.get(field, 0)) + amount)
+            return int(values[field])
+        
+        def hdel(self, key, *fields):
+            return sum(1 for field in fields if self.data.get(key, {}).pop(field, None) is not None)
+        
+        def zadd(self, key, mapping):
+            self.data.setdefault(key, {}).update(mapping)
+        
+        def zrem(self, key, *members):
+            return sum(1 for member in members if self.data.get(key, {}).pop(member, None) is not None)
+        
+        def zrangebyscore(self, key, min, max, start=None, num=None):
+            members = sorted(self.data.get(key, {}).items(), key=lambda item: item[1])
+            return [member for member, score in members if score <= float(max)][:num]
+        
+        def pipeline(self, transaction=True):
+            return PipelineMock(self)
+        
+        def register_script(self, script):
+            # Only the SSE append script is used; the mock keeps every event
+            def run(keys=(), args=(), client=None):
+                return (client or self).xadd(keys[0], {'data': args[0]})
+            return run
+        
+        def publish(self, channel, message):
+            for pubsub in self.pubsubs:
+                if channel in pubsub.channels:
+                    pubsub.messages.put({'type': 'message', 'channel': channel, 'data': message})
+        
+        def pubsub(self):
+            pubsub = PubSubMock()
+            self.pubsubs.append(pubsub)
+            return pubsub
+    
+    class PubSubMock:
+        """Deliver published messages through an in-memory queue"""
+        def __init__(self):
+            self.channels = set()
+            self.messages = queue.Queue()
+        
+        def subscribe(self, *channels):
+            for channel in channels:
+                self.channels.add(channel)
+                self.messages.put({'type': 'subscribe', 'channel': channel, 'data': 1})
+        
+        def get_message(self, timeout=0):
+            try:
+                return self.messages.get(timeout=timeout)
+            except queue.Empty:
+                return None
+        
+        def listen(self):
+            while True:
+                yield self.messages.get()
+        
+        def close(self):
+            self.channels.clear()
+    
+    class PipelineMock:
+        """Queue commands and replay them against the mock on execute"""
+        def __init__(self, redis):
+            self.redis = redis
+            self.commands = []
+        
+        def __getattr__(self, name):
+            def queue(*args, **kwargs):
+                self.commands.append((name, args, kwargs))
+                return self
+            return queue
+        
+        def execute(self):
+            results = [getattr(self.redis, name)(*args, **kwargs)
+                       for name, args, kwargs in self.commands]
+            self.commands = []
+            return results
     
     mock = RedisMock()
     monkeypatch.setattr('app.services.redis_service.redis_client', mock)
+    monkeypatch.setattr('app.services.redis_service.redis_binary_client', mock)
     return mock
@@ -40,4 +40,179 @@ def test_cancel_task(client, redis_mock):
     """Test cancelling a task"""
     task_id = 'test-task-123'
     response = client.post(f'/api/cancel/{task_id}')
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+def test_streaming_asgi_health():
+    """Test the async streaming tier answers health checks"""
+    import asyncio
+    from app.streaming_asgi import create_streaming_app
+    
+    app = create_streaming_app()
+    sent = []
+    
+    async def receive():
+        return {'type': 'http.request'}
+    
+    async def send(message):
+        sent.append(message)
+    
+    scope = {'type': 'http', 'path': '/health', 'method': 'GET', 'headers': []}
+    asyncio.run(app(scope, receive, send))
+    
+    assert sent[0]['status'] == 200
+    assert json.loads(sent[1]['body'])['status'] == 'healthy'
+
+def test_streaming_asgi_multi_task_stream(monkeypatch):
+    """Test the async tier follows several tasks and takes subscription changes"""
+    import asyncio
+    import fakeredis
+    import fakeredis.aioredis
+    from app import streaming_asgi
+    from app.utils.serialization import encode_payload
+    
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(streaming_asgi.aioredis, 'from_url',
+                        lambda url, **kwargs: fakeredis.aioredis.FakeRedis(server=server))
+    redis = fakeredis.FakeRedis(server=server)
+    first, second = ('00000000-0000-0000-0000-00000000000%d' % i for i in range(1, 3))
+    redis.xadd(f'sse_events_{first}', {'data': encode_payload({'type': 'calculation_complete'})})
+    
+    app = streaming_asgi.create_streaming_app()
+    app.config['SSE_MAX_EVENT_RATE'] = None
+    messages = []
+    
+    async def main():
+        disconnected = asyncio.Event()
+        
+        async def receive():
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+        
+        async def send(message):
+            for line in message.get('body', b'').decode().splitlines():
+                if line.startswith('data: '):
+                    messages.append(json.loads(line[len('data: '):]))
+        
+        scope = {'type': 'http', 'path': '/api/stream', 'method': 'GET', 'headers': [],
+                 'query_string': f'tasks={first}'.encode()}
+        stream = asyncio.create_task(app(scope, receive, send))
+        while len(messages) < 2:
+            await asyncio.sleep(0.05)
+        
+        # The control stream is appended through the workers' queue script
+        control = f"sse_events_stream-{messages[0]['stream_id']}"
+        assert redis.ttl(control) > 0
+        redis.xadd(control, {'data': encode_payload({'type': 'subscriptions', 'add': [second]})})
+        while len(messages) < 3:
+            await asyncio.sleep(0.05)
+        redis.xadd(f'sse_events_{second}', {'data': encode_payload({'type': 'plot_update'})})
+        while len(messages) < 4:
+            await asyncio.sleep(0.05)
+        
+        disconnected.set()
+        await asyncio.wait_for(stream, 5)
+        await app.hub.stop()
+    
+    asyncio.run(asyncio.wait_for(main(), 10))
+    assert messages[1:] == [{'type': 'calculation_complete', 'task_id': first},
+                            {'type': 'subscriptions', 'tasks': [second]},
+                            {'type': 'plot_update', 'task_id': second}]
+
+def test_multi_task_stream(app, client, redis_mock):
+    """Test one SSE connection follows several tasks and changes them in place"""
+    from app.services.redis_service import RedisService
+    
+    first, second, third = ('00000000-0000-0000-0000-00000000000%d' % i for i in range(1, 4))
+    app.config['SSE_MAX_EVENT_RATE'] = None
+    with app.app_context():
+        service = RedisService()
+        service.queue_sse_message(first, {'type': 'plot_update', 'iteration': 1})
+        service.queue_sse_message(second, {'type': 'calculation_complete'})
+    
+    response = client.get(f'/api/stream?tasks={first},{second}', buffered=False)
+    assert response.status_code == 200
+    messages = (json.loads(line[len('data: '):]) for chunk in response.response
+                for line in chunk.decode().splitlines() if line.startswith('data: '))
+    
+    connected = next(messages)
+    assert connected['tasks'] == [first, second]
+    assert (next(messages), next(messages)) == (
+        {'type': 'plot_update', 'iteration': 1, 'task_id': first},
+        {'type': 'calculation_complete', 'task_id': second}
+    )
+    
+    update = client.post(f"/api/stream/{connected['stream_id']}/subscriptions",
+                         json={'add': [third], 'remove': [first]})
+    assert update.status_code == 202
+    assert next(messages) == {'type': 'subscriptions', 'tasks': [third]}
+    
+    with app.app_context():
+        service.queue_sse_message(first, {'type': 'plot_update', 'iteration': 2})
+        service.queue_sse_message(third, {'type': 'plot_update', 'iteration': 7})
+    assert next(messages) == {'type': 'plot_update', 'iteration': 7, 'task_id': third}
+    response.close()
+    
+    assert client.get('/api/stream?tasks=not-a-task').status_code == 400
+    assert client.post(f'/api/stream/{first}/subscriptions', json={'add': [third]}).status_code == 404
+
+def test_task_stream_ends_on_error(app, client, redis_mock):
+    """Test a task stream closes after the task's error event"""
+    from app.services.redis_service import RedisService
+    
+    task_id = '00000000-0000-0000-0000-0000000000e1'
+    app.config['SSE_MAX_EVENT_RATE'] = None
+    with app.app_context():
+        service = RedisService()
+        service.queue_sse_message(task_id, {'type': 'plot_update', 'iteration': 1})
+        service.queue_sse_message(task_id, {'type': 'error', 'error': 'boom'})
+    
+    response = client.get(f'/api/stream/{task_id}')
+    messages = [json.loads(line[len('data: '):]) for line in response.data.decode().splitlines()
+                if line.startswith('data: ')]
+    assert [message['type'] for message in messages] == ['connected', 'plot_update', 'error']
+
+def test_cached_plots_keep_negotiated_encoding(app, client, redis_mock, monkeypatch):
+    """Test a large body cached for an identity request isn't served to gzip clients"""
+    import gzip
+    from app.api import results
+    from app.services.redis_service import RedisService
+    
+    # The blueprint's service was created before Redis was mocked
+    monkeypatch.setattr(results.redis_service, 'redis', redis_mock)
+    monkeypatch.setattr(results.redis_service, 'binary', redis_mock)
+    task_id = '00000000-0000-0000-0000-0000000000aa'
+    app.config['COMPRESSION_THRESHOLD'] = 100
+    with app.app_context():
+        RedisService().store_task_results(task_id, {
+            'status': 'completed',
+            'complete_plots': {'error_distribution': {'bins': [f'bin-{i}' for i in range(50)]}},
+            'content_hash': 'f' * 64
+        })
+    
+    identity = client.get(f'/api/results/{task_id}/plots', headers={'Accept-Encoding': 'identity'})
+    assert identity.status_code == 200 and 'Content-Encoding' not in identity.headers
+    
+    compressed = client.get(f'/api/results/{task_id}/plots', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == identity.data
+
+def test_result_reference_matches_default_plots(app, client, redis_mock, monkeypatch):
+    """Test a completion event's reference names what its URL serves by default"""
+    from app.api import results
+    from app.services.redis_service import RedisService
+    from app.services.series import content_hash, result_reference
+    
+    monkeypatch.setattr(results.redis_service, 'redis', redis_mock)
+    monkeypatch.setattr(results.redis_service, 'binary', redis_mock)
+    task_id = '00000000-0000-0000-0000-0000000000ab'
+    plots = {'convergence': {'x': list(range(50)), 'loss': [1 / (i + 1) for i in range(50)],
+                             'val_loss': [1 / (i + 2) for i in range(50)]}}
+    app.config['MAX_PLOT_POINTS'] = 10
+    with app.app_context():
+        RedisService().store_task_results(task_id, {'status': 'completed', 'complete_plots': plots,
+                                                    'content_hash': content_hash(plots)})
+    
+    reference = result_reference(task_id, content_hash(plots), max_points=10)
+    response = client.get(reference['url'])
+    assert response.headers['ETag'] == reference['etag']
+    assert len(response.get_json()['convergence']) <= 10
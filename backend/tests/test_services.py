@@ -2,7 +2,28 @@
 """Service layer tests"""
 import pytest
 from app.services.redis_service import RedisService
-from app.services.data_processing import DataProcessor
+from app.services.data_processing import DataProcessor, Histogram
+from app.services.broadcast_hub import BroadcastHub, GroupMember, SubscriptionGroup, control_stream_id
+from app.services.cancellation import CancellationListener
+from app.services.message_queue import MessageQueue, AckReaper
+from app.services.series import (
+    columnar_plots, apply_layout, slice_series, downsample_series, build_pyramid, select_level,
+    slice_range, content_hash, plot_params, plots_etag, result_reference
+)
+from app.services.sse_encoding import SSEEncoder, apply_merge_patch, merge_patch, train_dictionary
+from app.services.sse_pacing import EventPacer
+from app.services.sse_service import SSEService
+from app.services.sse_streams import FOLLOW, MultiTaskStream, TaskStream
+from app.services.export import encode_table, plot_csv_rows, plot_table, stream_csv
+from app.utils.compression import (
+    compress, compress_response, compress_stream, negotiate_encoding
+)
+from app.utils.serialization import encode_payload, decode_payload
+import base64
+import fakeredis
+import gzip
+import io
+import json
 import numpy as np
 
 def test_redis_service_task_metadata(app, redis_mock):
@@ -19,6 +40,334 @@ def test_redis_service_task_metadata(app, redis_mock):
         
         assert retrieved == metadata
 
+def test_redis_service_record_iteration(app, redis_mock):
+    """Test an iteration's message and progress writes share one pipeline"""
+    with app.app_context():
+        service = RedisService()
+        service.redis = redis_mock
+        
+        task_id = 'test-123'
+        service.record_iteration(
+            task_id, {'current_iteration': 1}, [{'type': 'plot_update'}]
+        )
+        
+        assert service.get_task_progress(task_id) == {'current_iteration': 1}
+        assert service.get_sse_events(task_id) == [('1-0', {'type': 'plot_update'})]
+
+def test_parallel_batch_tests_keep_their_own_progress(app, redis_mock):
+    """Test tests of a parallel batch don't overwrite each other's progress"""
+    with app.app_context():
+        service = RedisService()
+        for test_index, iteration in ((0, 3), (1, 1), (0, 4)):
+            service.record_iteration('batch-1', {'current_iteration': iteration}, test_index=test_index,
+                                     test_progress=True)
+        
+        assert service.get_batch_tests_progress('batch-1', 3) == {0: {'current_iteration': 4},
+                                                                  1: {'current_iteration': 1}}
+        assert service.get_task_progress('batch-1') is None
+
+def test_redis_service_series_persisted_per_iteration(app, redis_mock):
+    """Test that points are readable mid-run and results assemble from them"""
+    with app.app_context():
+        service = RedisService()
+        task_id = 'test-task-series'
+        
+        for i in range(3):
+            service.record_iteration(task_id, {'current_iteration': i + 1}, points={
+                'convergence': {'x': i, 'loss': 1.0 / (i + 1), 'val_loss': 2.0 / (i + 1)}
+            })
+        
+        assert service.get_series_length(task_id, 'convergence') == 3
+        assert service.get_series(task_id, 'convergence', 1, 3)['x'] == [1, 2]
+        assert service.get_partial_results(task_id)['complete_plots']['convergence']['x'] == [0, 1, 2]
+        
+        service.store_task_results(task_id, {'status': 'completed', 'complete_plots': {}})
+        results = service.get_task_results(task_id)
+        assert results['complete_plots']['convergence']['loss'] == [1.0, 0.5, 1.0 / 3]
+        assert 'accuracy' not in results['complete_plots']
+
+def test_series_pyramid_levels_answer_range_queries(app, redis_mock):
+    """Test pyramid aggregates and picking the level that fits a range"""
+    points = [{'x': i + 1, 'loss': float(i % 7), 'val_loss': 1.0} for i in range(100)]
+    levels = build_pyramid('convergence', points)
+    
+    assert [len(level['x']) for level in levels] == [25, 7, 2]
+    assert levels[0]['x'][:2] == [1, 5] and levels[0]['x_end'][0] == 4
+    assert levels[0]['loss_min'][1] == 0.0 and levels[0]['loss_max'][1] == 6.0
+    assert levels[0]['loss_mean'][0] == 1.5
+    assert levels[2]['count'] == [64, 36]
+    
+    with app.app_context():
+        service = RedisService()
+        service.store_series_pyramids('task-lod', {'convergence': points})
+        meta = service.get_series_pyramid_meta('task-lod', 'convergence')
+        
+        assert meta['factors'] == [4, 16, 64]
+        assert select_level(meta, 1, 100, 1000) == 0
+        assert select_level(meta, 1, 100, 30) == 1
+        assert select_level(meta, 41, 50, 30) == 0
+        
+        level = service.get_series_pyramid_level('task-lod', 'convergence', 2)
+        assert slice_range(level, 20, 40)['x'] == [17, 33]
+
+def test_csv_export_streams_series_in_chunks(app, redis_mock):
+    """Test CSV rows are produced chunk by chunk and gzipped on the fly"""
+    with app.app_context():
+        service = RedisService()
+        for i in range(5):
+            service.record_iteration('task-csv', {}, points={
+                'convergence': {'x': i + 1, 'loss': float(i), 'val_loss': 1.0}
+            })
+        
+        chunks = list(service.iter_series('task-csv', 'convergence', chunk_size=2))
+        assert [chunk['x'] for chunk in chunks] == [[1, 2], [3, 4], [5]]
+        
+        rows = plot_csv_rows(lambda name: service.iter_series('task-csv', name, chunk_size=2), 'Test 1')
+        text = ''.join(stream_csv(rows, rows_per_chunk=3))
+        gzipped = b''.join(compress_stream(stream_csv(iter([['a', 1]] * 1000)), 'gzip'))
+    
+    lines = text.splitlines()
+    assert lines[:3] == ['##### Test 1 #####', '=== Convergence Data ===', 'Iteration,Loss,Validation Loss']
+    assert lines[3:8] == [f'{i + 1},{float(i)},1.0' for i in range(5)]
+    assert gzip.decompress(gzipped) == b'a,1\r\n' * 1000
+
+def test_plot_table_concatenates_runs():
+    """Test runs are tagged and padded into one table that survives NPZ"""
+    convergence = {'x': [1, 2], 'loss': [0.5, 0.25], 'val_loss': [0.6, 0.3]}
+    performance = [{'time': 1, 'throughput': 10.0, 'memory': 1.0, 'cpu': 5.0}]
+    table = plot_table([
+        ('task-a', -1, {'convergence': convergence, 'performance': performance}),
+        ('task-b', 0, {'convergence': convergence, 'accuracy': {'x': [], 'accuracy': [],
+                                                                'precision': [], 'recall': []}})
+    ])
+    
+    assert table['task_id'].tolist() == ['task-a'] * 3 + ['task-b'] * 2
+    assert table['series'].tolist()[1:3] == ['convergence', 'performance']
+    assert table['x'].tolist() == [1, 2, 1, 1, 2]
+    assert table['throughput'][2] == 10.0 and np.isnan(table['loss'][2])
+    
+    loaded = np.load(io.BytesIO(encode_table(table, 'npz')))
+    assert loaded['test_index'].tolist() == [-1, -1, -1, 0, 0]
+    assert np.array_equal(loaded['loss'], table['loss'], equal_nan=True)
+
+def test_plot_table_arrow_uses_nulls():
+    """Test Arrow export marks missing fields and test indexes as null"""
+    pyarrow = pytest.importorskip('pyarrow')
+    table = plot_table([('task-a', -1, {'convergence': {'x': [1], 'loss': [0.5], 'val_loss': [0.6]}})])
+    
+    arrow_table = pyarrow.ipc.open_file(pyarrow.BufferReader(encode_table(table, 'arrow'))).read_all()
+    assert arrow_table.column('test_index').null_count == 1
+    assert arrow_table.column('accuracy').null_count == 1
+    assert arrow_table.column('series').to_pylist() == ['convergence']
+
+def test_compressed_responses_are_negotiated_and_cached(app, redis_mock):
+    """Test Accept-Encoding negotiation and the completed-result cache"""
+    from werkzeug.http import parse_accept_header
+    
+    accept = parse_accept_header('gzip;q=0.5, br;q=0, deflate')
+    assert negotiate_encoding(accept) == 'gzip'
+    assert negotiate_encoding(parse_accept_header('identity')) is None
+    
+    with app.app_context():
+        body = b'{"x": [1, 2, 3]}' * 100
+        assert gzip.decompress(compress(body, 'gzip')) == body
+        assert gzip.decompress(b''.join(compress_stream([body[:7], body[7:]], 'gzip'))) == body
+        
+        service = RedisService()
+        service.cache_response('task-cache', 'points', None, b'{}')
+        assert service.get_cached_response('task-cache', 'points', 'gzip') == (None, b'{}')
+        service.cache_response('task-cache', 'points', 'gzip', b'gz')
+        assert service.get_cached_response('task-cache', 'points', 'gzip') == ('gzip', b'gz')
+        assert service.get_cached_response('task-cache', 'columnar', 'gzip') is None
+        
+        # A built body is compressed once, with its length known up front
+        app.config['COMPRESSION_THRESHOLD'] = 100
+        response = compress_response({'x': list(range(100))}, encoding='gzip')
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.content_length == len(response.get_data())
+        assert json.loads(gzip.decompress(response.get_data())) == {'x': list(range(100))}
+        assert 'Content-Encoding' not in compress_response({'x': 1}, encoding='gzip').headers
+
+def test_result_references_identify_plots():
+    """Test completion events refer to plots by content hash and ETag"""
+    plots = {'convergence': {'x': [1, 2], 'loss': [0.5, 0.25], 'val_loss': [0.6, 0.3]}}
+    plots_hash = content_hash(plots)
+    assert plots_hash == content_hash({'convergence': dict(plots['convergence'])})
+    assert plots_hash != content_hash({'convergence': {**plots['convergence'], 'loss': [0.5, 0.2]}})
+    
+    reference = result_reference('task-ref', plots_hash, test_index=1, max_points=500)
+    assert reference['url'] == f'/api/results/task-ref/plots?test_index=1&v={plots_hash[:16]}'
+    assert reference['etag'] == f'W/"{plots_etag(plots_hash, plot_params({}, 500))}"'
+    assert plots_etag(plots_hash, plot_params({'layout': 'columnar'})) != plots_etag(plots_hash, plot_params({}))
+
+def test_redis_service_sse_events_replay(app, redis_mock):
+    """Test SSE events can be replayed from any event id"""
+    with app.app_context():
+        service = RedisService()
+        service.redis = redis_mock
+        
+        task_id = 'test-123'
+        first_id = service.queue_sse_message(task_id, {'type': 'plot_update', 'iteration': 1})
+        service.queue_sse_message(task_id, {'type': 'plot_update', 'iteration': 2})
+        
+        # Reading does not consume events
+        assert len(service.get_sse_events(task_id)) == 2
+        assert len(service.get_sse_events(task_id)) == 2
+        
+        # Resuming returns only newer events
+        resumed = service.get_sse_events(task_id, first_id)
+        assert [message['iteration'] for _, message in resumed] == [2]
+
+def test_broadcast_hub_fans_out_to_all_subscribers(app, redis_mock):
+    """Test every client watching a task receives every event"""
+    with app.app_context():
+        service = RedisService()
+        task_id = 'test-123'
+        service.queue_sse_message(task_id, {'type': 'plot_update', 'iteration': 1})
+        
+        hub = BroadcastHub()
+        first = hub.subscribe(app, task_id)
+        second = hub.subscribe(app, task_id)
+        assert hub.subscriber_count(task_id) == 2
+        
+        # Both replay history, then both see live events
+        assert len(first.replay(service)) == 1
+        assert len(second.replay(service)) == 1
+        service.queue_sse_message(task_id, {'type': 'plot_update', 'iteration': 2})
+        
+        for subscription in (first, second):
+            events = subscription.get_events(timeout=2)
+            assert [message['iteration'] for _, message in events] == [2]
+            hub.unsubscribe(subscription)
+        
+        assert hub.subscriber_count(task_id) == 0
+
+def test_cancellation_is_pushed_to_watchers(app, redis_mock):
+    """Test a published cancel reaches a watching task without polling"""
+    with app.app_context():
+        listener = CancellationListener()
+        cancelled = listener.watch('test-123')
+        assert not listener.is_cancelled('test-123')
+        
+        RedisService().mark_tasks_cancelled(['test-123', 'test-456'])
+        
+        assert cancelled.wait(timeout=2)
+        assert listener.is_cancelled('test-123')
+        
+        # Tasks that start watching after the cancel see the marker
+        assert listener.watch('test-456').is_set()
+
+def test_cancellation_listener_gives_up_on_unconfirmed_subscription(app, redis_mock, monkeypatch):
+    """Test watching fails instead of hanging when Redis never confirms the subscription"""
+    monkeypatch.setattr(type(redis_mock.pubsub()), 'get_message', lambda self, timeout=0: None)
+    with app.app_context():
+        listener = CancellationListener()
+        listener.SUBSCRIBE_TIMEOUT = 0.1
+        with pytest.raises(ConnectionError):
+            listener.watch('test-123')
+        assert listener._thread is None
+
+def test_message_queue_tracks_acks_without_blocking(app, redis_mock, monkeypatch):
+    """Test acknowledged sends return at once and are redelivered by the reaper"""
+    monkeypatch.setattr('app.services.message_queue.ack_reaper.ensure_started', lambda app: None)
+    with app.app_context():
+        queue = MessageQueue()
+        service = queue.redis_service
+        task_id = 'test-123'
+        
+        message_id = queue.send_with_ack(task_id, {'type': 'test_completed'}, timeout=-1)
+        assert service.get_pending_ack(task_id, message_id)['deliveries'] == 1
+        
+        # Overdue: redelivered once, then dropped after max deliveries
+        reaper = AckReaper()
+        reaper.reap(service, queue.sse_service, max_deliveries=2)
+        assert len(service.get_sse_events(task_id)) == 2
+        assert service.get_pending_ack(task_id, message_id)['deliveries'] == 2
+        
+        service.store_message_ack(task_id, message_id)
+        assert service.get_pending_ack(task_id, message_id) is None
+        reaper.reap(service, queue.sse_service, max_deliveries=2)
+        assert len(service.get_sse_events(task_id)) == 2
+
+def test_redis_service_batch_state_updates_in_place(app, redis_mock):
+    """Test batch counters and per-test results without rewriting the batch"""
+    with app.app_context():
+        service = RedisService()
+        task_id = 'test-task-batch'
+        
+        service.init_batch_state(task_id, {'total_tests': 3, 'completed_tests': 0, 'status': 'running'})
+        service.update_batch_state(task_id, current_test_index=2)
+        assert service.store_batch_test_result(task_id, 2, {'test_index': 2}) == 1
+        assert service.store_batch_test_result(task_id, 0, {'test_index': 0}) == 2
+        
+        state = service.get_batch_state(task_id)
+        assert state == {'total_tests': 3, 'completed_tests': 2, 'status': 'running',
+                         'current_test_index': 2}
+        assert [r['test_index'] for r in service.get_batch_test_results(task_id, 3)] == [0, 2]
+
+def test_message_queue_releases_batch_updates_in_order(app, redis_mock):
+    """Test that updates staged out of order are sent by position"""
+    with app.app_context():
+        message_queue = MessageQueue()
+        service = RedisService()
+        task_id = 'test-task-ordered'
+        
+        for position in (2, 0, 1):
+            message_queue.send_batch_update_in_order(task_id, position, 'progress_note',
+                                                     test_index=position)
+        
+        events = service.get_sse_events(task_id, timeout=None)
+        assert [message['test_index'] for _, message in events] == [0, 1, 2]
+        assert not service.has_ready_ordered_message(task_id)
+
+def test_redis_service_cleanup_uses_key_registry(app, redis_mock):
+    """Test cleanup unlinks every key the task wrote and nothing else"""
+    with app.app_context():
+        service = RedisService()
+        task_id = 'test-123'
+        
+        service.store_task_metadata(task_id, {'status': 'running'})
+        service.record_iteration(task_id, {'current_iteration': 1}, [{'type': 'plot_update'}])
+        service.store_message_ack(task_id, 'message-1')
+        service.store_task_metadata('other-task', {'status': 'running'})
+        
+        assert service.get_message_ack(task_id, 'message-1')
+        assert f'acks_{task_id}' in redis_mock.smembers(f'task_keys_{task_id}')
+        
+        service.cleanup_task(task_id)
+        
+        assert not [key for key in redis_mock.data if task_id in key]
+        assert service.get_task_metadata('other-task') == {'status': 'running'}
+
+@pytest.mark.parametrize('codec', ['json', 'orjson', 'msgpack'])
+def test_payload_codecs_round_trip_numpy_values(codec):
+    """Test every codec encodes NumPy values and decodes to plain Python"""
+    value = {'loss': np.float64(1.5), 'count': np.int64(3), 'points': np.arange(3)}
+    
+    assert decode_payload(encode_payload(value, codec)) == {
+        'loss': 1.5, 'count': 3, 'points': [0, 1, 2]
+    }
+
+def test_payload_codecs_read_legacy_json():
+    """Test headerless JSON written before codecs existed still decodes"""
+    assert decode_payload('{"status": "running"}') == {'status': 'running'}
+    assert encode_payload({'a': 1}, 'msgpack').startswith(b'\x00')
+
+def test_series_layouts_round_trip():
+    """Test columnar storage and the layouts served at the API edge"""
+    points = [{'x': i, 'loss': 1.0 / (i + 1), 'val_loss': 2.0 / (i + 1)} for i in range(5)]
+    stored = columnar_plots({'convergence': points, 'metadata': {'test_id': 't'}})
+    
+    assert stored['convergence']['x'] == [0, 1, 2, 3, 4]
+    assert stored['metadata'] == {'test_id': 't'}
+    assert apply_layout(stored, 'points')['convergence'] == points
+    assert slice_series(stored['convergence'], 1, 3)['x'] == [1, 2]
+    
+    packed = apply_layout(stored, 'packed', 'float32')['convergence']
+    assert packed['length'] == 5
+    loss = np.frombuffer(base64.b64decode(packed['fields']['loss']), dtype='<f4')
+    assert np.allclose(loss, stored['convergence']['loss'])
+
 def test_data_processor_histogram():
     """Test histogram creation"""
     data = [1, 2, 2, 3, 3, 3, 4, 4, 5]
@@ -28,6 +377,44 @@ def test_data_processor_histogram():
     assert all('count' in bin for bin in bins)
     assert sum(bin['count'] for bin in bins) == len(data)
 
+def test_data_processor_statistics_are_json_safe():
+    """Test statistics come back as plain floats"""
+    stats = DataProcessor.calculate_statistics(np.array([1, 2, 3, 4, 5]))
+    
+    assert all(type(value) is float for value in stats.values())
+    assert stats['q1'] == 2 and stats['q3'] == 4
+
+def test_histograms_merge_without_raw_samples():
+    """Test merged histograms match one built from all samples"""
+    rng = np.random.default_rng(0)
+    first, second = rng.normal(0, 1, 500), rng.normal(3, 0.5, 300)
+    
+    merged = Histogram.from_values(first, 0.25).merge(
+        Histogram.from_dict(Histogram.from_values(second, 0.25).to_dict())
+    )
+    combined = Histogram.from_values(np.concatenate([first, second]), 0.25)
+    
+    assert merged.to_bins() == combined.to_bins()
+    assert sum(b['count'] for b in merged.to_bins()) == 800
+    assert merged.statistics()['max'] == combined.statistics()['max']
+    assert abs(merged.statistics()['std'] - combined.statistics()['std']) < 1e-9
+
+def test_histogram_bins_are_sized_from_the_data():
+    """Test bin widths follow the data, stay mergeable and get distinct labels"""
+    rng = np.random.default_rng(1)
+    narrow, wide = rng.normal(0, 0.001, 500), rng.normal(0, 1, 3)
+    
+    for values in (narrow, wide):
+        bins = Histogram.from_values(values).to_bins()
+        assert len(bins) <= Histogram.MAX_BINS
+        assert len({b['range'] for b in bins}) == len(bins)
+    assert len(Histogram.from_values(narrow).to_bins()) >= 10
+    
+    merged = Histogram.from_values(narrow).merge(Histogram.from_values(wide))
+    assert merged.bin_width == Histogram.from_values(wide).bin_width
+    combined = Histogram.from_values(np.concatenate([narrow, wide]), merged.bin_width)
+    assert merged.to_bins() == combined.to_bins()
+
 def test_data_processor_decimation():
     """Test data decimation"""
     data = list(range(1000))
@@ -37,6 +424,22 @@ def test_data_processor_decimation():
     assert decimated[0] == 0
     assert decimated[-1] in data
 
+def test_lttb_and_minmax_keep_spikes():
+    """Test shape-preserving downsamplers keep outliers and endpoints"""
+    x = np.arange(1000)
+    y = np.sin(x / 50.0)
+    y[437] = 25.0
+    
+    for indices in (DataProcessor.lttb_indices(x, y, 100), DataProcessor.minmax_indices(y, 100)):
+        assert len(indices) <= 100
+        assert 437 in indices
+    assert DataProcessor.lttb_indices(x, y, 100)[[0, -1]].tolist() == [0, 999]
+    
+    series = {'x': x.tolist(), 'loss': y.tolist(), 'val_loss': (-y).tolist()}
+    reduced = downsample_series('convergence', series, 100)
+    assert len(reduced['x']) <= 100
+    assert 25.0 in reduced['loss'] and -25.0 in reduced['val_loss']
+
 def test_data_processor_statistics():
     """Test statistics calculation"""
     data = [1, 2, 3, 4, 5]
@@ -46,4 +449,147 @@ def test_data_processor_statistics():
     assert stats['min'] == 1
     assert stats['max'] == 5
     assert 'std' in stats
-    assert 'median' in stats
\ No newline at end of file
+    assert 'median' in stats
+
+def test_merge_patch_round_trip():
+    """Test SSE deltas rebuild the message, and fall back when they can't"""
+    previous = {'type': 'plot_update', 'iteration': 1, 'progress': 0, 'state': {'status': 'running', 'step': 1}}
+    current = {'type': 'plot_update', 'iteration': 2, 'progress': 1.0, 'state': {'status': 'running'}}
+    
+    patch = merge_patch(previous, current)
+    assert patch == {'iteration': 2, 'progress': 1.0, 'state': {'step': None}}
+    assert apply_merge_patch(previous, patch) == current
+    assert merge_patch(previous, {**current, 'error': None}) is None
+    
+    encoder = SSEEncoder('delta')
+    messages = [{'type': 'plot_update', 'iteration': i, 'total_iterations': 100, 'progress': i}
+                for i in range(1, 51)]
+    rebuilt, last = [], {}
+    for message in messages:
+        payload = json.loads(encoder.encode(message))
+        if '$delta' in payload:
+            payload = apply_merge_patch(last[payload['type']], payload['$delta'])
+        last[payload['type']] = payload
+        rebuilt.append(payload)
+    assert rebuilt == messages
+    assert encoder.stats()['sent_bytes_per_event'] < encoder.stats()['raw_bytes_per_event']
+
+def test_zstd_sse_encoding_with_dictionary():
+    """Test dictionary-compressed SSE payloads decode and beat plain JSON"""
+    zstandard = pytest.importorskip('zstandard')
+    dictionary = train_dictionary()
+    messages = [{'type': 'test_iteration_update', 'task_id': 'abc', 'test_index': 0,
+                 'iteration': i, 'total_iterations': 100, 'test_progress': i} for i in range(1, 51)]
+    
+    encoders = {encoding: SSEEncoder(encoding, dictionary) for encoding in ('json', 'zstd', 'delta+zstd')}
+    for encoding, encoder in encoders.items():
+        for message in messages:
+            data = encoder.encode(message)
+        if encoding == 'zstd':
+            decompressor = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(dictionary))
+            assert json.loads(decompressor.decompress(base64.b64decode(data))) == messages[-1]
+    
+    sent = {encoding: encoder.stats()['sent_bytes_per_event'] for encoding, encoder in encoders.items()}
+    assert sent['delta+zstd'] < sent['zstd'] < sent['json']
+
+def test_event_pacer_coalesces_progress():
+    """Test paced streams merge pending progress and never hold back other events"""
+    pacer = EventPacer(max_rate=2, burst=1)
+    progress = [(f'{i}-0', {'type': 'plot_update', 'iteration': i}) for i in range(1, 11)]
+    
+    assert pacer.push(progress[:1], now=0) == progress[:1]
+    assert pacer.push(progress[1:5], now=0.1) == []
+    assert pacer.wait_time(1, now=0.1) == pytest.approx(0.4)
+    assert pacer.due(now=0.6) == [progress[4]]
+    
+    tests = [(f'{i}-1', {'type': 'test_iteration_update', 'test_index': i % 2, 'iteration': i})
+             for i in range(5, 11)]
+    complete = ('11-0', {'type': 'calculation_complete'})
+    assert pacer.push(tests + [complete], now=0.7) == [tests[-2], tests[-1], complete]
+    assert pacer.coalesced == 7
+    assert pacer.pending == {}
+    
+    unlimited = EventPacer(max_rate=None)
+    assert unlimited.push(progress, now=0) == [progress[-1]]
+
+def test_sse_streams_select_and_frame_events():
+    """Test the tier-independent stream logic picks, tags and ends on the right events"""
+    sse_service = SSEService()
+    config = {'SSE_MAX_STREAM_TASKS': 2}
+    
+    single = TaskStream(sse_service, SSEEncoder('json'), EventPacer(), {}, config)
+    frames = single.frames([('1-0', {'type': 'plot_update'}), ('2-0', {'type': 'error', 'error': 'boom'}),
+                            ('3-0', {'type': 'plot_update'})])
+    assert frames == ['id: 1-0\ndata: {"type": "plot_update"}\n\n',
+                      'id: 2-0\ndata: {"type": "error", "error": "boom"}\n\n']
+    assert single.closed
+    
+    group = SubscriptionGroup(10)
+    group.members = {task_id: GroupMember(group, task_id, '0-0') for task_id in ('a', 'b')}
+    multi = MultiTaskStream(sse_service, SSEEncoder('json'), EventPacer(), {}, config, 's', group,
+                            lambda member: group.members.pop(member.task_id))
+    outgoing = multi.select([
+        ('a', '1-0', {'type': 'plot_update'}),
+        (control_stream_id('s'), '1-0', {'type': 'subscriptions', 'add': ['c'], 'remove': ['a']}),
+        ('a', '2-0', {'type': 'plot_update'}),
+        ('b', '1-0', {'type': 'batch_error'}),
+    ])
+    assert [entry[:2] for entry in outgoing] == [('a', '1-0'), ('c', FOLLOW), (None, None), ('b', '1-0')]
+    
+    group.members['c'] = GroupMember(group, 'c', '0-0')  # What the tier's follow does
+    messages = [json.loads(frame[len('data: '):]) for frame in multi.frames([outgoing[0]] + outgoing[2:])]
+    assert messages == [{'type': 'plot_update', 'task_id': 'a'}, {'type': 'subscriptions', 'tasks': ['b', 'c']},
+                        {'type': 'batch_error', 'task_id': 'b'}]
+    assert multi.followed() == ['c'] and not multi.closed
+
+@pytest.mark.parametrize('policy, kept', [
+    ('keep_terminal', ['test_started', 'test_iteration_update', 'test_iteration_update', 'test_completed']),
+    ('latest_progress', ['test_started', 'test_iteration_update', 'test_completed']),
+])
+def test_sse_queue_policies_bound_progress(app, monkeypatch, policy, kept):
+    """Test task event streams keep their progress bounded and every other event"""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr('app.services.redis_service.redis_client',
+                        fakeredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr('app.services.redis_service.redis_binary_client', fakeredis.FakeRedis(server=server))
+    app.config.update(SSE_QUEUE_POLICY=policy, SSE_STREAM_MAXLEN=2)
+    with app.app_context():
+        service = RedisService()
+        # A second worker shares the bound through Redis
+        other = RedisService()
+        service.queue_sse_message('task-1', {'type': 'test_started'})
+        for i in range(1, 6):
+            worker = service if i % 2 else other
+            worker.record_iteration('task-1', {}, [{'type': 'test_iteration_update', 'test_index': 0,
+                                                    'iteration': i}])
+        service.queue_sse_message('task-1', {'type': 'test_completed'})
+        
+        events = service.get_sse_events('task-1')
+        assert [message['type'] for _, message in events] == kept
+        assert events[-2][1]['iteration'] == 5
+        assert service.get_sse_queue_stats() == {'dropped': 7 - len(kept), 'expired': 0}
+
+def test_final_results_give_task_keys_one_expiry(app, monkeypatch):
+    """Test a task's data expires with its results, apart from its SSE queue"""
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    monkeypatch.setattr('app.services.redis_service.redis_client', client)
+    monkeypatch.setattr('app.services.redis_service.redis_binary_client', fakeredis.FakeRedis(server=server))
+    app.config.update(RESULT_EXPIRY_SECONDS=7200, SSE_REDIS_QUEUE_TTL=60)
+    with app.app_context():
+        service = RedisService()
+        service.record_iteration('task-ttl', {'status': 'running'}, [{'type': 'plot_update'}],
+                                 points={'convergence': {'x': 1, 'loss': 0.5, 'val_loss': 0.6}})
+        service.init_batch_state('task-ttl', {'status': 'running'})
+        # Keys written early in a long run are close to expiring
+        series = service.series_key('task-ttl', 'convergence')
+        state = service.batch_state_key('task-ttl')
+        client.expire(series, 10)
+        client.expire(state, 10)
+        
+        service.update_batch_state('task-ttl', status='completed')
+        assert client.ttl(state) > 7000
+        service.store_task_results('task-ttl', {'status': 'completed'})
+        assert client.ttl(series) > 7000 and client.ttl('results_task-ttl') > 7000
+        assert client.ttl(service.sse_events_key('task-ttl')) <= 60
+        assert state in client.smembers('task_keys_task-ttl')
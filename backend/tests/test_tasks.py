@@ -3,6 +3,8 @@
 import pytest
 from app.tasks.calculations import long_calculation_task
 from app.tasks.plot_generators import PlotDataGenerator
+from app.services.series import columnar_plots, plot_buffers
+import numpy as np
 
 def test_plot_data_generator():
     """Test plot data generation"""
@@ -32,4 +34,119 @@ def test_final_metrics_calculation():
     
     assert metrics['final_loss'] == 10
     assert metrics['final_accuracy'] == 90
-    assert metrics['avg_throughput'] == 1000
\ No newline at end of file
+    assert metrics['avg_throughput'] == 1000
+
+def test_plot_generator_blocks_are_seeded_and_vectorized():
+    """Test block generation, lockstep tests and lazy error distributions"""
+    run = PlotDataGenerator(seed=7).generate_run(20)
+    again = PlotDataGenerator(seed=7).generate_run(20)
+    
+    assert len(run) == 20
+    assert np.array_equal(run.series['convergence']['loss'], again.series['convergence']['loss'])
+    assert run.point('accuracy', 4)['x'] == 5
+    assert max(run.series['performance']['cpu']) <= 100
+    
+    lockstep = PlotDataGenerator(seed=7).generate_tests(3, 20)
+    assert lockstep.series['convergence']['loss'].shape == (3, 20)
+    assert lockstep.point('convergence', 0, test=2)['x'] == 1
+    
+    generator = PlotDataGenerator(seed=7)
+    final = generator.error_distribution(19, 20)
+    assert len(final['data']) == 500
+    assert final == generator.error_distribution(19, 20)
+
+def test_series_buffers_collect_points_and_final_metrics():
+    """Test preallocated collectors and metrics computed on them"""
+    buffers = plot_buffers(10)
+    run = PlotDataGenerator(seed=3).generate_run(10)
+    for i in range(4):
+        for name, point in run.points(i).items():
+            buffers[name].append(point)
+    
+    performance = buffers['performance']
+    assert len(performance) == 4
+    assert performance[-1]['time'] == 4
+    assert performance[1].to_dict() == run.point('performance', 1)
+    assert columnar_plots(buffers)['convergence']['x'] == [1, 2, 3, 4]
+    
+    metrics = PlotDataGenerator().calculate_final_metrics(
+        buffers['convergence'], buffers['accuracy'], performance
+    )
+    assert metrics['final_loss'] == run.point('convergence', 3)['loss']
+    assert metrics['peak_cpu'] == max(run.series['performance']['cpu'][:4])
+    assert isinstance(metrics['avg_throughput'], float)
+
+def test_batch_tests_get_their_own_error_distribution(app, redis_mock):
+    """Test tests of one batch sharing a generator don't share an error distribution"""
+    import threading
+    from app.services.message_queue import MessageQueue
+    from app.services.redis_service import RedisService
+    from app.tasks.batch_calculations import run_single_calculation
+    from app.utils.task_logger import TaskLogger
+    
+    cancelled = threading.Event()
+    cancelled.wait = lambda timeout=None: False  # Skip the simulated compute time
+    with app.app_context():
+        generator = PlotDataGenerator(seed=11)
+        results = [run_single_calculation('batch-1', test_index, {'num_iterations': 3}, RedisService(),
+                                          MessageQueue(), generator, TaskLogger('batch-1', 'batch'), cancelled)
+                   for test_index in range(2)]
+    
+    first, second = (result['complete_plots']['error_distribution'] for result in results)
+    assert first['data'] != second['data']
+
+def test_parallel_batch_failure_stops_the_other_tests(app, redis_mock, monkeypatch):
+    """Test a failing test ends a parallel batch with nothing sent after its error"""
+    from app.services.cancellation import CancellationListener
+    from app.services.redis_service import RedisService
+    from app.tasks import batch_calculations
+    
+    monkeypatch.setattr(batch_calculations, 'cancellation_listener', CancellationListener())
+    monkeypatch.setattr('app.services.message_queue.ack_reaper.ensure_started', lambda app: None)
+    monkeypatch.setattr(batch_calculations.np.random, 'uniform', lambda low, high: 0)
+    batch_id = 'batch-1'
+    tests = [{'num_iterations': 'not-a-number'}] + [{'num_iterations': 2}] * 3
+    
+    with app.app_context():
+        service = RedisService()
+        service.init_batch_state(batch_id, {'total_tests': 4, 'completed_tests': 0, 'status': 'running'})
+        
+        def run(test_index):
+            return batch_calculations.batch_test_task.apply(
+                args=(batch_id, test_index, tests[test_index], 4))
+        
+        # Tests 1 and 2 finish first; their completions wait for test 0
+        assert all(run(test_index).successful() for test_index in (1, 2))
+        assert run(0).failed()
+        # Test 3 was still queued in another lane
+        stopped = run(3)
+        assert stopped.failed() and str(stopped.result) == 'Batch cancelled'
+        
+        types = [message['type'] for _, message in service.get_sse_events(batch_id)]
+        assert types[-1] == 'batch_error'
+        assert types.count('batch_error') == 1 and 'test_completed' not in types
+        assert 'ordered_batch-1' not in redis_mock.data
+        assert service.get_batch_state(batch_id)['status'] == 'failed'
+
+def test_parallel_batch_reports_wall_time(app, redis_mock, monkeypatch):
+    """Test a parallel batch's total duration is its wall time, not the sum of its tests"""
+    import time
+    from app.services.cancellation import CancellationListener
+    from app.services.redis_service import RedisService
+    from app.tasks import batch_calculations
+    
+    monkeypatch.setattr(batch_calculations, 'cancellation_listener', CancellationListener())
+    monkeypatch.setattr('app.services.message_queue.ack_reaper.ensure_started', lambda app: None)
+    monkeypatch.setattr(batch_calculations.np.random, 'uniform', lambda low, high: 0)
+    batch_id = 'batch-2'
+    
+    with app.app_context():
+        RedisService().init_batch_state(batch_id, {'total_tests': 2, 'completed_tests': 0, 'status': 'running',
+                                                   'parallel': True, 'started_at': time.time() - 5})
+        for test_index in range(2):
+            batch_calculations.batch_test_task.apply(args=(batch_id, test_index, {'num_iterations': 2}, 2))
+        results = batch_calculations.finalize_batch_task.apply(args=(batch_id, 2)).get()
+    
+    timing = results['timing_stats']
+    assert 5 <= timing['total_duration'] < 6
+    assert timing['avg_test_duration'] < 1
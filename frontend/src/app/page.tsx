@@ -28,6 +28,7 @@ import { usePlotData } from "@/src/hooks/usePlotData";
 import { useSSE } from "@/src/hooks/useSSE";
 import { AcknowledgmentMonitor } from "@/src/components/AcknowledgmentMonitor";
 import { DEV_CONFIG } from "@/src/utils/constants";
+import apiService from "@/src/services/api";
 
 // Define the possible message types for batch operations
 type SSEMessage =
@@ -42,6 +43,7 @@ type SSEMessage =
       type: "calculation_complete";
       task_id: string;
       summary: any;
+      result?: { url: string; etag: string; content_hash: string };
       complete_plots?: any;
     }
   | {
@@ -178,7 +180,13 @@ function DashboardContent() {
       case "calculation_complete":
         completeCalculation(lastMessage.summary);
         setFinalStats(lastMessage.summary);
-        if (lastMessage.complete_plots) {
+        if (lastMessage.result) {
+          // The event only refers to the plots; fetch them over HTTP
+          apiService
+            .getResultPlots(lastMessage.result)
+            .then(setCompletePlotData)
+            .catch((err) => console.error("Failed to fetch plots:", err));
+        } else if (lastMessage.complete_plots) {
           setCompletePlotData(lastMessage.complete_plots);
         }
         break;
@@ -203,13 +211,24 @@ function DashboardContent() {
         });
         break;
 
-      case "test_completed":
-        addTestResult(lastMessage.test_result);
+      case "test_completed": {
+        const testResult = lastMessage.test_result;
+        addTestResult(testResult);
+        if (testResult.result) {
+          // Fill in the test's plots once fetched (replaces the entry)
+          apiService
+            .getResultPlots(testResult.result)
+            .then((plots) =>
+              addTestResult({ ...testResult, complete_plots: plots })
+            )
+            .catch((err) => console.error("Failed to fetch test plots:", err));
+        }
         updateBatchProgress({
           batch_progress: lastMessage.batch_progress,
           completed_tests: lastMessage.test_index + 1,
         });
         break;
+      }
 
       case "batch_completed":
         completeCalculation(lastMessage.batch_summary);
@@ -7,6 +7,8 @@ const API_BASE = process.env.REACT_APP_API_URL || "http://localhost:5000/api";
 class APIService {
   constructor() {
     this.API_BASE = API_BASE;
+    // Complete plots already fetched, keyed by the ETag of their reference
+    this.resultPlots = new Map();
   }
 
   /**
@@ -122,6 +124,28 @@ class APIService {
     return response.blob();
   }
 
+  /**
+   * Get the complete plots a completion event refers to
+   * (reused if a reference with the same ETag was already fetched)
+   */
+  async getResultPlots(reference) {
+    if (this.resultPlots.has(reference.etag)) {
+      return this.resultPlots.get(reference.etag);
+    }
+
+    const response = await fetch(
+      `${API_BASE.replace("/api", "")}${reference.url}`
+    );
+
+    if (!response.ok) {
+      throw new Error(`API error: ${response.status}`);
+    }
+
+    const plots = await response.json();
+    this.resultPlots.set(reference.etag, plots);
+    return plots;
+  }
+
   /**
    * Get plot snapshot
    */